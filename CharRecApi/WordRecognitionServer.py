@@ -1,18 +1,305 @@
 #!/usr/bin/env python
 #  -*- coding: utf-8 -*-
 
+import concurrent.futures
+import functools
 import json
-import time
+import os
 
 import flask
 import flask_restful
 from app import app, api
 
+import batching
+import dictionary
+import image_disp
 import image_proc
+import metrics
 import model
 
 DEBUG = False
 
+# Batch schedulers of models by language (empty if requests are not batched together)
+schedulers = dict()
+
+# Predictors converting lists of images to lists of words, by language (model.LazyPredictors once server is started)
+words_predictors = dict()
+
+
+# Decoders of dictionary words by language (model.LazyPredictors once server is started)
+decoders = dict()
+
+# Hunspell dictionaries of languages, words are decoded only for these languages
+DICTIONARIES = {'ru': os.path.join('..', 'RecognEstimator', 'Hunspell disctionaries', 'ru_RU.dic')}
+# Number of most probable letters per letter searched for the dictionary word
+DICTIONARY_CANDIDATES = 3
+
+# Lines of a text are segmented concurrently
+line_executor = concurrent.futures.ThreadPoolExecutor(max_workers=os.cpu_count())
+
+# Annotations of discrepancies with the expected word: image flagging them (PNG), or only boxes of letters and
+# positions of discrepancies for the client to draw them
+ANNOTATIONS = ('image', 'boxes')
+# zlib level of PNG images sent back, from 0 (fastest, largest) to 9 (slowest, smallest)
+PNG_COMPRESS_LEVEL = image_proc.PNG_COMPRESS_LEVEL
+
+# Content types of requests sending the image itself rather than b64 image inside json
+BINARY_MIMETYPES = ('application/octet-stream', 'multipart/form-data')
+
+
+def parse_bool(value):
+    """Read boolean parameter, which is a string if it comes from query string or form
+
+    :param value: bool or string
+    :return: bool
+    """
+    if isinstance(value, str):
+        return value.lower() in ('1', 'true', 'yes')
+    return bool(value)
+
+
+def request_params(is_binary):
+    """Parameters of a request of a single image, from json body or, if the image is sent as binary,
+    from query string or multipart form
+
+    :return: dict
+    """
+    if is_binary:
+        return flask.request.form if flask.request.mimetype == 'multipart/form-data' else flask.request.args
+    data = flask.request.data.decode("utf-8")
+    if len(data) != 0:
+        return json.loads(data)
+    return {}
+
+
+def read_params(params):
+    """Read parameters of a single image to recognize (except the image itself)
+
+    :param params: dict
+        parameters of the request
+    :return: (string, bool, string, int, bool)
+        language, if image need to be binarized, expected word (or None), number of most probable letters
+        and if the dictionary word must be decoded
+    """
+    try:
+        lang_in = params['lang']
+        is_binarize = parse_bool(params['is_binarize'])
+    except KeyError:
+        raise AttributeError('Not all necessary attributes supplied')
+
+    try:
+        word_in = params['word']
+    except KeyError:
+        word_in = None
+
+    try:
+        num_of_letters = int(params['num_of_letters'])
+    except (KeyError, TypeError):
+        num_of_letters = 1
+
+    if lang_in not in words_predictors:
+        raise AttributeError(f"'lang' parameter '{lang_in}' is none of served languages: {', '.join(words_predictors)}")
+
+    use_dictionary = parse_bool(params.get('dictionary', False))
+    if use_dictionary and lang_in not in decoders:
+        raise AttributeError(f"No dictionary for language '{lang_in}'")
+
+    return lang_in, is_binarize, word_in, num_of_letters, use_dictionary
+
+
+def read_annotation(params):
+    """Read how discrepancies with the expected word are annotated, one of ANNOTATIONS ('image' by default)
+
+    :param params: dict
+        parameters of the request
+    :return: string
+    """
+    annotation = params.get('annotation', 'image')
+    if annotation not in ANNOTATIONS:
+        raise AttributeError(f"'annotation' parameter '{annotation}' is none of {', '.join(ANNOTATIONS)}")
+    return annotation
+
+
+def prepare_image(params, is_binarize):
+    """Convert b64 image to process-able format
+
+    :param params: dict
+        parameters of the request, containing b64 image with header (or not)
+    :param is_binarize: if image must be binarized
+    :return: numpy.ndarray
+        grayscale image
+    """
+    try:
+        img_in = params['img']
+    except KeyError:
+        raise AttributeError('Not all necessary attributes supplied')
+
+    with metrics.STAGE_LATENCY.time(stage='decode'):
+        # Ensure image has no header
+        img_in = image_proc.b64_remove_header(img_in)
+        npim = image_proc.b64_to_array(img_in)
+
+    # Convert image to process-able format
+    with metrics.STAGE_LATENCY.time(stage='preprocess'):
+        return image_proc.preprocess_array(npim, is_binarize)
+
+
+def prepare_binary_image(params, is_binarize):
+    """Convert image sent as request body or as 'img' file of multipart form to process-able format
+
+    :param params: dict
+        parameters of the request, with 'width' and 'height' if image is a raw buffer of 8-bit grayscale pixels
+    :param is_binarize: if image must be binarized
+    :return: numpy.ndarray
+        grayscale image
+    """
+    with metrics.STAGE_LATENCY.time(stage='decode'):
+        if flask.request.mimetype == 'multipart/form-data':
+            if 'img' not in flask.request.files:
+                raise AttributeError('Not all necessary attributes supplied')
+            data = flask.request.files['img'].read()
+        else:
+            data = flask.request.get_data()
+
+        if 'width' in params and 'height' in params:
+            npim = image_proc.bytes_to_array(data, int(params['width']), int(params['height']))
+        else:
+            npim = image_proc.bytes_to_array(data)
+
+    with metrics.STAGE_LATENCY.time(stage='preprocess'):
+        return image_proc.preprocess_array(npim, is_binarize)
+
+
+def segment(img):
+    """Find letters on the image
+
+    :param img: numpy.ndarray
+        grayscale image
+    :return: image_proc.Segmentation
+    """
+    with metrics.STAGE_LATENCY.time(stage='segmentation'):
+        segmentation = image_proc.Segmentation(img)
+    metrics.LETTERS_PER_WORD.observe(len(segmentation.contours))
+    return segmentation
+
+
+def segment_text(img):
+    """Find lines on the image of a text, words on each line and letters of each word
+
+    :param img: numpy.ndarray
+        grayscale image
+    :return: list
+        for each line, its top and bottom rows and list of (image, image_proc.Segmentation) of its words
+    """
+    def segment_line(line_range):
+        top, bottom = line_range
+        line = img[top:bottom]
+        # Letters of the line are found once: words are cut in spaces, so each letter is within a word
+        contours = image_proc.get_contours(line)
+        # Letters beyond the limit of get_contours are found on their word
+        is_complete = len(contours) < image_proc.MAX_NB_LETTERS
+        words = []
+        for left, right in image_proc.get_words(line, contours):
+            word = line[:, left:right]
+            if is_complete:
+                word_contours = contours[(contours[:, 0] >= left) & (contours[:, 2] <= right)] - [left, 0, left, 0]
+                segmentation = image_proc.Segmentation(word, word_contours)
+            else:
+                segmentation = image_proc.Segmentation(word)
+            metrics.LETTERS_PER_WORD.observe(len(segmentation.contours))
+            words.append((word, segmentation))
+        return top, bottom, words
+
+    # Segmentation of the whole text is observed once, as for a word
+    with metrics.STAGE_LATENCY.time(stage='segmentation'):
+        lines = image_proc.get_lines(img)
+        return list(line_executor.map(segment_line, lines.tolist()))
+
+
+def decode_word(lang_in, words_out, proba):
+    """Find the most probable dictionary word
+
+    :param words_out: numpy.ndarray
+        the most probable letters of the read word
+    :param proba: numpy.ndarray
+        probabilities of these letters
+    :return: string
+        the dictionary word, empty if no word of the dictionary has this number of letters
+    """
+    with metrics.STAGE_LATENCY.time(stage='decoding'):
+        word = decoders[lang_in].decode(words_out, proba) if words_out.size != 0 else None
+    return '' if word is None else word
+
+
+def count_word(lang_in, is_binarize, outcome):
+    """Account a word to recognize in metrics
+
+    :param lang_in: language (None if it was not read)
+    :param is_binarize: if image must be binarized (None if it was not read)
+    :param outcome: 'ok', 'empty' (no letters found) or 'error'
+    """
+    metrics.WORDS.inc(lang=lang_in if lang_in in words_predictors else 'unknown',
+                      binarize='unknown' if is_binarize is None else str(is_binarize).lower(), outcome=outcome)
+
+
+def make_response(img, segmentation, words_out, word_in, num_of_letters, dictionary_word=None, annotation='image'):
+    """Build response for an image converted to word
+
+    :param img: numpy.ndarray
+        the image of the word
+    :param segmentation: image_proc.Segmentation
+        letters found on the image
+    :param words_out: numpy.ndarray
+        the most probable letters of the read word
+    :param word_in: string
+        the expected word (or None)
+    :param num_of_letters: int
+        number of most probable letters per letter
+    :param dictionary_word: string
+        the most probable dictionary word (or None if it was not requested)
+    :param annotation: string
+        how discrepancies with the expected word are annotated, one of ANNOTATIONS
+    :return: dict
+        the read word, dictionary word if requested and if expected word was provided, image flagging discrepancies
+        (or with 'boxes' annotation, boxes of letters, positions of wrong letters and boxes of missing letters)
+    """
+    response = dict()
+    if dictionary_word is not None:
+        response['dictionary_word'] = dictionary_word
+    if words_out.size != 0:
+        word_out = ''.join(list(words_out[:, 0]))
+    else:
+        response['word'] = ""
+        return response
+
+    response["word"] = word_out
+
+    if DEBUG:
+        print("Found word: %s" % word_out)
+        if num_of_letters > 1:
+            for i in range(1, num_of_letters):
+                print("Alternatively word could be %s" % ''.join(list(words_out[:, i])))
+
+    # Compare read word with expected word
+    if word_in is not None and len(word_in) != 0:
+        with metrics.STAGE_LATENCY.time(stage='annotation'):
+            if annotation == 'boxes':
+                # Client draws discrepancies itself, image is neither modified nor encoded
+                wrong, missing, correct = image_proc.compare_word(word_in, words_out)
+                response["correct"] = correct
+                response["boxes"] = segmentation.contours.tolist()
+                response["wrong"] = wrong.tolist()
+                response["missing"] = missing.tolist()
+                response["missing_boxes"] = image_disp.missing_letter_boxes(segmentation.spaces, missing).tolist()
+            else:
+                img, correct = image_proc.score_word(word_in, words_out, img, segmentation)
+                response["correct"] = correct
+                # Convert image back to base64 to be sent to the requestor
+                response["img"] = image_proc.img_to_b64(img, PNG_COMPRESS_LEVEL)
+
+    return response
+
+
 @api.route("/api/word")
 class Prediction(flask_restful.Resource):
     def post(self):
@@ -21,77 +308,208 @@ class Prediction(flask_restful.Resource):
         Language has to be provided as different alphabets are handled differently. Also, if image need to be binarized have to be supplied.
         Expected word can be provided too.
         Number of most probable letters also could be supplied (for debugging purpose) (default value of it is 1)
+        With 'annotation' parameter 'boxes', discrepancies with expected word are returned as boxes of letters
+        ([left, top, right, bottom] of each one), positions of wrong letters among them, positions of spaces missing
+        a letter (0 is before the first letter) and their boxes, instead of an image flagging them.
+        With 'dictionary' parameter, the most probable word of the dictionary of the language is returned too.
+        Instead of json, the image can be sent as binary: PNG file or raw 8-bit grayscale pixels with 'width' and 'height',
+        either as 'application/octet-stream' body with parameters in query string, or as 'img' file of multipart form.
 
         :return: json
             a json containing the read word (string) and if expected word was provided,
-            a b64 images flagging discrepancies between read and expected (if any)
+            a b64 images flagging discrepancies between read and expected (if any) or their boxes
+            (for json requests this json is sent encoded as a json string)
         """
-        start = time.time()
+        with metrics.REQUEST_LATENCY.time(endpoint='/api/word'):
+            is_binary = flask.request.mimetype in BINARY_MIMETYPES
+            lang_in, is_binarize = None, None
 
-        # Read parameters
-        data = flask.request.data.decode("utf-8")
-        if len(data) != 0:
-            params = json.loads(data)
-        else:
-            params = {}
+            try:
+                # Read parameters
+                params = request_params(is_binary)
+                lang_in, is_binarize, word_in, num_of_letters, use_dictionary = read_params(params)
+                annotation = read_annotation(params)
 
-        try:
-            img_in = params['img']
-            lang_in = params['lang']
-            is_binarize = params['is_binarize']
-        except KeyError:
-            raise AttributeError('Not all necessary attributes supplied')
+                if is_binary:
+                    img = prepare_binary_image(params, is_binarize)
+                else:
+                    img = prepare_image(params, is_binarize)
 
-        try:
-            word_in = params['word']
-        except KeyError:
-            word_in = None
+                # Find letters once for both recognition and scoring
+                segmentation = segment(img)
 
-        try:
-            num_of_letters = int(params['num_of_letters'])
-        except KeyError and TypeError:
-            num_of_letters = 1
+                # Convert image to word
+                dictionary_word = None
+                if use_dictionary:
+                    with metrics.STAGE_LATENCY.time(stage='inference'):
+                        words_out, proba = words_predictors[lang_in]([img], [max(num_of_letters, DICTIONARY_CANDIDATES)],
+                                                                     [segmentation], with_proba=True)[0]
+                    dictionary_word = decode_word(lang_in, words_out, proba)
+                    words_out = words_out[:, :num_of_letters] if words_out.size != 0 else words_out
+                else:
+                    with metrics.STAGE_LATENCY.time(stage='inference'):
+                        words_out = words_predictors[lang_in]([img], [num_of_letters], [segmentation])[0]
 
+                response = make_response(img, segmentation, words_out, word_in, num_of_letters, dictionary_word, annotation)
+            except Exception:
+                count_word(lang_in, is_binarize, 'error')
+                raise
+            count_word(lang_in, is_binarize, 'ok' if words_out.size != 0 else 'empty')
 
-        # Ensure image has no header
-        img_in = image_proc.b64_remove_header(img_in)
+            if is_binary:
+                return response
+            return json.dumps(response)
 
-        # Convert image to process-able format
-        img = image_proc.b64_preprocess(img_in, is_binarize)
 
-        # Convert image to word
-        response = dict()
-        if lang_in == 'en':
-            words_out = word_predictor_en(img, num_of_letters)
-        elif lang_in == 'ru':
-            words_out = word_predictor_ru(img, num_of_letters)
-        else:
-            raise AttributeError(f"'lang' parameter '{lang_in}' is nor 'en', nor 'ru'")
-        if words_out.size != 0:
-            word_out = ''.join(list(words_out[:, 0]))
-        else:
-            response['word'] = ""
+@api.route("/api/text")
+class TextPrediction(flask_restful.Resource):
+    def post(self):
+        """API that expects an image of a text of one or several lines, analyze it
+        and returns the text it represents
+        Parameters are the same as for /api/word, except expected word which is not supported.
+        Lines are found from rows of the image, words from wide gaps between letters, lines are segmented concurrently
+        and letters of all words are classified at once.
+
+        :return: json
+            a json containing the read text (lines separated by '\\n', words by ' '), and for each line
+            its text and its top and bottom rows on the image (with dictionary words too, if requested)
+            (for json requests this json is sent encoded as a json string)
+        """
+        with metrics.REQUEST_LATENCY.time(endpoint='/api/text'):
+            is_binary = flask.request.mimetype in BINARY_MIMETYPES
+            lang_in, is_binarize = None, None
+
+            try:
+                params = request_params(is_binary)
+                lang_in, is_binarize, _, num_of_letters, use_dictionary = read_params(params)
+
+                if is_binary:
+                    img = prepare_binary_image(params, is_binarize)
+                else:
+                    img = prepare_image(params, is_binarize)
+
+                lines = segment_text(img)
+                words = [word for _, _, line_words in lines for word in line_words]
+
+                # Convert images of all words to words
+                words_out = []
+                if len(words) != 0:
+                    with metrics.STAGE_LATENCY.time(stage='inference'):
+                        words_out = words_predictors[lang_in]([word for word, _ in words],
+                                                              [DICTIONARY_CANDIDATES if use_dictionary else 1] * len(words),
+                                                              [segmentation for _, segmentation in words],
+                                                              with_proba=True)
+
+                response_lines = []
+                words_out = iter(words_out)
+                for top, bottom, line_words in lines:
+                    line = {'top': top, 'bottom': bottom}
+                    line_words_out = [next(words_out) for _ in line_words]
+                    line['text'] = ' '.join(''.join(word_out[:, 0]) for word_out, _ in line_words_out if word_out.size != 0)
+                    if use_dictionary:
+                        line['dictionary_text'] = ' '.join(decode_word(lang_in, word_out, proba)
+                                                           for word_out, proba in line_words_out if word_out.size != 0)
+                    response_lines.append(line)
+                    for word_out, _ in line_words_out:
+                        count_word(lang_in, is_binarize, 'ok' if word_out.size != 0 else 'empty')
+
+                response = {'text': '\n'.join(line['text'] for line in response_lines), 'lines': response_lines}
+                if use_dictionary:
+                    response['dictionary_text'] = '\n'.join(line['dictionary_text'] for line in response_lines)
+            except Exception:
+                count_word(lang_in, is_binarize, 'error')
+                raise
+
+            if is_binary:
+                return response
             return json.dumps(response)
 
-        response["word"] = word_out
 
-        if DEBUG:
-            print("Found word: %s" % word_out)
-            if num_of_letters > 1:
-                for i in range(1, num_of_letters):
-                    print("Alternatively word could be %s" % ''.join(list(words_out[:, i])))
+@api.route("/api/words")
+class BulkPrediction(flask_restful.Resource):
+    def post(self):
+        """API that expects a list of images as input, analyze them together
+        and returns the words they represent
+        Each item of the list has the same parameters as the input of /api/word.
+        Letters of all words of the same language are classified at once.
+
+        :return: json
+            a list containing for each image, in input order, either the response of /api/word
+            or an error message
+        """
+        with metrics.REQUEST_LATENCY.time(endpoint='/api/words'):
+            # Read parameters
+            data = flask.request.data.decode("utf-8")
+            if len(data) != 0:
+                items = json.loads(data)
+            else:
+                items = []
+            if not isinstance(items, list):
+                raise AttributeError('A list of images expected')
 
-        # Compare read word with expected word
-        if word_in is not None and len(word_in) != 0:
-            img, correct = image_proc.score_word(word_in, words_out, img)
-            response["correct"] = correct
-            # Convert image back to base64 to be sent to the requestor
-            response["img"] = image_proc.img_to_b64(img)
+            results = [None] * len(items)
 
-        if DEBUG:
-            print("Time spent handling the request: %f" % (time.time() - start))
+            # Convert images to process-able format and group them by language
+            # Language -> list of (index, image, segmentation, expected word, num_of_letters, use_dictionary)
+            prepared = {lang: [] for lang in words_predictors}
+            binarize = [None] * len(items)
+            annotations = [None] * len(items)
+            for i, params in enumerate(items):
+                lang_in = None
+                try:
+                    lang_in, binarize[i], word_in, num_of_letters, use_dictionary = read_params(params)
+                    annotations[i] = read_annotation(params)
+                    img = prepare_image(params, binarize[i])
+                    prepared[lang_in].append((i, img, segment(img), word_in, num_of_letters, use_dictionary))
+                except Exception as e:
+                    results[i] = {'error': repr(e)}
+                    count_word(lang_in, binarize[i], 'error')
 
-        return json.dumps(response)
+            # Convert images to words
+            for lang_in, group in prepared.items():
+                if len(group) == 0:
+                    continue
+                try:
+                    with metrics.STAGE_LATENCY.time(stage='inference'):
+                        words_out = words_predictors[lang_in]([img for _, img, _, _, _, _ in group],
+                                                              [max(num, DICTIONARY_CANDIDATES) if use_dictionary else num
+                                                               for _, _, _, _, num, use_dictionary in group],
+                                                              [segmentation for _, _, segmentation, _, _, _ in group],
+                                                              with_proba=True)
+                except Exception as e:
+                    for i, _, _, _, _, _ in group:
+                        results[i] = {'error': repr(e)}
+                        count_word(lang_in, binarize[i], 'error')
+                    continue
+                for (i, img, segmentation, word_in, num_of_letters, use_dictionary), (word_out, proba) in zip(group, words_out):
+                    try:
+                        dictionary_word = decode_word(lang_in, word_out, proba) if use_dictionary else None
+                        word_out = word_out[:, :num_of_letters] if word_out.size != 0 else word_out
+                        results[i] = make_response(img, segmentation, word_out, word_in, num_of_letters, dictionary_word,
+                                                   annotations[i])
+                        count_word(lang_in, binarize[i], 'ok' if word_out.size != 0 else 'empty')
+                    except Exception as e:
+                        results[i] = {'error': repr(e)}
+                        count_word(lang_in, binarize[i], 'error')
+
+            return results
+
+
+@api.route("/api/scheduler")
+class SchedulerStats(flask_restful.Resource):
+    def get(self):
+        """API that reports batches achieved by the schedulers of models
+
+        :return: json
+            for each language, statistics of its batch scheduler
+        """
+        return {lang: scheduler.stats() for lang, scheduler in schedulers.items()}
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Metrics of the server in Prometheus text format"""
+    return flask.Response(metrics.render(), mimetype=metrics.CONTENT_TYPE)
 
 
 if __name__ == "__main__":
@@ -100,13 +518,84 @@ if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument("--debug", default=DEBUG, type=bool, help="Image shape")
+    parser.add_argument("--max-batch-size", default=0, type=int,
+                        help="Batch letters of concurrent requests up to this size (0 disables batching)")
+    parser.add_argument("--max-wait-ms", default=5., type=float,
+                        help="Maximal time a request waits for other requests to join its batch")
+    parser.add_argument("--queue-depth", default=256, type=int,
+                        help="Maximal number of requests waiting to be batched")
+    parser.add_argument("--backend", default='keras', choices=model.BACKENDS,
+                        help="Engine computing the model: keras, keras as compiled graph functions, "
+                             "numpy (does not import tensorflow) or int8 quantized model")
+    parser.add_argument("--langs", default=['en', 'ru'], nargs='+', choices=['en', 'ru'], help="Languages to serve")
+    parser.add_argument("--load", default='eager', choices=['eager', 'lazy', 'background'],
+                        help="Load models before starting the API (eager), on first request of a language (lazy) "
+                             "or in background while the API is already started (background)")
+    parser.add_argument("--workers", default=1, type=int,
+                        help="Number of processes serving the API, forked once weights are in memory shared by all of "
+                             "them (requires --backend numpy and --load eager)")
+    parser.add_argument("--heartbeat-timeout", default=10., type=float,
+                        help="With several workers, worker which did not report for this number of seconds is replaced")
+    parser.add_argument("--png-compression", default=PNG_COMPRESS_LEVEL, type=int, choices=range(10),
+                        help="zlib level of PNG images flagging discrepancies, from 0 (fastest) to 9 (smallest)")
+    parser.add_argument("--frontend", default='flask', choices=['flask', 'asyncio'],
+                        help="Server of the API: flask development server, or asyncio front-end running requests in "
+                             "--executor-workers threads and rejecting them with 503 once --admission-queue requests wait")
+    parser.add_argument("--executor-workers", default=os.cpu_count(), type=int,
+                        help="With asyncio front-end, number of requests processed at once")
+    parser.add_argument("--admission-queue", default=32, type=int,
+                        help="With asyncio front-end, maximal number of requests waiting to be processed")
+    parser.add_argument("--retry-after", default=1, type=int,
+                        help="With asyncio front-end, seconds a rejected client is asked to wait before retrying")
+    parser.add_argument("--max-body-size", default=32 * 1024 * 1024, type=int,
+                        help="With asyncio front-end, requests with a larger body (in bytes) are rejected with 413")
+    parser.add_argument("--graceful-timeout", default=30., type=float,
+                        help="With asyncio front-end, seconds requests in progress are waited for on stop")
     args = parser.parse_args()
+    if args.workers > 1 and args.frontend != 'flask':
+        parser.error('--workers requires --frontend flask')
+    if args.workers > 1 and args.backend != 'numpy':
+        parser.error('--workers requires --backend numpy: tensorflow does not survive fork and its weights are not shared')
+    if args.workers > 1 and args.load != 'eager':
+        parser.error('--workers requires --load eager: models are loaded before workers are forked')
 
     DEBUG = args.debug
+    PNG_COMPRESS_LEVEL = args.png_compression
+
+    if args.max_batch_size > 0:
+        for lang in args.langs:
+            schedulers[lang] = batching.BatchScheduler(args.max_batch_size, args.max_wait_ms / 1000, args.queue_depth)
 
-    # Load model and start API
-    print('Loading models')
-    word_predictor_en = model.load_word_predictor("weights/comnist_keras_en.hdf5", lang_in='en')
-    word_predictor_ru = model.load_word_predictor("weights/comnist_keras_ru.hdf5", lang_in='ru')
-    print('Starting the API')
-    app.run(host="0.0.0.0", port=5002)
+    words_predictors = model.LazyPredictors({
+        lang: functools.partial(model.load_words_predictor, f"weights/comnist_keras_{lang}.hdf5", lang_in=lang,
+                                scheduler=schedulers.get(lang), backend=args.backend)
+        for lang in args.langs})
+    decoders = model.LazyPredictors({
+        lang: functools.partial(dictionary.load_decoder, DICTIONARIES[lang], lang_in=lang)
+        for lang in args.langs if lang in DICTIONARIES})
+
+    if args.workers > 1:
+        import prefork
+        # Weights and dictionaries are loaded once, before workers are forked
+        # Each worker creates its predictors from the shared weights and starts its batch schedulers
+        prefork.share_weights([f"weights/comnist_keras_{lang}.hdf5" for lang in args.langs])
+        decoders.load_all()
+        print('Starting the API')
+        prefork.serve(app, "0.0.0.0", 5002, args.workers, words_predictors.load_all, args.heartbeat_timeout)
+    else:
+        # Load model and start API
+        if args.load == 'eager':
+            print('Loading models')
+            words_predictors.load_all()
+            decoders.load_all()
+        elif args.load == 'background':
+            print('Loading models in background')
+            words_predictors.warm_up()
+            decoders.warm_up()
+        print('Starting the API')
+        if args.frontend == 'asyncio':
+            import async_frontend
+            async_frontend.serve(app, "0.0.0.0", 5002, args.executor_workers, args.admission_queue, args.retry_after,
+                                 args.max_body_size, args.graceful_timeout)
+        else:
+            app.run(host="0.0.0.0", port=5002)
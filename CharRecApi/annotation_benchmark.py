@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+#  -*- coding: utf-8 -*-
+
+# Builtin imports
+import argparse
+import functools
+import os
+import random
+import sys
+import time
+
+# Dependency imports
+import numpy as np
+
+# Local imports
+import dictionary
+import image_disp
+import image_proc
+import model
+import WordRecognitionServer
+
+RECOGN_ESTIMATOR_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'RecognEstimator')
+sys.path.insert(1, RECOGN_ESTIMATOR_DIR)
+import text2image
+
+FONTSIZE = 40
+PNG_COMPRESS_LEVELS = (1, 6, 9)
+
+
+def load_words(fontname, num_of_words, seed=0):
+    """Random dictionary words rendered as PNG, each one with an expected word differing from it
+
+    :return: list
+        list of (PNG of the word, expected word)
+    """
+    all_words = dictionary.read_hunspell_words(os.path.join(RECOGN_ESTIMATOR_DIR, 'Hunspell disctionaries', 'ru_RU.dic'))
+    rng = random.Random(seed)
+    params = {'fontpath': os.path.join(RECOGN_ESTIMATOR_DIR, "Fonts", fontname), 'fontsize': FONTSIZE}
+    words = []
+    for word in rng.choices([w for w in all_words if 3 <= len(w) <= 12], k=num_of_words):
+        # Expected word misses a letter or has another one, so that both wrong and missing letters are flagged
+        position = rng.randrange(len(word))
+        expected = word[:position] + word[position + 1:] if rng.random() < 0.5 else word[:position] + 'Ж' + word[position:]
+        words.append((text2image.image2png(text2image.text2image(word, **params)), expected))
+    return words
+
+
+def post_word(client, png, expected, annotation):
+    response = client.post('/api/word', data=png, content_type='application/octet-stream',
+                           query_string={'lang': 'ru', 'is_binarize': 0, 'word': expected, 'annotation': annotation})
+    if response.status_code != 200:
+        raise RuntimeError(f'Got error code {response.status_code}: {response.get_data(as_text=True)}')
+    return response
+
+
+def draw_annotation(img, response):
+    """Draw discrepancies of a response with 'boxes' annotation on the image, as a client would"""
+    npim = np.array(img)
+    for i in response['wrong']:
+        left, top, right, bottom = response['boxes'][i]
+        letter = npim[top:bottom + 1, left:right + 1]
+        letter[letter < 255] = 192
+    for left, low, right, high in response['missing_boxes']:
+        npim[low:high, left:right + 1] = image_disp.q_mark(right + 1 - left, high - low)
+    return npim
+
+
+def time_per_word(function, words, repeat):
+    """Best time over repeats of calling the function on each (item, expected word)"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item, expected in words:
+            function(item, expected)
+        times.append(time.perf_counter() - start)
+    return min(times) / len(words)
+
+
+def flag_without_cache(img, pos, segmentation):
+    """Flag missing letters reading and resizing the question mark every time, as before the cache"""
+    image_disp.q_mark.cache_clear()
+    image_disp._q_mark_im = None
+    return image_disp.flag_missing_letter(img, pos, segmentation=segmentation)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Compare annotation of discrepancies as an image with letter boxes')
+    parser.add_argument("--font", default="Consolas.ttf", help="Font from RecognEstimator/Fonts")
+    parser.add_argument("--words", default=200, type=int, help="Number of words")
+    parser.add_argument("--backend", default='numpy', choices=model.BACKENDS, help="Engine computing the model")
+    parser.add_argument("--repeat", default=3, type=int, help="Number of repeats, best one is kept")
+    args = parser.parse_args()
+
+    WordRecognitionServer.words_predictors = model.LazyPredictors({
+        'ru': functools.partial(model.load_words_predictor, "weights/comnist_keras_ru.hdf5", lang_in='ru', backend=args.backend)})
+    WordRecognitionServer.words_predictors.load_all()
+    client = WordRecognitionServer.app.test_client()
+    words = load_words(args.font, args.words)
+
+    # Boxes must flag the same discrepancies as the image
+    different = 0
+    flagged = 0
+    for png, expected in words:
+        img = image_proc.preprocess_array(image_proc.bytes_to_array(png), False)
+        image_response = post_word(client, png, expected, 'image').get_json()
+        boxes_response = post_word(client, png, expected, 'boxes').get_json()
+        if 'img' not in image_response:
+            continue
+        flagged += 1
+        different += not np.array_equal(draw_annotation(img, boxes_response), image_proc.b64_to_array(image_response['img']))
+    print(f'{flagged - different} of {flagged} images drawn from boxes are the same as images of the server')
+
+    # Annotation stage alone, on words already read
+    read_words = []
+    for png, expected in words:
+        img = image_proc.preprocess_array(image_proc.bytes_to_array(png), False)
+        segmentation = image_proc.Segmentation(img)
+        read_words.append((img, segmentation, WordRecognitionServer.words_predictors['ru']([img], [1], [segmentation])[0],
+                           expected))
+
+    print('Annotation\t\trequest, ms\tannotation, ms\tbytes per response')
+    for annotation, compress_level in [('image', level) for level in PNG_COMPRESS_LEVELS] + [('boxes', None)]:
+        if compress_level is not None:
+            WordRecognitionServer.PNG_COMPRESS_LEVEL = compress_level
+        size = np.mean([len(post_word(client, png, expected, annotation).get_data()) for png, expected in words])
+        request_time = time_per_word(lambda png, expected: post_word(client, png, expected, annotation), words, args.repeat)
+        annotation_time = time_per_word(
+            lambda item, expected: WordRecognitionServer.make_response(*item, expected, 1, None, annotation),
+            [((img, segmentation, words_out), expected) for img, segmentation, words_out, expected in read_words],
+            args.repeat)
+        name = f'{annotation}, PNG level {compress_level}' if compress_level is not None else f'{annotation}\t'
+        print(f'{name}\t{request_time * 1e3:.2f}\t\t{annotation_time * 1e3:.3f}\t\t{size:.0f}')
+
+    # Question marks of the missing letters of the words
+    missing = []
+    for png, expected in words:
+        img = image_proc.preprocess_array(image_proc.bytes_to_array(png), False)
+        response = post_word(client, png, expected, 'boxes').get_json()
+        if len(response.get('missing', [])) != 0:
+            missing.append((img, response['missing'], image_proc.Segmentation(img)))
+    if len(missing) != 0:
+        cached = time_per_word(lambda img, item: image_disp.flag_missing_letter(img, item[0], segmentation=item[1]),
+                               [(img, (pos, segmentation)) for img, pos, segmentation in missing], args.repeat)
+        uncached = time_per_word(lambda img, item: flag_without_cache(img, *item),
+                                 [(img, (pos, segmentation)) for img, pos, segmentation in missing], args.repeat)
+        print(f'Flagging missing letters of {len(missing)} words: {cached * 1e3:.3f} ms with cached question marks, '
+              f'{uncached * 1e3:.3f} ms reading them from disk')
+
+    if different != 0:
+        sys.exit(1)
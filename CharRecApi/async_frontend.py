@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import concurrent.futures
+import functools
+import io
+import json
+import os
+import signal
+import sys
+import urllib.parse
+
+import metrics
+
+# Requests waiting for an executor thread, further requests are rejected with 503
+ADMISSION_QUEUE_SIZE = 32
+# Seconds a rejected client is asked to wait before retrying
+RETRY_AFTER = 1
+# Maximal size of request line and headers in bytes
+MAX_HEADERS_SIZE = 64 * 1024
+# Requests with a larger body (in bytes) are rejected with 413
+MAX_BODY_SIZE = 32 * 1024 * 1024
+# Seconds given to requests in progress once the server stops, connections still open are then closed
+GRACEFUL_TIMEOUT = 30.
+# Seconds during which data still sent by a client whose request was rejected is read and dropped before closing
+LINGER_TIMEOUT = 1.
+LINGER_CHUNK_SIZE = 64 * 1024
+# Paths answered by the event loop itself, without waiting in the admission queue
+QUEUE_PATH = '/api/queue'
+UNQUEUED_PATHS = (QUEUE_PATH, '/metrics')
+
+
+class HTTPError(Exception):
+    """Malformed request, answered with the status and the connection is closed"""
+
+    def __init__(self, status):
+        super().__init__(status)
+        self.status = status
+
+
+class AsyncFrontend:
+    """HTTP server running a WSGI application (the recognition API) in a thread pool behind an admission queue
+
+    Connections are handled by an asyncio event loop, which parses requests and hands them to the executor.
+    At most executor_workers requests run at once, at most queue_size more wait for a thread: further requests are
+    rejected at once with 503 and a Retry-After header, so that latency of admitted requests stays bounded under
+    overload. Depth of the queue is reported by GET /api/queue and by the charrec_queue_depth metric.
+    Requests are admitted on their request line and headers: body of an admitted request is read while it waits in
+    the queue, body of a rejected one is not read (connection is closed), bodies larger than max_body_size are rejected
+    with 413, so that memory of requests is bounded too.
+    Once stopped, connections waiting for a request are closed, requests in progress are answered with
+    Connection: close, and connections still open after graceful_timeout (or a second signal) are closed.
+    """
+
+    def __init__(self, app, executor_workers=None, queue_size=ADMISSION_QUEUE_SIZE, retry_after=RETRY_AFTER,
+                 max_body_size=MAX_BODY_SIZE, graceful_timeout=GRACEFUL_TIMEOUT):
+        """
+        :param app: flask.Flask
+            WSGI application handling admitted requests
+        :param executor_workers: int
+            number of threads running the application (requests processed at once), number of CPUs by default
+        :param queue_size: int
+            maximal number of requests waiting for a thread
+        :param retry_after: int
+            seconds a rejected client is asked to wait before retrying
+        :param max_body_size: int
+            requests with a larger body (in bytes) are rejected with 413
+        :param graceful_timeout: float
+            seconds given to requests in progress once the server stops
+        """
+        if queue_size < 0:
+            raise AttributeError('Size of admission queue must not be negative')
+        self.app = app
+        self.executor_workers = executor_workers if executor_workers is not None else os.cpu_count()
+        self.queue_size = queue_size
+        self.retry_after = retry_after
+        self.max_body_size = max_body_size
+        self.graceful_timeout = graceful_timeout
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.executor_workers,
+                                                              thread_name_prefix='AsyncFrontend')
+        self.waiting = 0
+        self.running = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.host = None
+        self.port = None
+        self._slots = None  # asyncio.Semaphore of executor threads, created in the event loop
+        self._connections = dict()  # Task handling each open connection -> its writer
+        self._idle = set()  # Tasks of connections waiting for a request
+        self._stopping = False
+
+    def stats(self):
+        """Current state of the admission queue
+
+        :return: dict
+            requests waiting and running, limits of the queue and numbers of admitted and rejected requests
+        """
+        return {'queue_depth': self.waiting,
+                'queue_size': self.queue_size,
+                'running': self.running,
+                'executor_workers': self.executor_workers,
+                'admitted': self.admitted,
+                'rejected': self.rejected}
+
+    def call_app(self, environ):
+        """Run the WSGI application on a request
+
+        :return: tuple
+            status line, list of headers and body of the response
+        """
+        response = dict()
+        chunks = []
+
+        def start_response(status, headers, exc_info=None):
+            response['status'], response['headers'] = status, headers
+            return chunks.append
+
+        result = self.app(environ, start_response)
+        try:
+            chunks.extend(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return response['status'], response['headers'], b''.join(chunks)
+
+    async def dispatch(self, environ, read_body):
+        """Answer a request, through the admission queue and the executor unless its path is unqueued
+
+        :param read_body: function
+            coroutine function reading the body of the request into environ, called only if the request is admitted
+        """
+        if environ['PATH_INFO'] == QUEUE_PATH:
+            await read_body()
+            return json_response('200 OK', self.stats())
+        if environ['PATH_INFO'] in UNQUEUED_PATHS:
+            await read_body()
+            return self.call_app(environ)
+        if self.waiting >= self.queue_size and self.running >= self.executor_workers:
+            self.rejected += 1
+            metrics.REJECTED_REQUESTS.inc()
+            status, headers, body = json_response('503 Service Unavailable',
+                                                  {'error': 'Server is overloaded, retry later'})
+            return status, headers + [('Retry-After', str(self.retry_after))], body
+
+        self.admitted += 1
+        self.waiting += 1
+        metrics.QUEUE_DEPTH.set(self.waiting)
+        try:
+            await read_body()
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+            metrics.QUEUE_DEPTH.set(self.waiting)
+        self.running += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, self.call_app, environ)
+        finally:
+            self.running -= 1
+            self._slots.release()
+
+    async def handle_connection(self, reader, writer):
+        """Answer requests of a connection until the client closes it, does not keep it alive or the server stops"""
+        task = asyncio.current_task()
+        self._connections[task] = writer
+        peer = writer.get_extra_info('peername') or ('', 0)
+        try:
+            keep_alive = True
+            while keep_alive and not self._stopping:
+                self._idle.add(task)
+                try:
+                    environ, keep_alive = await self.read_request(reader, peer)
+                finally:
+                    self._idle.discard(task)
+                status, headers, body = await self.dispatch(environ,
+                                                            functools.partial(self.read_body, reader, writer, environ))
+                if 'wsgi.input' not in environ:
+                    # Rejected without reading its body
+                    await self.close_unread(reader, writer, status, headers, body)
+                    return
+                if environ['REQUEST_METHOD'] == 'HEAD':
+                    body = b''
+                keep_alive = keep_alive and not self._stopping
+                self.write_response(writer, status, headers, body, keep_alive)
+                await writer.drain()
+        except HTTPError as e:
+            await self.close_unread(reader, writer, *json_response(e.status, {'error': e.status}))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            # Closed by the client, or by the server while waiting for a request
+            pass
+        except asyncio.CancelledError:
+            # Closed by the server after graceful timeout, not raised since Python 3.11 logs cancelled connections
+            pass
+        finally:
+            del self._connections[task]
+            writer.close()
+
+    async def read_request(self, reader, peer):
+        """Read request line and headers of a request of the connection, its body is read by read_body
+
+        :return: tuple
+            WSGI environ of the request (without wsgi.input) and if connection is kept alive after the response
+        """
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except asyncio.LimitOverrunError:
+            raise HTTPError('431 Request Header Fields Too Large')
+        request_line, *header_lines = head[:-4].decode('latin-1').split('\r\n')
+        try:
+            method, target, version = request_line.split(' ')
+        except ValueError:
+            raise HTTPError('400 Bad Request')
+        if version not in ('HTTP/1.0', 'HTTP/1.1'):
+            raise HTTPError('505 HTTP Version Not Supported')
+        path, _, query = target.partition('?')
+
+        environ = {'REQUEST_METHOD': method,
+                   'SCRIPT_NAME': '',
+                   'PATH_INFO': urllib.parse.unquote_to_bytes(path).decode('latin-1'),
+                   'QUERY_STRING': query,
+                   'SERVER_NAME': self.host,
+                   'SERVER_PORT': str(self.port),
+                   'SERVER_PROTOCOL': version,
+                   'REMOTE_ADDR': peer[0],
+                   'REMOTE_PORT': str(peer[1]),
+                   'wsgi.version': (1, 0),
+                   'wsgi.url_scheme': 'http',
+                   'wsgi.errors': sys.stderr,
+                   'wsgi.multithread': True,
+                   'wsgi.multiprocess': False,
+                   'wsgi.run_once': False}
+        for line in header_lines:
+            name, separator, value = line.partition(':')
+            if separator == '':
+                raise HTTPError('400 Bad Request')
+            key = name.strip().upper().replace('-', '_')
+            value = value.strip()
+            if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                key = 'HTTP_' + key
+            environ[key] = environ[key] + ',' + value if key in environ else value
+
+        if 'HTTP_TRANSFER_ENCODING' in environ:
+            raise HTTPError('411 Length Required')
+        try:
+            length = int(environ.get('CONTENT_LENGTH', 0))
+        except ValueError:
+            raise HTTPError('400 Bad Request')
+        if length < 0:
+            raise HTTPError('400 Bad Request')
+        if length > self.max_body_size:
+            raise HTTPError('413 Content Too Large')
+        environ['CONTENT_LENGTH'] = str(length)
+
+        connection = environ.get('HTTP_CONNECTION', '').lower()
+        keep_alive = connection == 'keep-alive' if version == 'HTTP/1.0' else connection != 'close'
+        return environ, keep_alive
+
+    @staticmethod
+    async def read_body(reader, writer, environ):
+        """Read the body of an admitted request into environ"""
+        if environ.get('HTTP_EXPECT', '').lower() == '100-continue':
+            writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+        environ['wsgi.input'] = io.BytesIO(await reader.readexactly(int(environ['CONTENT_LENGTH'])))
+
+    async def close_unread(self, reader, writer, status, headers, body):
+        """Answer a request whose body was not read, then close the connection
+
+        Data still sent by the client is dropped for a while, otherwise closing the connection with unread data
+        would reset it, and the client could lose the response
+        """
+        self.write_response(writer, status, headers, body, False)
+        try:
+            await writer.drain()
+            if writer.can_write_eof():
+                writer.write_eof()
+            await asyncio.wait_for(drop_input(reader), LINGER_TIMEOUT)
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+
+    @staticmethod
+    def write_response(writer, status, headers, body, keep_alive):
+        lines = [f'HTTP/1.1 {status}']
+        lines += [f'{name}: {value}' for name, value in headers if name.lower() not in ('content-length', 'connection')]
+        lines += [f'Content-Length: {len(body)}', f'Connection: {"keep-alive" if keep_alive else "close"}', '', '']
+        writer.write('\r\n'.join(lines).encode('latin-1') + body)
+
+    async def serve(self, host, port):
+        """Serve until SIGTERM or SIGINT, then stop gracefully (a second signal closes connections at once)"""
+        self.host, self.port = host, port
+        self._slots = asyncio.Semaphore(self.executor_workers)
+        server = await asyncio.start_server(self.handle_connection, host, port, limit=MAX_HEADERS_SIZE)
+        stop = asyncio.Event()
+        hurry = asyncio.Event()
+
+        def on_signal():
+            if stop.is_set():
+                hurry.set()
+            stop.set()
+
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, on_signal)
+        print(f'Serving on {host}:{port} with {self.executor_workers} executor threads '
+              f'and an admission queue of {self.queue_size} requests', flush=True)
+        await stop.wait()
+
+        # Connections waiting for a request are closed, others once their request is answered
+        server.close()
+        self._stopping = True
+        print(f'Stopping, {len(self._connections) - len(self._idle)} connections have a request in progress', flush=True)
+        for task in self._idle:
+            self._connections[task].close()
+        if len(self._connections) != 0:
+            closed = asyncio.ensure_future(asyncio.wait(list(self._connections)))
+            hurried = asyncio.ensure_future(hurry.wait())
+            await asyncio.wait([closed, hurried], timeout=self.graceful_timeout, return_when=asyncio.FIRST_COMPLETED)
+            closed.cancel()
+            hurried.cancel()
+        if len(self._connections) != 0:
+            print(f'Closing {len(self._connections)} connections still open', flush=True)
+            remaining = list(self._connections)
+            for task in remaining:
+                task.cancel()
+            await asyncio.gather(*remaining, return_exceptions=True)
+        # Since Python 3.12, waits until every connection is closed
+        await server.wait_closed()
+        self.executor.shutdown()
+        print('Stopped', flush=True)
+
+
+async def drop_input(reader):
+    """Read data of the connection until the client closes it, without keeping it"""
+    while len(await reader.read(LINGER_CHUNK_SIZE)) != 0:
+        pass
+
+
+def json_response(status, data):
+    return status, [('Content-Type', 'application/json')], json.dumps(data).encode('utf-8')
+
+
+def serve(app, host, port, executor_workers=None, queue_size=ADMISSION_QUEUE_SIZE, retry_after=RETRY_AFTER,
+          max_body_size=MAX_BODY_SIZE, graceful_timeout=GRACEFUL_TIMEOUT):
+    """Serve the application with AsyncFrontend until SIGTERM or SIGINT"""
+    asyncio.run(AsyncFrontend(app, executor_workers, queue_size, retry_after, max_body_size,
+                              graceful_timeout).serve(host, port))
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+#  -*- coding: utf-8 -*-
+
+# Builtin imports
+import argparse
+import sys
+import time
+
+# Dependency imports
+import numpy as np
+
+# Local imports
+import image_proc
+import model
+import numpy_model
+from pipeline_benchmark import FONTS, WORD_LENGTHS, load_corpus
+
+BATCH_SIZES = (1, 8, 64)
+
+
+def load_letters():
+    """Letters of the words of pipeline_benchmark corpora, as a batch ready to be classified"""
+    batches = []
+    for fontname in FONTS:
+        for word_length in WORD_LENGTHS:
+            for _, b64 in load_corpus(fontname, word_length):
+                segmentation = image_proc.Segmentation(image_proc.preprocess_array(image_proc.b64_to_array(b64), False))
+                batches.append(segmentation.letters_batch(model.SIZE))
+    return np.concatenate(batches)
+
+
+def time_per_batch(function, batch, repeat):
+    """Best time over repeats of classifying the batch"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(batch)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Compare numpy and keras engines of the model: outputs and speed')
+    parser.add_argument("--weights", default="weights/comnist_keras_ru.hdf5", help="Weights of the russian model")
+    parser.add_argument("--repeat", default=10, type=int, help="Number of repeats, best one is kept")
+    parser.add_argument("--tolerance", default=1e-3, type=float,
+                        help="Fail if scores differ by more than this fraction of the largest score")
+    args = parser.parse_args()
+
+    nb_classes = 34
+    start = time.perf_counter()
+    numpy_engine = numpy_model.load_model(args.weights, nb_classes)
+    numpy_load_time = time.perf_counter() - start
+    start = time.perf_counter()
+    keras_model = model.load_model(args.weights, nb_classes)
+    keras_load_time = time.perf_counter() - start
+
+    def keras_engine(batch):
+        return keras_model(batch, training=False).numpy()
+
+    letters = load_letters()
+    keras_scores = keras_engine(letters)
+    numpy_scores = numpy_engine(letters)
+    max_difference = np.abs(keras_scores - numpy_scores).max()
+    scale = np.abs(keras_scores).max()
+    agreement = np.mean(keras_scores.argmax(axis=1) == numpy_scores.argmax(axis=1))
+
+    print(f'Loading (including imports): keras {keras_load_time:.2f} s, numpy {numpy_load_time:.2f} s')
+    print(f'{len(letters)} letters: max difference of scores {max_difference:.2e} (largest score {scale:.2e}), '
+          f'same most probable letter for {agreement:.2%}')
+    print('Batch size\tkeras, ms\tnumpy, ms')
+    for batch_size in BATCH_SIZES:
+        batch = letters[:batch_size]
+        print(f'{batch_size}\t\t{time_per_batch(keras_engine, batch, args.repeat) * 1e3:.2f}'
+              f'\t\t{time_per_batch(numpy_engine, batch, args.repeat) * 1e3:.2f}')
+
+    if max_difference > args.tolerance * scale:
+        print(f'Scores of numpy engine differ from keras by more than {args.tolerance:.0e} of the largest score',
+              file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+
+import collections
+import queue
+import threading
+import time
+
+import numpy as np
+
+
+class _Job:
+    """Letters of a single request waiting to be classified"""
+
+    def __init__(self, batch):
+        self.batch = batch
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class BatchScheduler:
+    """Collects letter tensors from concurrent requests and classifies them together
+
+    A batch is flushed once it holds at least max_batch_size letters or when max_wait seconds
+    passed since its first request arrived. Each request then gets back its own slice of the results.
+    """
+
+    def __init__(self, max_batch_size=64, max_wait=0.005, queue_depth=256):
+        """
+        :param max_batch_size: int
+            number of letters after which a batch is flushed without waiting
+        :param max_wait: float
+            maximal time in seconds a request waits for other requests to join its batch
+        :param queue_depth: int
+            maximal number of requests waiting to be batched, further requests block until there is room
+        """
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue_depth = queue_depth
+        self._queue = queue.Queue(maxsize=queue_depth)
+        self._forward = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._batch_sizes = collections.Counter()  # Number of letters in a batch -> number of such batches
+        self._requests_per_batch = collections.Counter()
+
+    def start(self, forward):
+        """Start batching calls of the forward pass
+
+        :param forward: function
+            function mapping an array of shape (N, ...) to an array of shape (N, ...)
+        :return: function
+            a function with the same signature as forward, which goes through the scheduler
+        """
+        if self._thread is not None:
+            raise RuntimeError('Batch scheduler is already started')
+        self._forward = forward
+        self._thread = threading.Thread(target=self._run, name='BatchScheduler', daemon=True)
+        self._thread.start()
+        return self.submit
+
+    def stop(self):
+        """Stop the scheduler once already queued requests are handled"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, batch):
+        """Classify letters of a request together with letters of concurrent requests
+
+        :param batch: numpy.ndarray
+            letters of the request
+        :return: numpy.ndarray
+            result of the forward pass for these letters
+        """
+        if self._thread is None:
+            raise RuntimeError('Batch scheduler is not started')
+        job = _Job(batch)
+        self._queue.put(job)
+        job.done.wait()
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+    def stats(self):
+        """Report batches actually achieved by the scheduler
+
+        :return: dict
+            number of batches, mean batch size and distributions of batch sizes (in letters and in requests)
+        """
+        with self._lock:
+            batch_sizes = dict(sorted(self._batch_sizes.items()))
+            requests_per_batch = dict(sorted(self._requests_per_batch.items()))
+        num_of_batches = sum(batch_sizes.values())
+        num_of_letters = sum(size * count for size, count in batch_sizes.items())
+        return {'max_batch_size': self.max_batch_size,
+                'max_wait': self.max_wait,
+                'queue_depth': self.queue_depth,
+                'batches': num_of_batches,
+                'mean_batch_size': num_of_letters / num_of_batches if num_of_batches != 0 else 0.,
+                'batch_sizes': batch_sizes,
+                'requests_per_batch': requests_per_batch}
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            jobs = [job]
+            size = len(job.batch)
+            deadline = time.monotonic() + self.max_wait
+            stop = False
+            while size < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    job = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if job is None:
+                    stop = True
+                    break
+                jobs.append(job)
+                size += len(job.batch)
+            self._flush(jobs)
+            if stop:
+                return
+
+    def _flush(self, jobs):
+        with self._lock:
+            self._batch_sizes[sum(len(job.batch) for job in jobs)] += 1
+            self._requests_per_batch[len(jobs)] += 1
+        try:
+            if len(jobs) == 1:
+                results = [self._forward(jobs[0].batch)]
+            else:
+                offsets = np.cumsum([len(job.batch) for job in jobs])[:-1]
+                results = np.split(self._forward(np.concatenate([job.batch for job in jobs])), offsets)
+            for job, result in zip(jobs, results):
+                job.result = result
+        except Exception as e:
+            for job in jobs:
+                job.error = e
+        for job in jobs:
+            job.done.set()
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+
+import collections
+
+import numpy as np
+
+import model
+
+BEAM_WIDTH = 64
+# Lowest probability left to letters which are not among the most probable ones
+MIN_PROBA = 1e-6
+
+
+def read_hunspell_words(dic_filename):
+    """Read words of a Hunspell dictionary (affix rules are not applied)
+
+    :param dic_filename: string
+        path to .dic file
+    :return: list
+        upper case words
+    """
+    with open(dic_filename, 'r', encoding='utf-8') as f:
+        lines = [line.strip() for line in f]
+    # First line is the number of words, flags follow the word after '/'
+    return [line.split('/', 1)[0].upper() for line in lines[1:] if len(line) != 0]
+
+
+class TrieDecoder:
+    """Find the most probable dictionary word given the most probable letters of each block of a word
+
+    Words are bucketed by length, since the number of blocks is known. Words of a length are stored as a trie,
+    level by level: nodes of a depth are sorted by parent then letter, so children of a node are a contiguous
+    range of the next depth, given by offsets. Levels are kept in compact arrays (4 bytes per node for offsets,
+    4 bytes for number of children and 1 byte for letter), the beam search expands the kept prefixes with a few
+    vectorized operations per letter: beams are small, so each NumPy call is mostly overhead and their number matters.
+    """
+
+    def __init__(self, words, alphabet, beam_width=BEAM_WIDTH):
+        """
+        :param words: iterable
+            words of the dictionary, words with letters out of the alphabet are skipped
+        :param alphabet: string
+            letters which can be recognized
+        :param beam_width: int
+            number of most probable prefixes kept at each letter
+        """
+        self.alphabet = alphabet
+        self.beam_width = beam_width
+        self._index = {letter: i for i, letter in enumerate(alphabet)}
+
+        words_by_length = collections.defaultdict(set)
+        for word in words:
+            if len(word) != 0 and all(letter in self._index for letter in word):
+                words_by_length[len(word)].add(word)
+
+        nb_letters = len(alphabet)
+        # Length -> for each depth, (offsets of children of nodes of the depth, their numbers of children,
+        # letters of nodes of the next depth)
+        self._levels = dict()
+        self._words = dict()  # Length -> list of words, in order of their nodes
+        for length, group in words_by_length.items():
+            codes = np.array(sorted([self._index[letter] for letter in word] for word in group), dtype=np.int64)
+            levels = []
+            parents = np.zeros(len(codes), dtype=np.int64)
+            nb_parents = 1
+            for depth in range(length):
+                keys, parents = np.unique(parents * nb_letters + codes[:, depth], return_inverse=True)
+                offsets = np.searchsorted(keys // nb_letters, np.arange(nb_parents + 1)).astype(np.int32)
+                levels.append((offsets, np.diff(offsets), (keys % nb_letters).astype(np.uint8)))
+                nb_parents = len(keys)
+            self._levels[length] = levels
+            self._words[length] = [''.join(alphabet[i] for i in word) for word in codes]
+        # Kept prefixes have at most this number of children
+        self._positions = np.arange(beam_width * nb_letters)
+
+    def __len__(self):
+        return sum(len(words) for words in self._words.values())
+
+    def letters_log_proba(self, candidates, proba=None):
+        """Log probability of every letter of the alphabet for each block
+
+        :param candidates: numpy.ndarray
+            array of shape (number of blocks, n) of the n most probable letters of each block
+        :param proba: numpy.ndarray
+            probabilities of the candidates, if not supplied each candidate is twice less probable than the previous one
+        :return: numpy.ndarray
+            array of shape (number of blocks, number of letters)
+        """
+        candidates = np.asarray(candidates)
+        nb_blocks = len(candidates)
+        nb_candidates = candidates.shape[1] if candidates.ndim == 2 else 0
+        candidates = candidates.reshape(nb_blocks, nb_candidates)
+        if proba is None:
+            proba = np.broadcast_to(0.5 ** np.arange(1, nb_candidates + 1), candidates.shape)
+        else:
+            proba = np.asarray(proba, dtype=float).reshape(candidates.shape)
+        # Letters which are not among candidates share the probability left
+        rest = np.maximum(1 - proba.sum(axis=1), MIN_PROBA) / max(len(self.alphabet) - nb_candidates, 1)
+        log_proba = np.empty((nb_blocks, len(self.alphabet)))
+        log_proba[:] = np.log(rest)[:, np.newaxis]
+        codes = np.array([self._index.get(letter, -1) for letter in candidates.ravel().tolist()], dtype=np.int64)
+        known = codes != -1
+        blocks = np.repeat(np.arange(nb_blocks), nb_candidates)[known]
+        np.maximum.at(log_proba, (blocks, codes[known]), np.log(np.maximum(proba.ravel()[known], MIN_PROBA)))
+        return log_proba
+
+    def decode(self, candidates, proba=None):
+        """Beam search of the most probable dictionary word
+
+        :param candidates: numpy.ndarray
+            array of shape (number of blocks, n) of the n most probable letters of each block, as returned by word predictor
+        :param proba: numpy.ndarray
+            probabilities of the candidates (see letters_log_proba)
+        :return: string
+            the most probable word of the dictionary with as many letters as blocks, None if there is no such word
+        """
+        levels = self._levels.get(len(candidates))
+        if levels is None:
+            return None
+
+        # Nodes and log probabilities of the most probable prefixes
+        states = np.zeros(1, dtype=np.int64)
+        scores = np.zeros(1)
+        for (offsets, nb_children, letters), letters_log_proba in zip(levels, self.letters_log_proba(candidates, proba)):
+            # Expand every kept prefix to all its children, parents are the positions of their prefixes in the beam
+            counts = nb_children[states]
+            parents = np.repeat(self._positions[:len(states)], counts)
+            total = len(parents)
+            # Children of a prefix follow each other, from its first child at the position where they start
+            first = offsets[states] + counts - np.add.accumulate(counts)
+            children = first[parents] + self._positions[:total]
+            children_scores = scores[parents] + letters_log_proba[letters[children]]
+            if total > self.beam_width:
+                best = np.argpartition(children_scores, total - self.beam_width)[total - self.beam_width:]
+                children, children_scores = children[best], children_scores[best]
+            states, scores = children, children_scores
+        return self._words[len(candidates)][states[np.argmax(scores)]]
+
+
+def load_decoder(dic_filename, lang_in, beam_width=BEAM_WIDTH):
+    """Create a decoder of words of the language from a Hunspell dictionary
+
+    :param dic_filename: string
+        path to .dic file
+    :param lang_in: string
+        language in which the letters are written
+    :return: TrieDecoder
+    """
+    alphabet = model.language_letters(lang_in)
+    if lang_in == 'ru':
+        alphabet = alphabet.replace('I', '')  # 'I' is a misrecognition of 'Ы', not a letter
+    decoder = TrieDecoder(read_hunspell_words(dic_filename), alphabet, beam_width)
+
+    print(f"Successfully loaded {len(decoder)} words from dictionary '{dic_filename}'")
+
+    return decoder
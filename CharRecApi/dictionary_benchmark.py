@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+#  -*- coding: utf-8 -*-
+
+# Builtin imports
+import argparse
+import os
+import random
+import sys
+import time
+
+# Dependency imports
+import numpy as np
+
+# Local imports
+import dictionary
+
+DIC_FILENAME = os.path.join('..', 'RecognEstimator', 'Hunspell disctionaries', 'ru_RU.dic')
+PROBA = (0.6, 0.25, 0.1)
+
+
+def noisy_candidates(word, alphabet, rng):
+    """Candidates as the model could give them: right letter first (70%), second (20%) or missing (10%)
+
+    :return: (numpy.ndarray, numpy.ndarray)
+        candidates and their probabilities, of shape (len(word), len(PROBA))
+    """
+    candidates = []
+    for letter in word:
+        others = rng.sample([other for other in alphabet if other != letter], len(PROBA))
+        draw = rng.random()
+        if draw < 0.7:
+            candidates.append([letter] + others[:-1])
+        elif draw < 0.9:
+            candidates.append(others[:1] + [letter] + others[1:-1])
+        else:
+            candidates.append(others)
+    return np.array(candidates), np.array([PROBA] * len(word))
+
+
+def time_per_word(function, samples, repeat):
+    """Best time over repeats of calling the function on candidates and probabilities of each word, in microseconds"""
+    times = []
+    for _, candidates, proba in samples:
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function(candidates, proba)
+            best = min(best, time.perf_counter() - start)
+        times.append(best)
+    return np.array(times) * 1e6
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Time decoding of dictionary words')
+    parser.add_argument("--dictionary", default=DIC_FILENAME, help="Hunspell dictionary")
+    parser.add_argument("--words", default=2000, type=int, help="Number of words to decode")
+    parser.add_argument("--beam-width", default=dictionary.BEAM_WIDTH, type=int, help="Width of the beam search")
+    parser.add_argument("--repeat", default=3, type=int, help="Number of repeats of each word, best one is kept")
+    parser.add_argument("--max-p99", default=1000., type=float,
+                        help="Fail if 99th percentile of decoding time is not below this number of microseconds")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    decoder = dictionary.load_decoder(args.dictionary, 'ru', args.beam_width)
+    print(f'Loading: {time.perf_counter() - start:.2f} s')
+
+    rng = random.Random(0)
+    words = rng.sample(dictionary.read_hunspell_words(args.dictionary), args.words)
+    words = [word for word in words if all(letter in decoder.alphabet for letter in word)]
+    samples = [(word,) + noisy_candidates(word, decoder.alphabet, rng) for word in words]
+
+    found = sum(decoder.decode(candidates, proba) == word for word, candidates, proba in samples)
+    print(f'{len(samples)} words with noisy candidates: {found / len(samples):.1%} decoded right')
+    print('Stage\t\t\tmedian, us\t99th percentile, us')
+    # Log probabilities of letters are part of decoding, timed alone too
+    times = time_per_word(decoder.letters_log_proba, samples, args.repeat)
+    print(f'letters_log_proba\t{np.median(times):.0f}\t\t{np.percentile(times, 99):.0f}')
+    times = time_per_word(decoder.decode, samples, args.repeat)
+    p99 = np.percentile(times, 99)
+    print(f'decode\t\t\t{np.median(times):.0f}\t\t{p99:.0f}')
+    if p99 >= args.max_p99:
+        print(f'99th percentile of decoding time is {p99:.0f} us, not below {args.max_p99:.0f} us', file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+#  -*- coding: utf-8 -*-
+
+# Builtin imports
+import argparse
+import sys
+import time
+
+# Dependency imports
+import numpy as np
+
+# Local imports
+import graph_model
+import model
+from backend_benchmark import load_letters, time_per_batch
+
+# Bucket sizes and sizes in between, which are padded
+BATCH_SIZES = (1, 3, 4, 10, 16, 40, 64, 100, 256, 300)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Compare eager keras model with graph functions compiled per batch size')
+    parser.add_argument("--weights", default="weights/comnist_keras_ru.hdf5", help="Weights of the russian model")
+    parser.add_argument("--repeat", default=20, type=int, help="Number of repeats, best one is kept")
+    parser.add_argument("--tolerance", default=1e-4, type=float,
+                        help="Fail if scores differ by more than this fraction of the largest score")
+    args = parser.parse_args()
+
+    nb_classes = 34
+    keras_model = model.load_model(args.weights, nb_classes)
+    start = time.perf_counter()
+    graph_engine = graph_model.BucketedModel(keras_model)
+    compile_time = time.perf_counter() - start
+
+    def eager_engine(batch):
+        return keras_model(batch, training=False).numpy()
+
+    letters = load_letters()
+    while len(letters) < max(BATCH_SIZES):
+        letters = np.concatenate([letters, letters])
+    tracing_count = graph_engine.tracing_count()
+
+    eager_scores = eager_engine(letters)
+    graph_scores = graph_engine(letters)
+    max_difference = np.abs(eager_scores - graph_scores).max()
+    scale = np.abs(eager_scores).max()
+    for batch_size in BATCH_SIZES:
+        # Padding must not change scores of the letters of a batch
+        max_difference = max(max_difference, np.abs(eager_scores[:batch_size] - graph_engine(letters[:batch_size])).max())
+
+    print(f'Compiling functions for batches of {graph_engine.buckets}: {compile_time:.2f} s')
+    print(f'{len(letters)} letters: max difference of scores {max_difference:.2e} (largest score {scale:.2e})')
+    print('Batch size\tbucket\t\teager, ms\tgraph, ms')
+    for batch_size in BATCH_SIZES:
+        batch = letters[:batch_size]
+        eager_time = time_per_batch(eager_engine, batch, args.repeat)
+        graph_time = time_per_batch(graph_engine, batch, args.repeat)
+        print(f'{batch_size}\t\t{graph_engine.bucket(batch_size)}\t\t{eager_time * 1e3:.2f}\t\t{graph_time * 1e3:.2f}'
+              f'\t({eager_time / graph_time:.1f}x)')
+
+    failed = False
+    if max_difference > args.tolerance * scale:
+        print(f'Scores of graph functions differ from eager model by more than {args.tolerance:.0e} of the largest score',
+              file=sys.stderr)
+        failed = True
+    if graph_engine.tracing_count() != tracing_count:
+        print(f'Graph functions were traced again: {graph_engine.tracing_count() - tracing_count} times after warm up',
+              file=sys.stderr)
+        failed = True
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+import bisect
+
+import numpy as np
+import tensorflow as tf
+
+import model
+
+# Batch sizes graph functions are compiled for, batches of other sizes are split and padded to them
+BATCH_BUCKETS = (1, 4, 16, 64, 256)
+
+
+class BucketedModel:
+    """Keras model computed by graph functions, one per batch size of the buckets
+
+    Calling it on a batch of letters of shape (N, SIZE, SIZE, 1) returns scores of classes of shape (N, number of classes).
+    Functions are traced and run once when the model is created, batches are split into buckets and padded with blank
+    letters (see bucket), so that calls never trace again nor pay the per-layer overhead of eager execution
+    """
+
+    def __init__(self, keras_model, buckets=BATCH_BUCKETS):
+        """
+        :param keras_model: keras.model
+            model as returned by model.load_model
+        :param buckets: tuple
+            batch sizes to compile functions for
+        """
+        self.buckets = sorted(buckets)
+        self.nb_classes = keras_model.output_shape[-1]
+        self._function = tf.function(lambda x: keras_model(tf.cast(x, tf.float32), training=False))
+        self._functions = {}
+        for bucket in self.buckets:
+            self._functions[bucket] = self._function.get_concrete_function(
+                tf.TensorSpec([bucket, model.SIZE, model.SIZE, 1], tf.uint8))
+            # First run optimizes the graph
+            self._functions[bucket](tf.zeros([bucket, model.SIZE, model.SIZE, 1], tf.uint8))
+
+    def tracing_count(self):
+        """Number of times functions were traced, it does not change after creation of the model"""
+        return self._function.experimental_get_tracing_count()
+
+    def bucket(self, batch_size):
+        """Batch size of the function computing the first letters of a batch of this size
+
+        Batch is padded up to the nearest bucket if at least half of it is letters, otherwise the largest bucket
+        it fills is computed first and the rest of the batch next
+        """
+        index = bisect.bisect_left(self.buckets, batch_size)
+        if index == len(self.buckets):
+            return self.buckets[-1]
+        if self.buckets[index] <= 2 * batch_size or index == 0:
+            return self.buckets[index]
+        return self.buckets[index - 1]
+
+    def __call__(self, batch):
+        batch = np.asarray(batch, dtype=np.uint8)
+        scores = np.empty((len(batch), self.nb_classes), dtype=np.float32)
+        start = 0
+        while start < len(batch):
+            bucket = self.bucket(len(batch) - start)
+            chunk = batch[start:start + bucket]
+            if bucket != len(chunk):
+                padded = np.full((bucket,) + chunk.shape[1:], 255, dtype=np.uint8)
+                padded[:len(chunk)] = chunk
+                chunk = padded
+            size = min(bucket, len(batch) - start)
+            scores[start:start + size] = self._functions[bucket](tf.constant(chunk)).numpy()[:size]
+            start += size
+        return scores
+
+def load_model(weights_filename, nb_classes, buckets=BATCH_BUCKETS):
+    """Get the letter classification model computed by graph functions, compiled for all buckets
+
+    :param weights_filename: string
+        path to the training weigths
+    :param nb_classes: int
+        number of expected output classes
+    :return: BucketedModel
+    """
+    bucketed = BucketedModel(model.load_model(weights_filename, nb_classes), buckets)
+
+    print(f"Compiled graph functions of the model for batches of {', '.join(map(str, bucketed.buckets))} letters")
+
+    return bucketed
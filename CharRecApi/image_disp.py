@@ -1,11 +1,34 @@
 # -*- coding: utf-8 -*-
 
+import functools
+
 import numpy as np
 from PIL import Image, ImageDraw
 
 import image_proc
 
 q_mark_path = "assets/q_mark.png"
+_q_mark_im = None  # Question mark image, read on first use
+
+
+@functools.lru_cache(maxsize=256)
+def q_mark(width, height, col=128):
+    """Question mark scaled to the size, cached by size and color
+
+    :param col: int
+        the color of the question mark (0 = black, 255 = white)
+    :return: numpy.ndarray
+        read-only array of shape (height, width)
+    """
+    global _q_mark_im
+    if _q_mark_im is None:
+        with Image.open(q_mark_path) as image:
+            _q_mark_im = image.convert("L")
+    question_mark = np.array(_q_mark_im.resize((width, height)))
+    question_mark[question_mark == 0] = col
+    question_mark.flags.writeable = False
+    return question_mark
+
 
 def draw_contours(im):
     """Draw gray contours around the letters
@@ -29,7 +52,7 @@ def draw_contours(im):
     return im
 
 
-def gray_out_letter(im, pos=None, col=192):
+def gray_out_letter(im, pos=None, col=192, segmentation=None):
     """Replace any non white color within letter contours with gray
 
     :param im: PIL.Image
@@ -37,13 +60,15 @@ def gray_out_letter(im, pos=None, col=192):
         a list of positions of letters which are incorrect
     :param col: int
         the new color of the incorrect letter (0 = black, 255 = white)
+    :param segmentation: image_proc.Segmentation
+        letters found on the image (computed if not supplied)
     :return: PIL.Image
         the modified image with grayed out incorrect letters
     """
 
     if pos is None:
         pos = [0]
-    contours = image_proc.get_contours(im)
+    contours = image_proc.get_contours(im) if segmentation is None else segmentation.contours
     npim = np.array(im)
     for p in pos:
         left, low, right, high = contours[p, :]
@@ -54,7 +79,27 @@ def gray_out_letter(im, pos=None, col=192):
     return im2
 
 
-def flag_missing_letter(im, pos=None, col=128):
+def missing_letter_boxes(spaces, pos):
+    """Areas flagging missing letters: spaces at the positions, cut to the average width of letters
+
+    :param spaces: numpy.ndarray
+        spaces between letters as returned by image_proc.get_spaces
+    :param pos: list
+        list of the positions which miss a letter
+    :return: numpy.ndarray
+        array of shape (len(pos), 4) of left, low, right and high coordinates of each area
+        (question mark fills rows from low to high excluded, columns from left to right included)
+    """
+    # Compute average letter width
+    total_width = np.sum(spaces[1:, 0] - spaces[:-1, 2])
+    average_width = int(np.floor(total_width / (spaces.shape[0] - 1)))
+
+    boxes = spaces[np.asarray(pos, dtype=int)].reshape(-1, 4)
+    boxes[:, 2] = np.minimum(boxes[:, 2], boxes[:, 0] + average_width)
+    return boxes
+
+
+def flag_missing_letter(im, pos=None, col=128, segmentation=None):
     """Flags missing letters wherever they occur
 
     :param im: PIL.Image
@@ -62,36 +107,21 @@ def flag_missing_letter(im, pos=None, col=128):
         list of the positions which miss a letter
     :param col: int
         the color of the question mark (0 = black, 255 = white)
+    :param segmentation: image_proc.Segmentation
+        letters found on the image (computed if not supplied)
     :return: PIL.Image
         the modified image with question mark flagging missing letters
     """
-    # Load question mark image
     if pos is None:
         pos = [0]
-    with Image.open(q_mark_path) as image:
-        q_mark_im = image.copy()
-    q_mark_im = q_mark_im.convert("L")
 
     # Get positions of spaces between letters
-    spaces = image_proc.get_spaces(im)
+    spaces = image_proc.get_spaces(im) if segmentation is None else segmentation.spaces
     npim = np.array(im)
 
-    # Compute average letter width
-    total_width = 0
-    for i in range(1,spaces.shape[0]):
-        total_width += spaces[i,0] - spaces[i-1,2]
-    average_width = int(np.floor(total_width / (spaces.shape[0] - 1)))
-
     # Add question marks
-    for i, p in enumerate(pos):
-        left, low, right, high = spaces[p, :]
-        if right-left > average_width:
-            right = left+average_width
-        question_mark_im = q_mark_im.resize((right + 1 - left,high - low))
-        question_mark = np.array(question_mark_im)
-        question_mark[question_mark == 0] = col
-
-        npim[low:high, left:right + 1] = question_mark
+    for left, low, right, high in missing_letter_boxes(spaces, pos):
+        npim[low:high, left:right + 1] = q_mark(right + 1 - left, high - low, col)
     im2 = Image.fromarray(npim)
     return im2
 
@@ -1,8 +1,8 @@
 # -*- coding: utf-8 -*-
 
 import base64
+import functools
 import io
-import difflib
 import re
 import sys
 
@@ -12,6 +12,7 @@ import cv2
 # import matplotlib.pyplot as plt
 
 import image_disp
+import scoring
 
 def load(imfile="Greg.png"):
     """
@@ -67,9 +68,56 @@ def last_position(im, start_position, blank, horizontal):
     return start_position + (len(inverted_intensity) - next_lim)
 
 
+# Letters found by get_contours on an image, further ones are ignored
+MAX_NB_LETTERS = 150
+
+
 def get_contours(im):
     """
     Identifies letters contours for our image
+    Column and row projection profiles are computed once, letters are found as runs of non blank columns
+    Returns an array with upper left and lower right coordinate of each box
+    (same boxes as get_contours_legacy)
+    """
+    npim = np.asarray(im)
+    height, width = npim.shape[:2]
+    ink = npim < 255
+
+    # horizontal_countours: runs of columns containing at least one non white pixel
+    is_letter_column = ink.any(axis=0).astype(np.int8)
+    edges = np.diff(np.concatenate(([0], is_letter_column, [0])))
+    left_lims = np.flatnonzero(edges == 1)
+    right_lims = np.flatnonzero(edges == -1)
+    if len(left_lims) > MAX_NB_LETTERS:
+        left_lims = left_lims[:MAX_NB_LETTERS]
+        right_lims = right_lims[:MAX_NB_LETTERS]
+    elif len(left_lims) != 0 and right_lims[-1] == width:
+        # Scan of get_contours_legacy stops without adding a last letter which is next to right frame
+        # when this letter starts exactly where the scan resumed
+        scan_start = right_lims[-2] + 1 if len(right_lims) > 1 else 0
+        if left_lims[-1] == scan_start:
+            left_lims = left_lims[:-1]
+            right_lims = right_lims[:-1]
+
+    boxes = np.empty((len(left_lims), 4), dtype=int)
+    boxes[:, 0] = left_lims
+    boxes[:, 2] = right_lims
+
+    # vertical_countours: rows containing ink between left and right limits of each letter
+    ink_per_row = np.zeros((height, width + 1), dtype=np.int32)
+    np.cumsum(ink, axis=1, out=ink_per_row[:, 1:])
+    is_letter_row = (ink_per_row[:, right_lims] - ink_per_row[:, left_lims]) > 0
+    has_ink = is_letter_row.any(axis=0)
+    boxes[:, 1] = np.argmax(is_letter_row, axis=0)
+    boxes[:, 3] = np.where(has_ink, height - np.argmax(is_letter_row[::-1], axis=0), height)
+
+    return boxes
+
+
+def get_contours_legacy(im):
+    """
+    Identifies letters contours for our image by scanning it letter by letter
+    Reference implementation of get_contours (kept for benchmarking and cross-checking)
     Returns an array with upper left and lower right coordinate of each box
     """
     max_nb_letters = 150
@@ -117,14 +165,74 @@ def get_contours(im):
     return boxes
 
 
-def get_spaces(im):
+# Runs of rows with ink lower than this part of the median run are marks of letters, not lines
+LINE_MARK_RATIO = 0.5
+# Gaps between letters are spaces if wider than this part of height of the line and than this times the median gap
+SPACE_RATIO = 0.25
+SPACE_GAP_RATIO = 2
+
+
+def get_lines(im):
+    """
+    Identifies text lines of our image from its row projection profile
+    Runs of rows containing ink are lines, except runs much lower than the others (marks of letters like Й or Ё)
+    which belong to the nearest line
+    Returns an array with top and bottom row of each line, lines are cut halfway between them so that they cover the image
+    """
+    npim = np.asarray(im)
+    height = npim.shape[0]
+    is_ink_row = (npim < 255).any(axis=1).astype(np.int8)
+    edges = np.diff(np.concatenate(([0], is_ink_row, [0])))
+    tops = np.flatnonzero(edges == 1)
+    bottoms = np.flatnonzero(edges == -1)
+    if len(tops) == 0:
+        return np.empty((0, 2), dtype=int)
+
+    heights = bottoms - tops
+    is_line = heights >= LINE_MARK_RATIO * np.median(heights)
+    line_tops, line_bottoms = tops[is_line], bottoms[is_line]
+    for top, bottom in zip(tops[~is_line], bottoms[~is_line]):
+        distances = np.maximum(line_tops - bottom, top - line_bottoms)
+        nearest = np.argmin(distances)
+        line_tops[nearest] = min(line_tops[nearest], top)
+        line_bottoms[nearest] = max(line_bottoms[nearest], bottom)
+
+    cuts = np.concatenate(([0], (line_bottoms[:-1] + line_tops[1:]) // 2, [height]))
+    return np.stack((cuts[:-1], cuts[1:]), axis=1)
+
+
+def get_words(im, contours=None):
+    """
+    Identifies words of a text line of our image
+    Gaps between letters much wider than usual ones and wide compared to height of the line are spaces
+    Contours of letters are computed with get_contours if not supplied
+    Returns an array with left and right column of each word, words are cut in the middle of spaces
+    so that they cover the image
+    """
+    width = im.shape[1] if isinstance(im, np.ndarray) else im.width
+    if contours is None:
+        contours = get_contours(im)
+    if len(contours) < 2:
+        return np.array([[0, width]])
+
+    gaps = contours[1:, 0] - contours[:-1, 2]
+    line_height = contours[:, 3].max() - contours[:, 1].min()
+    is_space = (gaps > SPACE_RATIO * line_height) & (gaps > SPACE_GAP_RATIO * np.median(gaps))
+    cuts = (contours[:-1, 2][is_space] + contours[1:, 0][is_space]) // 2
+    cuts = np.concatenate(([0], cuts, [width]))
+    return np.stack((cuts[:-1], cuts[1:]), axis=1)
+
+
+def get_spaces(im, contours=None):
     """
     Identifies spaces contours for our image
     There is always one more space than number of letters
+    Contours of letters are computed with get_contours if not supplied
     Returns an array with upper left and lower right coordinate of each box
     """
-    width = im.width
-    contours = get_contours(im)
+    width = im.shape[1] if isinstance(im, np.ndarray) else im.width
+    if contours is None:
+        contours = get_contours(im)
 
     nb_cont = contours.shape[0]
     spaces = np.empty((nb_cont + 1, 4), dtype=int)
@@ -142,36 +250,56 @@ def get_space_loc(diff, miss, length):
     Identify the locations of the missing letters
     Returns an array of space positions, with 1 = missing, O = ok
     """
-    diff2 = np.zeros(len(diff))
-    j = 1
-    for i in range(len(diff)):
-        if diff[i] == 0:
-            diff2[i] = j
-            j += 1
-
-    miss2 = np.zeros(len(miss))
-    j = 1
-    for i in range(len(miss)):
-        if miss[i] == 0:
-            miss2[i] = j
-            j += 1
-
+    diff = np.asarray(diff)
+    miss = np.asarray(miss)
     pos_miss = np.zeros(length + 1, dtype=int)
-    prev = 1
-    for i, val in enumerate(miss2):
-        if i == 0 and miss[0] == 1:
-            pos_miss[0] = 1
-        if val == 0 and prev != 0 and i > 0:
-            index = np.where(diff2 == prev)[0]
-            pos_miss[index + 1] = 1
-        prev = val
+    if len(miss) != 0 and miss[0] == 1:
+        pos_miss[0] = 1
+    # Each run of missing letters after a matched letter is flagged after the match of that letter in the read word
+    starts = np.flatnonzero((miss[1:] == 1) & (miss[:-1] == 0)) + 1
+    ranks = np.cumsum(miss == 0)[starts - 1]
+    pos_miss[np.flatnonzero(diff == 0)[ranks - 1] + 1] = 1
     return pos_miss
 
 
-def crop_letters(im):
-    """Crop letters according to get_contours
+def crop_letters(im, contours=None):
+    """Crop letters according to get_contours (or according to supplied contours)
     """
-    return [pad_resize(im.crop(contour), -1) for contour in get_contours(im)]
+    if contours is None:
+        contours = get_contours(im)
+    return [pad_resize(im.crop(contour), -1) for contour in contours]
+
+
+class Segmentation:
+    """Letters found on an image: contours of letters, spaces between them and cropped letters
+
+    Computed once per image and shared by recognition and scoring,
+    spaces and cropped letters are computed on first access
+    """
+
+    def __init__(self, im, contours=None):
+        """
+        :param im: PIL.Image or numpy.ndarray
+            grayscale image of a word
+        :param contours: numpy.ndarray
+            contours of letters if already known (e.g. from the line of the word), computed with get_contours otherwise
+        """
+        self.im = im
+        self.npim = np.asarray(im)
+        self.contours = get_contours(self.npim) if contours is None else contours
+
+    @functools.cached_property
+    def spaces(self):
+        return get_spaces(self.npim, self.contours)
+
+    @functools.cached_property
+    def letters(self):
+        im = self.im if isinstance(self.im, PIL.Image.Image) else PIL.Image.fromarray(self.npim)
+        return crop_letters(im, self.contours)
+
+    def letters_batch(self, size, out=None):
+        """Letters resized to squares ready to be classified (see letters_to_batch)"""
+        return letters_to_batch(self.npim, self.contours, size, out)
 
 
 def crop_resize(im, size):
@@ -244,7 +372,36 @@ def pad_resize(im, size):
     # plt.figure(); plt.imshow(img); plt.show()
     return img
 
-def score_word(word_in, words_out, img):
+def compare_word(word_in, words_out):
+    """
+    Compares expected word and read word, finds discrepancies without drawing them
+
+    :param word_in: string
+        the expected word
+    :param words_out: numpy.ndarray
+        the most probable letters of the read word (one row per letter)
+    :return: [numpy.ndarray, numpy.ndarray, int]
+        positions of wrong letters of the read word, positions of spaces of the read word which miss a letter
+        (as rows of get_spaces: 0 is before the first letter) and flag if the read word is the expected one
+    """
+    # Get the most likely word
+    word_out = ''.join(list(words_out[:,0]))
+
+    # Handle case with expected/predicted of equal length
+    if len(word_in) == len(word_out):
+        diff = np.array([word_in[i] not in ''.join(list(words_out[i, :])) for i in range(len(word_in))], dtype=bool)
+        # If no discrepancy exists, pretend the predicted word is exactly what was expected
+        return np.flatnonzero(diff), np.empty(0, dtype=int), int(not diff.any())
+
+    # Handle case with expected/predicted of different length
+    matched_in, matched_out = scoring.matching_masks([word_in], [word_out])
+    diff = np.logical_not(matched_out[0]).astype(int)
+    miss = np.logical_not(matched_in[0]).astype(int)
+    space_pos_miss = get_space_loc(diff, miss, len(word_out))
+    return np.flatnonzero(diff == 1), np.flatnonzero(space_pos_miss == 1), 0
+
+
+def score_word(word_in, words_out, img, segmentation=None):
     """
     Compares expected word and read word, flag discrepancies
 
@@ -252,64 +409,45 @@ def score_word(word_in, words_out, img):
         the expected word
     :param words_out: string
         the read word
-    :param img: PIL.Image
+    :param img: PIL.Image or numpy.ndarray
         the original image
+    :param segmentation: Segmentation
+        letters found on the original image (computed if not supplied)
     :return: [PIL.Image, int]
         in case of discrepancies, an image highlighting wrong/missing letters
         otherwise returns image unchanged, and flag if it changed
     """
-    correct = 0
+    if isinstance(img, np.ndarray):
+        img = PIL.Image.fromarray(img)
+    wrong, missing, correct = compare_word(word_in, words_out)
 
-    # Get the most likely word
-    word_out = ''.join(list(words_out[:,0]))
-
-    # Handle case with expected/predicted of equal length
-    diff = np.zeros(len(word_out))
-    if len(word_in) == len(word_out):
-        for i in range(len(word_in)):
-            options = ''.join(list(words_out[i,:]))
-            if word_in[i] not in options:
-                diff[i] = 1
-        # If discrepancies exist, gray out wrong letters
-        if sum(diff) != 0:
-            img = image_disp.gray_out_letter(img, *np.where(diff == 1))
-        # Else pretend the predicted word is exactly what was expected
-        else:
-            correct = 1
+    # Draw contours
+    # img = image_disp.draw_contours(img)
 
-    # Handle case with expected/predicted of different length
-    else:
-        s = difflib.SequenceMatcher(None, word_in, word_out)
-        match = s.get_matching_blocks()
-        diff = np.ones(len(word_out))
-        miss = np.ones(len(word_in))
-        for i in range(len(match) - 1):
-            low_miss = match[i][0]
-            low_diff = match[i][1]
-            high = match[i][2]
-            diff[low_diff:low_diff + high] = 0
-            miss[low_miss:low_miss + high] = 0
-
-        # Draw contours
-        # img = image_disp.draw_contours(img)
-
-        # Gray out wrong letters
-        img = image_disp.gray_out_letter(img, *np.where(diff == 1))
-        # Flag missing letters
-        if len(word_in) != len(word_out):
-            space_pos_miss = get_space_loc(diff, miss, len(word_out))
-            img = image_disp.flag_missing_letter(img, *np.where(space_pos_miss == 1))
+    # Gray out wrong letters
+    if len(wrong) != 0:
+        img = image_disp.gray_out_letter(img, wrong, segmentation=segmentation)
+    # Flag missing letters
+    if len(missing) != 0:
+        img = image_disp.flag_missing_letter(img, missing, segmentation=segmentation)
 
     return img, correct
 
 
-def img_to_b64(img):
+# zlib level of PNG images sent back, as PIL default
+PNG_COMPRESS_LEVEL = 6
+
+
+def img_to_b64(img, compress_level=PNG_COMPRESS_LEVEL):
     """
     Helper function
-    Converts image to base64
+    Converts image (or grayscale numpy.ndarray) to base64 PNG
+    compress_level is zlib level of PNG, from 0 (fastest, largest) to 9 (slowest, smallest)
     """
+    if isinstance(img, np.ndarray):
+        img = PIL.Image.fromarray(img)
     in_mem_file = io.BytesIO()
-    img.save(in_mem_file, format="PNG")  # Or jpeg
+    img.save(in_mem_file, format="PNG", compress_level=compress_level)  # Or jpeg
     in_mem_file.seek(0)
     img_bytes = in_mem_file.read()
 
@@ -336,6 +474,20 @@ def b64_remove_header(im):
         img = re.sub(r'data:image/[^;]+;base64,', r'', img)
     return img
 
+def bytes_to_img(data, width=None, height=None):
+    """
+    Helper function
+    Converts binary image to image
+    If width and height are supplied, data is a raw buffer of 8-bit grayscale pixels,
+    otherwise it is an encoded image file (e.g. PNG)
+    """
+    if width is not None and height is not None:
+        npim = np.frombuffer(data, dtype=np.uint8)
+        if npim.size != width * height:
+            raise AttributeError(f'Raw image of {npim.size} bytes does not match size {width}x{height}')
+        return PIL.Image.fromarray(npim.reshape((height, width)))
+    return PIL.Image.open(io.BytesIO(data))
+
 def b64_preprocess(im, is_binarize):
     """Converts b64 image to Image and ensure it has proper background/properties
 
@@ -343,9 +495,14 @@ def b64_preprocess(im, is_binarize):
     :param is_binarize if image must be binarized
     :return: img: image
     """
+    return preprocess(b64_to_img(im), is_binarize)
+
+def to_grayscale(img):
+    """Converts image to grayscale, adding a background to transparent image
 
-    # Convert to object of class Image
-    img = b64_to_img(im)
+    :param img: image
+    :return: img: grayscale image
+    """
 
     # Add a white background to the image
     if img.mode == 'RGBA' or img.mode == 'RGBa':
@@ -355,7 +512,17 @@ def b64_preprocess(im, is_binarize):
         except Exception as e:
             print(f'Warning! When trying to add background catch exception {repr(e)}', file=sys.stderr)
 
-    img = img.convert("L")
+    return img.convert("L")
+
+def preprocess(img, is_binarize):
+    """Ensure image has proper background/properties
+
+    :param img: image
+    :param is_binarize if image must be binarized
+    :return: img: image
+    """
+
+    img = to_grayscale(img)
 
     # Get negative of image in case it is white on black
     if np.mean(np.array(img)) < 128:
@@ -371,3 +538,155 @@ def b64_preprocess(im, is_binarize):
         img = PIL.Image.fromarray(img_bin)
 
     return img
+
+
+# Preprocessing of numpy.ndarray
+# Same results as PIL based functions above, but images stay uint8 numpy.ndarray from decoding to letters resized for the model
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\x0a'
+# Number of channels decoded by OpenCV for 8-bit PNG by PNG color type (other PNG are decoded by PIL)
+PNG_CHANNELS = {0: 1, 2: 3, 6: 4}  # Grayscale, RGB, RGBA
+
+RESAMPLE_PRECISION_BITS = 32 - 8 - 2
+
+
+def bytes_to_array(data, width=None, height=None):
+    """Converts binary image to grayscale numpy.ndarray, same as to_grayscale(bytes_to_img(...))
+
+    :param data: encoded image file (e.g. PNG) or if width and height are supplied, raw buffer of 8-bit grayscale pixels
+    :return: numpy.ndarray
+        uint8 array of shape (height, width)
+    """
+    if width is not None and height is not None:
+        npim = np.frombuffer(data, dtype=np.uint8)
+        if npim.size != width * height:
+            raise AttributeError(f'Raw image of {npim.size} bytes does not match size {width}x{height}')
+        return npim.reshape((height, width))
+
+    if len(data) > 25 and data[:8] == PNG_SIGNATURE and data[24] == 8 and data[25] in PNG_CHANNELS:
+        npim = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+        if npim is not None and npim.dtype == np.uint8 and (1 if npim.ndim == 2 else npim.shape[2]) == PNG_CHANNELS[data[25]]:
+            if npim.ndim == 2:
+                return npim
+            bgr = npim[:, :, :3].astype(np.uint32)
+            if npim.shape[2] == 4:
+                # Blend with white background with rounding of PIL paste
+                alpha = npim[:, :, 3:].astype(np.uint32)
+                bgr = bgr * (255 - alpha) + 255 * alpha + 128
+                bgr = ((bgr >> 8) + bgr) >> 8
+            # Luma with coefficients and rounding of PIL convert("L")
+            return ((bgr[:, :, 2] * 19595 + bgr[:, :, 1] * 38470 + bgr[:, :, 0] * 7471 + 0x8000) >> 16).astype(np.uint8)
+
+    return np.asarray(to_grayscale(bytes_to_img(data)))
+
+
+def b64_to_array(img64):
+    """Converts base64 to grayscale numpy.ndarray
+    """
+    return bytes_to_array(base64.b64decode(img64))
+
+
+def preprocess_array(npim, is_binarize):
+    """Ensure grayscale image has proper background/properties, same as preprocess
+
+    :param npim: numpy.ndarray
+        grayscale image
+    :param is_binarize if image must be binarized
+    :return: numpy.ndarray
+    """
+    # Get negative of image in case it is white on black
+    if np.mean(npim) < 128:
+        npim = 255 - npim
+        print("Inverted image")
+
+    if is_binarize:
+        npim = cv2.threshold(npim, 128, 255, cv2.THRESH_OTSU)[1]
+
+    return npim
+
+
+def _bicubic_filter(x):
+    a = -0.5
+    x = abs(x)
+    if x < 1.0:
+        return ((a + 2.0) * x - (a + 3.0)) * x * x + 1
+    if x < 2.0:
+        return (((x - 5) * x + 8) * x - 4) * a
+    return 0.0
+
+
+@functools.lru_cache(maxsize=1024)
+def _resample_coefficients(in_size, out_size):
+    """Fixed point coefficients of bicubic resampling, computed as PIL does
+
+    :return: numpy.ndarray
+        array of shape (out_size, in_size)
+    """
+    scale = in_size / out_size
+    filterscale = max(scale, 1.0)
+    support = 2.0 * filterscale
+    coefficients = np.zeros((out_size, in_size), dtype=np.int64)
+    for xx in range(out_size):
+        center = (xx + 0.5) * scale
+        xmin = max(int(center - support + 0.5), 0)
+        xmax = min(int(center + support + 0.5), in_size) - xmin
+        weights = [_bicubic_filter((x + xmin - center + 0.5) / filterscale) for x in range(xmax)]
+        total = sum(weights)
+        for x, weight in enumerate(weights):
+            if total != 0.0:
+                weight /= total
+            weight_fixed = weight * (1 << RESAMPLE_PRECISION_BITS)
+            coefficients[xx, xmin + x] = int(-0.5 + weight_fixed) if weight < 0 else int(0.5 + weight_fixed)
+    coefficients.setflags(write=False)
+    return coefficients
+
+
+def _resample_pass(coefficients, npim):
+    npim = coefficients @ npim + (1 << (RESAMPLE_PRECISION_BITS - 1))
+    return np.clip(npim >> RESAMPLE_PRECISION_BITS, 0, 255)
+
+
+def resize_array(npim, width, height):
+    """Resize grayscale image, same as PIL.Image.resize with default (bicubic) resampling
+
+    :param npim: numpy.ndarray
+    :return: numpy.ndarray
+        uint8 array of shape (height, width)
+    """
+    resized = npim.astype(np.int64)
+    if npim.shape[1] != width:
+        resized = _resample_pass(_resample_coefficients(npim.shape[1], width), resized.T).T
+    if npim.shape[0] != height:
+        resized = _resample_pass(_resample_coefficients(npim.shape[0], height), resized)
+    return resized.astype(np.uint8)
+
+
+def letters_to_batch(npim, contours, size, out=None):
+    """Crop letters according to contours and resize them to squares to be classified
+    Same as pad_resize(crop_resize(letter, -1), size) for letters of crop_letters
+
+    :param npim: numpy.ndarray
+        grayscale image
+    :param contours: numpy.ndarray
+        contours of letters as returned by get_contours
+    :param size: int
+        side of the resized letters
+    :param out: numpy.ndarray
+        if supplied, array of shape (len(contours), size, size, 1) to write letters to
+    :return: numpy.ndarray
+        uint8 array of shape (len(contours), size, size, 1)
+    """
+    if out is None:
+        out = np.empty((len(contours), size, size, 1), dtype=np.uint8)
+    for i, (left, low, right, high) in enumerate(contours):
+        letter = npim[low:high, left:right]
+        # Remove white margins
+        ink = letter < 255
+        rows = np.flatnonzero(ink.any(axis=1))
+        if len(rows) != 0:
+            columns = np.flatnonzero(ink.any(axis=0))
+            letter = letter[rows[0]:rows[-1] + 1, columns[0]:columns[-1] + 1]
+        else:
+            letter = np.full((max(letter.shape), max(letter.shape)), 255, dtype=np.uint8)
+        out[i, :, :, 0] = resize_array(letter, size, size)
+    return out
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+import bisect
+import contextlib
+import math
+import threading
+import time
+
+# Content type of metrics in Prometheus text format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10.)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+
+_registry = []
+
+
+def _format_labels(labelnames, labelvalues, extra=()):
+    pairs = list(zip(labelnames, labelvalues)) + list(extra)
+    if len(pairs) == 0:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """Metric with optional labels, registered for rendering at creation"""
+
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = dict()  # Tuple of label values -> value of metric
+        _registry.append(self)
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise AttributeError(f'Metric {self.name} expects labels {self.labelnames}, got {tuple(labels)}')
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        with self._lock:
+            items = sorted(self._values.items())
+            lines += [line for key, value in items for line in self._render_value(key, value)]
+        return '\n'.join(lines)
+
+    def _render_value(self, key, value):
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _render_value(self, key, value):
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}']
+
+
+class Gauge(_Metric):
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def _render_value(self, key, value):
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}']
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, buckets, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # Number of observations per bucket (not cumulative) followed by sum of observations
+                counts = self._values[key] = [0] * len(self.buckets) + [0]
+            counts[index] += 1
+            counts[-1] += value
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """Observe time spent in the block (in seconds)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _render_value(self, key, value):
+        lines = []
+        cumulative = 0
+        for bucket, count in zip(self.buckets, value):
+            cumulative += count
+            labels = _format_labels(self.labelnames, key, [('le', _format_value(bucket))])
+            lines.append(f'{self.name}_bucket{labels} {cumulative}')
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f'{self.name}_sum{labels} {_format_value(value[-1])}')
+        lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+def render():
+    """All metrics in Prometheus text format"""
+    return '\n'.join(metric.render() for metric in _registry) + '\n'
+
+
+REQUEST_LATENCY = Histogram('charrec_request_duration_seconds', 'Time spent handling a request',
+                            LATENCY_BUCKETS, labelnames=('endpoint',))
+STAGE_LATENCY = Histogram('charrec_stage_duration_seconds', 'Time spent in a stage of recognition of a word',
+                          LATENCY_BUCKETS, labelnames=('stage',))
+WORDS = Counter('charrec_words_total', 'Number of words to recognize by language, binarization and outcome',
+                labelnames=('lang', 'binarize', 'outcome'))
+LETTERS_PER_WORD = Histogram('charrec_letters_per_word', 'Number of letters found on an image of a word', SIZE_BUCKETS)
+BATCH_SIZE = Histogram('charrec_batch_size_letters', 'Number of letters classified in a single forward pass',
+                       SIZE_BUCKETS, labelnames=('lang',))
+QUEUE_DEPTH = Gauge('charrec_queue_depth', 'Number of requests waiting for a thread in the admission queue of the asyncio front-end')
+REJECTED_REQUESTS = Counter('charrec_rejected_requests_total',
+                            'Number of requests rejected with 503 because the admission queue was full')
@@ -2,16 +2,19 @@
 
 import os
 import string
+import threading
 import numpy as np
-from keras.layers import Dense, Convolution2D, Activation, MaxPooling2D, Dropout, Flatten
-import keras.models
 
 import image_proc
+import metrics
+import numpy_model
 
 WEIGHTS_BACKUP = "weights/comnist_keras.hdf5"
 SIZE = 32
-
-INF = 10**9
+# Engines computing forward pass of the model, keras is imported only if used
+# 'graph' runs keras model as graph functions compiled for a few batch sizes (see graph_model.py)
+# 'int8' is the quantized model created by quantized_model.py
+BACKENDS = ('keras', 'graph', 'numpy', 'int8')
 
 def load_model(weights_filename, nb_classes):
     """Get the convolutional model to be used to read letters
@@ -23,6 +26,9 @@ def load_model(weights_filename, nb_classes):
     :return: mode: keras.model
         the convolutional model
     """
+    from keras.layers import Dense, Convolution2D, Activation, MaxPooling2D, Dropout, Flatten
+    import keras.models
+
     if weights_filename is None:
         weights_filename = WEIGHTS_BACKUP
 
@@ -70,109 +76,310 @@ def load_model(weights_filename, nb_classes):
     if os.path.exists(weights_filename):
         model.load_weights(weights_filename)
 
-    # Finally compile model (required to make predictions)
-    model.compile(loss='binary_crossentropy', optimizer='adam', metrics=['accuracy'])
+    # Model is not compiled: it is only used to make predictions
 
     print(f"Successfully loaded weights from file '{weights_filename}' and created model")
 
     return model
 
-import tensorflow as tf
-def load_letter_predictor(weights_filename, lang_in):
+
+def preprocess_letters(imgs):
+    """Reshape and resize images of letters into a batch ready to be classified
+
+    :param imgs: list
+        list of PIL.Image of single letters
+    :return: numpy.ndarray
+        array of shape (len(imgs), SIZE, SIZE, 1)
+    """
+    batch = np.empty((len(imgs), SIZE, SIZE, 1), dtype=np.uint8)
+    for i, img in enumerate(imgs):
+        img = image_proc.crop_resize(img, -1)
+        img = image_proc.pad_resize(img, SIZE)
+        batch[i] = np.reshape(img, (SIZE, SIZE, 1))
+    return batch
+
+
+def top_letters(proba, letters, nb_output, with_proba=False):
+    """Get the n first most probable letters for each row of probabilities
+
+    :param proba: numpy.ndarray
+        array of shape (number of images, number of classes) of scores of classes
+    :param letters: string
+        letters corresponding to classes
+    :param nb_output: int
+        number of letters to return per image
+    :param with_proba: bool
+        if probabilities (softmax of scores) of the returned letters must be returned too
+    :return: list
+        for each image, list of its n first most probable letters
+        (and if with_proba, for each image, list of probabilities of these letters)
+    """
+    # Stable sort keeps the lowest index first among equal probabilities, as argmax does
+    indices = np.argsort(-proba, axis=1, kind='stable')[:, :nb_output]
+    top = [[letters[ind] for ind in row] for row in indices]
+    if not with_proba:
+        return top
+    softmax = np.exp(proba - proba.max(axis=1, keepdims=True))
+    softmax /= softmax.sum(axis=1, keepdims=True)
+    return top, np.take_along_axis(softmax, indices, axis=1).tolist()
+
+
+def language_letters(lang_in):
+    """Letters corresponding to classes of the model of the language
+
+    :param lang_in: string
+        language in which the letters are written
+    :return: string
+    """
+    if lang_in == 'en':
+        return string.ascii_uppercase
+    elif lang_in == 'ru':
+        return u'IАБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯ'  # 33 + 1 because of possible misrecognition of letter 'Ы'
+    else:
+        raise AttributeError('Incorrect language passed to model')
+
+
+def load_letter_predictor(weights_filename, lang_in, scheduler=None, backend='keras'):
     """Create a function that will classify images to letters
 
     :param weights_filename: string
         path to the training weigths
     :param lang_in: string
         language in which the letters are written
+    :param scheduler: batching.BatchScheduler
+        if supplied, letters of concurrent calls are classified together by this scheduler
+    :param backend: string
+        engine computing the model, one of BACKENDS
     :return: function
-        a function that convert an image to a letter
+        a function that convert a batch of images to letters
     """
+    LETTERS = language_letters(lang_in)
 
-    if lang_in == 'en':
-        LETTERS = string.ascii_uppercase
-    elif lang_in == 'ru':
-        LETTERS = u'IАБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯ'  # 33 + 1 because of possible misrecognition of letter 'Ы'
+    num_of_classes = len(LETTERS)
+    if backend == 'keras':
+        model = load_model(weights_filename, num_of_classes)
+    elif backend == 'graph':
+        import graph_model
+        model = graph_model.load_model(weights_filename, num_of_classes)
+    elif backend == 'numpy':
+        model = numpy_model.load_model(weights_filename, num_of_classes)
+    elif backend == 'int8':
+        import quantized_model
+        model = quantized_model.load_model(weights_filename, num_of_classes)
     else:
-        raise AttributeError('Incorrect language passed to model')
+        raise AttributeError(f"Unknown backend '{backend}', expected one of {BACKENDS}")
 
-    num_of_classes = len(LETTERS)
-    model = load_model(weights_filename, num_of_classes)
+    def forward(batch):
+        metrics.BATCH_SIZE.observe(len(batch), lang=lang_in)
+        if backend != 'keras':
+            return model(batch)
+        # Eager call, 'graph' backend avoids its overhead without the per call setup of model.predict
+        return model(batch, training=False).numpy()
 
-    def letter_predictor(img, nb_output):
-        """Reshape and resize images before classifying
+    if scheduler is not None:
+        forward = scheduler.start(forward)
 
-        :param img: PIL.Image
-            image of a single letter
+    def letter_predictor(batch, nb_output, with_proba=False):
+        """Classify a batch of letter images in a single forward pass
+
+        :param batch: numpy.ndarray
+            images of letters as returned by preprocess_letters
         :param nb_output: int
-            return the n first most probable letters identified on the image
-        :return: string
-            the first and second most probable letters represented by the image
+            return the n first most probable letters identified on each image
+        :param with_proba: bool
+            if probabilities of the letters must be returned too
+        :return: list
+            for each image, list of the n first most probable letters represented by it
+            (and if with_proba, for each image, list of probabilities of these letters)
         """
-        img = image_proc.crop_resize(img, -1)
-        img = image_proc.pad_resize(img, SIZE)
-        img = np.reshape(img, (1, SIZE, SIZE, 1))
+        if len(batch) == 0:
+            return ([], []) if with_proba else []
 
         # Compute probability for each possible letter
-        # proba_list = model.predict(img, verbose=0)[0]  # TODO Change in occurrence of performance issues
-        proba_list = model(img, training=False)[0].numpy()
-        probable_letters_list = []
-        for _ in range(nb_output):
-            # Get index of most probable letter not already identified
-            ind = int(np.argmax(proba_list))
-            # Add this lette to the output list
-            probable_letters_list.append(LETTERS[ind])
-            # Remove most probable letter from probability list
-            proba_list[ind] = -INF
-
-        return probable_letters_list
+        proba = forward(batch)
+        return top_letters(proba, LETTERS, nb_output, with_proba)
 
     return letter_predictor
 
 
-def load_word_predictor(weights_filename, lang_in):
+def assemble_word(predicted_letters, lang_in, nb_output, predicted_proba=None):
+    """Build a word out of the letters predicted for each of its blocks
+
+    :param predicted_letters: list
+        for each block of the word, list of its n first most probable letters
+    :param lang_in: string
+        language in which the letters are written
+    :param nb_output: int
+        number of most probable letters per block
+    :param predicted_proba: list
+        if supplied, for each block of the word, list of probabilities of its letters
+    :return: numpy.ndarray
+        the word represented by the blocks, one row per letter
+        (and if predicted_proba is supplied, probabilities of the letters, one row per letter)
+    """
+    # word = np.empty((len(cropped_letters), nb_output), dtype=object)
+    word_as_list = []  # List<List<str>>
+    proba_as_list = []  # List<List<float>>
+    # nb_letters = 0
+    for i, letters in enumerate(predicted_letters):
+        # Deal with exception of letter 'Ы', which is possibly made of two distinct blocks
+        exceptional_letter = False
+        if lang_in == 'ru':
+            if letters[0] == 'I':
+                if len(word_as_list) >= 1 and word_as_list[-1] == 'Ь':
+                    word_as_list[-1][0] = u'Ы'
+                    exceptional_letter = True
+                else:
+                    letters = ['Т']*nb_output  # If we recognized pure 'I', maybe it was 'Т'
+        if not exceptional_letter:
+            word_as_list.append(letters)
+            if predicted_proba is not None:
+                proba_as_list.append(predicted_proba[i])
+            # nb_letters += 1
+
+    word = np.array(word_as_list)
+    if predicted_proba is not None:
+        return word, np.array(proba_as_list)
+    return word
+
+
+def load_words_predictor(weights_filename, lang_in, scheduler=None, backend='keras'):
+    """Create a function that will convert several images to words at once
+
+    :param weights_filename: string
+        path to the training weigths
+    :param lang_in: string
+        language in which the letters are written
+    :param scheduler: batching.BatchScheduler
+        if supplied, letters of concurrent calls are classified together by this scheduler
+    :param backend: string
+        engine computing the model, one of BACKENDS
+    :return: function
+        a function that convert a list of images to a list of words
+    """
+    letter_predictor = load_letter_predictor(weights_filename, lang_in, scheduler, backend)
+
+    def words_predictor(imgs, nb_outputs, segmentations=None, with_proba=False):
+        """Splits images of words into one image per letter and classify letters of all words together
+
+        :param imgs: list
+            list of PIL.Image or grayscale numpy.ndarray of words
+        :param nb_outputs: list
+            for each image, return the n first most probable letters identified on it
+        :param segmentations: list
+            for each image, letters found on it as image_proc.Segmentation (computed if not supplied)
+        :param with_proba: bool
+            if probabilities of the letters must be returned too
+        :return: list
+            the words represented by the images (if with_proba, list of (word, probabilities of its letters))
+        """
+        if segmentations is None:
+            segmentations = [image_proc.Segmentation(img) for img in imgs]
+        nb_letters = [len(segmentation.contours) for segmentation in segmentations]
+        # Letters of all words are written into a single batch and classified at once
+        batch = np.empty((sum(nb_letters), SIZE, SIZE, 1), dtype=np.uint8)
+        start = 0
+        for segmentation, nb_letter in zip(segmentations, nb_letters):
+            segmentation.letters_batch(SIZE, batch[start:start + nb_letter])
+            start += nb_letter
+        predicted = letter_predictor(batch, max(nb_outputs, default=1), with_proba)
+        predicted_letters, predicted_proba = predicted if with_proba else (predicted, None)
+        words = []
+        start = 0
+        for nb_letter, nb_output in zip(nb_letters, nb_outputs):
+            word_letters = [probable_letters[:nb_output] for probable_letters in predicted_letters[start:start + nb_letter]]
+            if with_proba:
+                word_proba = [probable_proba[:nb_output] for probable_proba in predicted_proba[start:start + nb_letter]]
+                words.append(assemble_word(word_letters, lang_in, nb_output, word_proba))
+            else:
+                words.append(assemble_word(word_letters, lang_in, nb_output))
+            start += nb_letter
+        return words
+
+    return words_predictor
+
+
+def load_word_predictor(weights_filename, lang_in, scheduler=None, backend='keras'):
     """Create a function that will convert images to words
 
     :param weights_filename: string
         path to the training weigths
     :param lang_in: string
         language in which the letters are written
+    :param scheduler: batching.BatchScheduler
+        if supplied, letters of concurrent calls are classified together by this scheduler
+    :param backend: string
+        engine computing the model, one of BACKENDS
     :return: function
         a function that convert an image to a word
     """
-    letter_predictor = load_letter_predictor(weights_filename, lang_in)
+    words_predictor = load_words_predictor(weights_filename, lang_in, scheduler, backend)
 
-    def word_predictor(img, nb_output):
+    def word_predictor(img, nb_output, segmentation=None, with_proba=False):
         """Splits image of word into one image per letter
 
-        :param img: PIL.Image
-            image of a word
+        :param img: PIL.Image or numpy.ndarray
+            grayscale image of a word
         :param nb_output: int
             return the n first most probable letters identified on the image
+        :param segmentation: image_proc.Segmentation
+            letters found on the image (computed if not supplied)
+        :param with_proba: bool
+            if probabilities of the letters must be returned too
         :return: string
-            the word represented by the image
+            the word represented by the image (if with_proba, (word, probabilities of its letters))
         """
-
-        cropped_letters = image_proc.crop_letters(img)
-        # word = np.empty((len(cropped_letters), nb_output), dtype=object)
-        word_as_list = []  # List<List<str>>
-        # nb_letters = 0
-        for i in range(len(cropped_letters)):
-            letters = letter_predictor(cropped_letters[i], nb_output)
-            # Deal with exception of letter 'Ы', which is possibly made of two distinct blocks
-            exceptional_letter = False
-            if lang_in == 'ru':
-                if letters[0] == 'I':
-                    if len(word_as_list) >= 1 and word_as_list[-1] == 'Ь':
-                        word_as_list[-1][0] = u'Ы'
-                        exceptional_letter = True
-                    else:
-                        letters = ['Т']*nb_output  # If we recognized pure 'I', maybe it was 'Т'
-            if not exceptional_letter:
-                word_as_list.append(letters)
-                # nb_letters += 1
-
-        word = np.array(word_as_list)
-        return word
+        return words_predictor([img], [nb_output], None if segmentation is None else [segmentation], with_proba)[0]
 
     return word_predictor
+
+
+class LazyPredictors:
+    """Predictors by language, each one is loaded on its first use (or by warm_up)
+
+    Languages which are never used are never loaded
+    """
+
+    def __init__(self, loaders):
+        """
+        :param loaders: dict
+            language -> function without arguments loading the predictor of the language
+        """
+        self._loaders = dict(loaders)
+        self._predictors = dict()
+        self._locks = {lang: threading.Lock() for lang in self._loaders}
+
+    def __contains__(self, lang):
+        return lang in self._loaders
+
+    def __iter__(self):
+        return iter(self._loaders)
+
+    def __len__(self):
+        return len(self._loaders)
+
+    def __getitem__(self, lang):
+        predictor = self._predictors.get(lang)
+        if predictor is None:
+            # Concurrent first uses of a language wait for a single loading
+            with self._locks[lang]:
+                predictor = self._predictors.get(lang)
+                if predictor is None:
+                    predictor = self._predictors[lang] = self._loaders[lang]()
+        return predictor
+
+    def is_loaded(self, lang):
+        return lang in self._predictors
+
+    def load_all(self):
+        for lang in self._loaders:
+            _ = self[lang]
+
+    def warm_up(self):
+        """Load all predictors in a background thread
+
+        :return: threading.Thread
+        """
+        thread = threading.Thread(target=self.load_all, name='warm-up', daemon=True)
+        thread.start()
+        return thread
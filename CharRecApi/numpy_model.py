@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+import h5py
+import numpy as np
+
+# Letters are classified by chunks of this size, so that unfolded convolution inputs stay small
+BATCH_CHUNK = 32
+# Weights filename -> weights already read into memory shared between processes (see prefork.share_weights)
+SHARED_WEIGHTS = dict()
+
+
+def read_weights(weights_filename):
+    """Read weights of layers from HDF5 file saved by keras (model.save_weights or model.save)
+
+    :param weights_filename: string
+        path to the training weigths
+    :return: list
+        for each layer with weights, in order of layers, list of its weights as numpy.ndarray (e.g. [kernel, bias])
+    """
+    weights = []
+    with h5py.File(weights_filename, 'r') as f:
+        if 'model_weights' in f:
+            f = f['model_weights']
+        for layer_name in f.attrs['layer_names']:
+            layer_name = layer_name.decode('utf8') if isinstance(layer_name, bytes) else layer_name
+            group = f[layer_name]
+            weight_names = [name.decode('utf8') if isinstance(name, bytes) else name for name in group.attrs['weight_names']]
+            if len(weight_names) != 0:
+                weights.append([np.asarray(group[name], dtype=np.float32) for name in weight_names])
+    return weights
+
+
+def conv2d(x, kernel, bias):
+    """Valid 2D convolution followed by relu, as keras Convolution2D
+
+    :param x: numpy.ndarray
+        array of shape (batch, height, width, channels)
+    :param kernel: numpy.ndarray
+        array of shape (kernel height, kernel width, channels, filters)
+    :return: numpy.ndarray
+        array of shape (batch, height - kernel height + 1, width - kernel width + 1, filters)
+    """
+    kernel_height, kernel_width, channels, filters = kernel.shape
+    windows = np.lib.stride_tricks.sliding_window_view(x, (kernel_height, kernel_width), axis=(1, 2))
+    batch, height, width = windows.shape[:3]
+    # Unfold windows as rows (im2col), ordered as the kernel: (kernel height, kernel width, channels)
+    columns = windows.transpose(0, 1, 2, 4, 5, 3).reshape(batch * height * width, kernel_height * kernel_width * channels)
+    y = columns @ kernel.reshape(-1, filters)
+    y += bias
+    np.maximum(y, 0, out=y)
+    return y.reshape(batch, height, width, filters)
+
+
+def max_pooling2d(x, pool_size=2):
+    """Max pooling with stride equal to pool size, as keras MaxPooling2D"""
+    batch, height, width, channels = x.shape
+    height, width = height // pool_size, width // pool_size
+    x = x[:, :height * pool_size, :width * pool_size]
+    return x.reshape(batch, height, pool_size, width, pool_size, channels).max(axis=(2, 4))
+
+
+def dense(x, kernel, bias, relu=True):
+    y = x @ kernel
+    y += bias
+    if relu:
+        np.maximum(y, 0, out=y)
+    return y
+
+
+class NumpyModel:
+    """Same network as model.load_model, forward pass computed with numpy
+
+    Calling it on a batch of letters of shape (N, SIZE, SIZE, 1) returns scores of classes of shape (N, number of classes)
+    """
+
+    def __init__(self, weights):
+        """
+        :param weights: list
+            weights of layers as returned by read_weights
+        """
+        if len(weights) != 6 or any(len(w) != 2 for w in weights):
+            raise AttributeError('Weights do not match the letter classification model')
+        self.convolutions = weights[:3]
+        self.denses = weights[3:]
+        if any(kernel.ndim != 4 for kernel, _ in self.convolutions) or any(kernel.ndim != 2 for kernel, _ in self.denses):
+            raise AttributeError('Weights do not match the letter classification model')
+        self.nb_classes = self.denses[-1][0].shape[1]
+
+    def __call__(self, batch):
+        scores = np.empty((len(batch), self.nb_classes), dtype=np.float32)
+        for i in range(0, len(batch), BATCH_CHUNK):
+            scores[i:i + BATCH_CHUNK] = self._forward(batch[i:i + BATCH_CHUNK])
+        return scores
+
+    def _forward(self, batch):
+        x = np.asarray(batch, dtype=np.float32)
+        x = conv2d(x, *self.convolutions[0])
+        x = max_pooling2d(conv2d(x, *self.convolutions[1]))
+        x = max_pooling2d(conv2d(x, *self.convolutions[2]))
+        x = x.reshape(len(x), -1)
+        x = dense(x, *self.denses[0])
+        x = dense(x, *self.denses[1])
+        return dense(x, *self.denses[2], relu=False)
+
+
+def load_model(weights_filename, nb_classes):
+    """Get the letter classification model computed with numpy
+
+    :param weights_filename: string
+        path to the training weigths
+    :param nb_classes: int
+        number of expected output classes
+    :return: NumpyModel
+    """
+    weights = SHARED_WEIGHTS.get(weights_filename)
+    model = NumpyModel(weights if weights is not None else read_weights(weights_filename))
+    if model.nb_classes != nb_classes:
+        raise AttributeError(f"Weights of '{weights_filename}' have {model.nb_classes} classes, expected {nb_classes}")
+
+    print(f"Successfully loaded weights from file '{weights_filename}' and created numpy model")
+
+    return model
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+#  -*- coding: utf-8 -*-
+
+# Builtin imports
+import argparse
+import concurrent.futures
+import os
+import subprocess
+import sys
+import time
+
+# Dependency imports
+import numpy as np
+import requests
+
+RECOGN_ESTIMATOR_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'RecognEstimator')
+sys.path.insert(1, RECOGN_ESTIMATOR_DIR)
+import text2image
+
+URL = 'http://127.0.0.1:5002'
+
+
+def start_server(frontend, server_args, timeout=120.):
+    server = subprocess.Popen([sys.executable, 'WordRecognitionServer.py', '--frontend', frontend, *server_args],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f'{URL}/metrics').status_code == 200:
+                return server
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.5)
+    server.kill()
+    raise RuntimeError(f'Server with {frontend} front-end did not start in {timeout} s')
+
+
+def client(png, deadline, reject_pause):
+    """Send requests one after the other until the deadline, over a kept alive connection
+
+    :return: list
+        (status code, latency in seconds, if Retry-After header was sent) of each request
+    """
+    results = []
+    with requests.Session() as session:
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            response = session.post(f'{URL}/api/word', data=png, headers={'Content-Type': 'application/octet-stream'},
+                                    params={'lang': 'ru', 'is_binarize': 0})
+            results.append((response.status_code, time.perf_counter() - start, 'Retry-After' in response.headers))
+            if response.status_code == 503:
+                time.sleep(float(response.headers.get('Retry-After', 0)) if reject_pause is None else reject_pause)
+    return results
+
+
+def overload(png, num_of_clients, duration, reject_pause):
+    deadline = time.monotonic() + duration
+    with concurrent.futures.ThreadPoolExecutor(max_workers=num_of_clients) as executor:
+        futures = [executor.submit(client, png, deadline, reject_pause) for _ in range(num_of_clients)]
+        return [result for future in futures for result in future.result()]
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Compare latency of flask and asyncio front-ends under overload')
+    parser.add_argument("--clients", default=64, type=int, help="Number of clients sending requests without pause")
+    parser.add_argument("--duration", default=20., type=float, help="Seconds of overload")
+    parser.add_argument("--admission-queue", default=8, type=int, help="Admission queue of the asyncio front-end")
+    parser.add_argument("--reject-pause", default=None, type=float,
+                        help="Seconds a client waits after a rejected request, Retry-After header by default")
+    args = parser.parse_args()
+
+    png = text2image.image2png(text2image.text2image('ПРИВЕТ', fontpath=os.path.join(RECOGN_ESTIMATOR_DIR, 'Fonts', 'Consolas.ttf'),
+                                                     fontsize=40))
+    server_args = ['--backend', 'numpy', '--langs', 'ru']
+    failed = False
+    p99 = dict()
+    print(f'{args.clients} clients during {args.duration:.0f} s')
+    print('Front-end\tanswered/s\trejected/s\tp50, ms\t\tp99, ms\t\tmax, ms (of answered requests)')
+    for frontend, frontend_args in (('flask', []), ('asyncio', ['--admission-queue', str(args.admission_queue)])):
+        server = start_server(frontend, server_args + frontend_args)
+        try:
+            results = overload(png, args.clients, args.duration, args.reject_pause)
+        finally:
+            server.terminate()
+            server.wait()
+        latencies = np.array([latency for code, latency, _ in results if code == 200]) * 1e3
+        rejected = [retry_after for code, _, retry_after in results if code == 503]
+        others = sorted({code for code, _, _ in results} - {200, 503})
+        p50, p99[frontend] = np.percentile(latencies, [50, 99])
+        print(f'{frontend}\t\t{len(latencies) / args.duration:.1f}\t\t{len(rejected) / args.duration:.1f}\t\t'
+              f'{p50:.0f}\t\t{p99[frontend]:.0f}\t\t{latencies.max():.0f}')
+        if len(others) != 0:
+            print(f'{frontend} front-end answered with codes {others}', file=sys.stderr)
+            failed = True
+        if not all(rejected):
+            print(f'{frontend} front-end rejected requests without Retry-After header', file=sys.stderr)
+            failed = True
+
+    if p99['asyncio'] >= p99['flask']:
+        print('Tail latency of asyncio front-end is not lower than of flask under overload', file=sys.stderr)
+        failed = True
+    if failed:
+        sys.exit(1)
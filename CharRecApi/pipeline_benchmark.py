@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+#  -*- coding: utf-8 -*-
+
+# Builtin imports
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+# Dependency imports
+import numpy as np
+
+# Local imports
+import image_proc
+import model
+
+RECOGN_ESTIMATOR_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'RecognEstimator')
+sys.path.insert(1, RECOGN_ESTIMATOR_DIR)
+import text2image
+
+FONTS = ("Consolas.ttf", "CourierNew.ttf", "TimesNewRomanPsmt.ttf")
+WORD_LENGTHS = (4, 8, 14)
+WORDS_PER_CORPUS = 20
+FONTSIZE = 40
+
+STAGES = ('b64_decode', 'b64_preprocess', 'b64_preprocess_otsu', 'b64_preprocess_array', 'get_contours',
+          'crop_resize_pad_resize', 'letters_batch', 'letter_inference', 'score_word', 'img_to_b64')
+
+
+def load_corpus(fontname, word_length, num_of_words=WORDS_PER_CORPUS):
+    """Fixed set of dictionary words of given length rendered with given font
+
+    :return: list
+        list of (word, b64 image)
+    """
+    with open(os.path.join(RECOGN_ESTIMATOR_DIR, 'Hunspell disctionaries', 'ru_RU.dic'), 'r', encoding='utf-8') as f:
+        all_words = [i for i in f]
+    all_words = [w[0: w.find('/')].upper() for w in all_words[1:]]
+    words = random.Random(0).sample([w for w in all_words if len(w) == word_length], num_of_words)
+    params = {'fontpath': os.path.join(RECOGN_ESTIMATOR_DIR, "Fonts", fontname), 'fontsize': FONTSIZE}
+    return [(word, image_proc.img_to_b64(text2image.text2image(word, **params))) for word in words]
+
+
+def best_time(function, items, repeat):
+    """Best time over repeats of applying function to all items, per item"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            function(item)
+        times.append(time.perf_counter() - start)
+    return min(times) / len(items)
+
+
+def benchmark_corpus(corpus, letter_predictor, repeat):
+    """Time every stage of the recognition pipeline on a corpus
+
+    :return: dict
+        stage -> time per word in seconds
+    """
+    b64_images = [b64 for _, b64 in corpus]
+    images = [image_proc.b64_preprocess(b64, False) for b64 in b64_images]
+    segmentations = [image_proc.Segmentation(img) for img in images]
+    batches = [model.preprocess_letters(segmentation.letters) for segmentation in segmentations]
+
+    # Read word is the expected one with a wrong letter, expected word has one more letter,
+    # so that both graying out and flagging missing letters are timed
+    scored = []
+    for (word, _), img, segmentation in zip(corpus, images, segmentations):
+        if len(segmentation.contours) == len(word):
+            words_out = np.array([[letter] for letter in word[:-2] + '?' + word[-1]])
+            scored.append((word + word[-1], words_out, img, segmentation))
+    annotated = [image_proc.score_word(*args)[0] for args in scored]
+
+    results = {
+        'b64_decode': best_time(lambda b64: image_proc.b64_to_img(b64).load(), b64_images, repeat),
+        'b64_preprocess': best_time(lambda b64: image_proc.b64_preprocess(b64, False), b64_images, repeat),
+        'b64_preprocess_otsu': best_time(lambda b64: image_proc.b64_preprocess(b64, True), b64_images, repeat),
+        'b64_preprocess_array': best_time(lambda b64: image_proc.preprocess_array(image_proc.b64_to_array(b64), False),
+                                          b64_images, repeat),
+        'get_contours': best_time(image_proc.get_contours, images, repeat),
+        'crop_resize_pad_resize': best_time(lambda segmentation: model.preprocess_letters(segmentation.letters),
+                                            segmentations, repeat),
+        'letters_batch': best_time(lambda segmentation: segmentation.letters_batch(model.SIZE), segmentations, repeat),
+        'letter_inference': best_time(lambda batch: letter_predictor(batch, 1), batches, repeat),
+        'score_word': best_time(lambda args: image_proc.score_word(*args), scored, repeat) if len(scored) != 0 else None,
+        'img_to_b64': best_time(image_proc.img_to_b64, annotated, repeat) if len(annotated) != 0 else None,
+    }
+    return results
+
+
+def find_regressions(results, baseline, threshold):
+    """Stages which are slower than baseline by more than threshold (relative)
+
+    :return: list
+        list of (corpus, stage, baseline time, current time)
+    """
+    regressions = []
+    for corpus_name, stages in results.items():
+        for stage, current in stages.items():
+            previous = baseline.get(corpus_name, {}).get(stage)
+            if current is not None and previous is not None and current > previous * (1 + threshold):
+                regressions.append((corpus_name, stage, previous, current))
+    return regressions
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Time each stage of the recognition pipeline')
+    parser.add_argument("--weights", default="weights/comnist_keras_ru.hdf5", help="Weights of the russian model")
+    parser.add_argument("--repeat", default=5, type=int, help="Number of repeats, best one is kept")
+    parser.add_argument("--output", default=None, help="Save results as json baseline to this file")
+    parser.add_argument("--baseline", default=None, help="Compare results with this json baseline")
+    parser.add_argument("--threshold", default=0.2, type=float,
+                        help="Fail if a stage is slower than in baseline by more than this fraction")
+    args = parser.parse_args()
+
+    letter_predictor = model.load_letter_predictor(args.weights, lang_in='ru')
+
+    results = dict()
+    for fontname in FONTS:
+        for word_length in WORD_LENGTHS:
+            corpus_name = f'{os.path.splitext(fontname)[0]}_{word_length}'
+            results[corpus_name] = benchmark_corpus(load_corpus(fontname, word_length), letter_predictor, args.repeat)
+
+    print('Time per word, ms')
+    print('Corpus\t\t\t' + '\t'.join(STAGES))
+    for corpus_name, stages in results.items():
+        print(f'{corpus_name:<24}' + '\t'.join('-' if stages[stage] is None else f'{stages[stage] * 1e3:.3f}' for stage in STAGES))
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = find_regressions(results, baseline, args.threshold)
+        for corpus_name, stage, previous, current in regressions:
+            print(f'Regression! {stage} on {corpus_name}: {previous * 1e3:.3f} ms -> {current * 1e3:.3f} ms', file=sys.stderr)
+        if len(regressions) != 0:
+            sys.exit(1)
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+
+import gc
+import mmap
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+import traceback
+
+import numpy as np
+from werkzeug import serving
+
+import numpy_model
+
+# Worker which did not report for this number of seconds is killed and replaced
+HEARTBEAT_TIMEOUT = 10.
+# Worker has this number of seconds to load its models and start serving
+STARTUP_TIMEOUT = 60.
+# Stopped worker has this number of seconds to finish its requests before being killed
+GRACEFUL_TIMEOUT = 30.
+# Seconds between two checks of the workers by the supervisor, and between two heartbeats of a worker
+CHECK_INTERVAL = 0.5
+# Offsets of arrays in shared memory are aligned on this number of bytes
+ALIGNMENT = 64
+# Shared memory is a file of this folder, if it exists (it is not written to disk)
+SHARED_MEMORY_DIR = '/dev/shm'
+
+
+def share_weights(weights_filenames):
+    """Read weights files into one read-only memory map, used instead of the files by numpy_model.load_model
+
+    Memory map is shared by processes forked afterwards: weights are in memory once, whatever the number of workers
+
+    :param weights_filenames: list
+        paths to the training weights
+    :return: int
+        size of the shared memory in bytes
+    """
+    all_weights = {filename: numpy_model.read_weights(filename) for filename in weights_filenames}
+    offsets = []
+    size = 0
+    for weights in all_weights.values():
+        for layer in weights:
+            for array in layer:
+                offsets.append(size)
+                size += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+    folder = SHARED_MEMORY_DIR if os.path.isdir(SHARED_MEMORY_DIR) else None
+    with tempfile.TemporaryFile(dir=folder) as f:
+        f.truncate(size)
+        arrays = (array for weights in all_weights.values() for layer in weights for array in layer)
+        with mmap.mmap(f.fileno(), size) as memory:
+            for offset, array in zip(offsets, arrays):
+                memory[offset:offset + array.nbytes] = np.ascontiguousarray(array).tobytes()
+        # File is already deleted, the map keeps its memory while the process and its children use it
+        memory = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+
+    offsets = iter(offsets)
+    for filename, weights in all_weights.items():
+        numpy_model.SHARED_WEIGHTS[filename] = [
+            [np.frombuffer(memory, array.dtype, array.size, next(offsets)).reshape(array.shape) for array in layer]
+            for layer in weights]
+
+    print(f"Weights of {len(all_weights)} models are in {size / 2 ** 20:.1f} MiB of shared memory")
+
+    return size
+
+
+def run_worker(listener, app, init_worker, heartbeats, slot):
+    """Serve the API on the listening socket until SIGTERM, then finish the current requests
+
+    :return: int
+        exit code of the worker
+    """
+    # Supervisor decides when workers stop, Ctrl+C of the terminal is for it only
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    init_worker()
+
+    server = serving.make_server(listener.getsockname()[0], listener.getsockname()[1], app, threaded=True,
+                                 fd=listener.fileno())
+    # Closing the server waits for requests in progress
+    server.daemon_threads = False
+    server.block_on_close = True
+
+    def heartbeat():
+        heartbeats[slot] = time.monotonic()
+
+    # Called by the serving loop, so heartbeats stop if the worker does not accept connections anymore
+    server.service_actions = heartbeat
+    heartbeat()
+    # Shutdown waits for the serving loop, which runs in the thread interrupted by the signal
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+    print(f'Worker {os.getpid()} is serving', flush=True)
+    server.serve_forever(poll_interval=CHECK_INTERVAL)
+    print(f'Worker {os.getpid()} stopped', flush=True)
+    return 0
+
+
+class Supervisor:
+    """Pre-fork server: workers forked from this process serve the API on a socket they share
+
+    Everything loaded before workers are forked (e.g. by share_weights) is in memory once for all of them.
+    Workers which exit or stop sending heartbeats are replaced, SIGHUP replaces all workers one by one
+    (each one once its replacement serves), SIGTERM or SIGINT stops the workers and the supervisor.
+    """
+
+    def __init__(self, app, host, port, num_of_workers, init_worker=None, heartbeat_timeout=HEARTBEAT_TIMEOUT,
+                 startup_timeout=STARTUP_TIMEOUT, graceful_timeout=GRACEFUL_TIMEOUT):
+        """
+        :param app: flask.Flask
+            application served by the workers
+        :param num_of_workers: int
+            number of worker processes
+        :param init_worker: function
+            function without arguments called by each worker before it serves (e.g. loading of models)
+        :param heartbeat_timeout: float
+            worker which did not report for this number of seconds is killed and replaced
+        :param startup_timeout: float
+            worker has this number of seconds to call init_worker and start serving
+        :param graceful_timeout: float
+            stopped worker has this number of seconds to finish its requests before being killed
+        """
+        if num_of_workers < 1:
+            raise AttributeError('Number of workers must be positive')
+        self.app = app
+        self.num_of_workers = num_of_workers
+        self.init_worker = init_worker if init_worker is not None else (lambda: None)
+        self.heartbeat_timeout = heartbeat_timeout
+        self.startup_timeout = startup_timeout
+        self.graceful_timeout = graceful_timeout
+        self.listener = socket.create_server((host, port), backlog=128)
+        # Time of the last heartbeat of the worker of each slot, 0 until it serves
+        # Rolling restart runs a worker and its replacement at the same time
+        self.heartbeats = multiprocessing.RawArray('d', 2 * num_of_workers)
+        self.workers = dict()  # pid -> slot (None once the worker is stopped)
+        self.started = dict()  # pid -> time the worker was forked
+        self.stopping = dict()  # pid -> time after which the stopped worker is killed
+        self._restart = False
+        self._stop = False
+        self.restarts = 0
+
+    def spawn(self):
+        """Fork a worker, return its pid"""
+        slot = min(set(range(len(self.heartbeats))) - set(self.workers.values()))
+        self.heartbeats[slot] = 0.
+        # Otherwise buffered output would be written by both processes
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                code = run_worker(self.listener, self.app, self.init_worker, self.heartbeats, slot)
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(code)
+        self.workers[pid] = slot
+        self.started[pid] = time.monotonic()
+        return pid
+
+    def is_ready(self, pid):
+        return self.heartbeats[self.workers[pid]] != 0.
+
+    def stop_worker(self, pid):
+        """Ask the worker to finish its requests and exit, it is killed after graceful timeout"""
+        if pid not in self.stopping:
+            self.stopping[pid] = time.monotonic() + self.graceful_timeout
+            # Its heartbeats are not checked anymore, its slot is free for a replacement
+            self.workers[pid] = None
+            os.kill(pid, signal.SIGTERM)
+
+    def reap(self):
+        """Forget workers which exited, replace them unless they were stopped"""
+        while len(self.workers) != 0:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                return
+            self.workers.pop(pid, None)
+            self.started.pop(pid, None)
+            if self.stopping.pop(pid, None) is None and not self._stop:
+                print(f'Worker {pid} exited with code {os.waitstatus_to_exitcode(status)}, replacing it', flush=True)
+                self.restarts += 1
+                self.spawn()
+
+    def check(self):
+        """Kill workers which do not send heartbeats or do not stop in time"""
+        now = time.monotonic()
+        for pid, slot in list(self.workers.items()):
+            if pid in self.stopping:
+                reason = 'did not stop' if now > self.stopping[pid] else None
+            elif self.heartbeats[slot] == 0.:
+                reason = 'did not start serving' if now - self.started[pid] > self.startup_timeout else None
+            else:
+                reason = 'stopped sending heartbeats' if now - self.heartbeats[slot] > self.heartbeat_timeout else None
+            if reason is not None:
+                print(f'Worker {pid} {reason}, killing it', flush=True)
+                # It is replaced once reaped, unless it was stopped
+                os.kill(pid, signal.SIGKILL)
+
+    def rolling_restart(self):
+        """Replace workers one by one, each one is stopped once its replacement serves"""
+        print(f'Restarting {len(self.workers)} workers', flush=True)
+        for pid in [pid for pid in self.workers if pid not in self.stopping]:
+            replacement = self.spawn()
+            while replacement in self.workers and not self.is_ready(replacement) and not self._stop:
+                self.wait()
+            if replacement not in self.workers or self._stop:
+                print('Replacement worker did not start serving, restart is aborted', flush=True)
+                return
+            if pid in self.workers:
+                self.stop_worker(pid)
+        print('Workers are restarted', flush=True)
+
+    def wait(self):
+        time.sleep(CHECK_INTERVAL)
+        self.reap()
+        self.check()
+
+    def run(self):
+        """Fork workers and supervise them until SIGTERM or SIGINT"""
+        previous_handlers = {signum: signal.getsignal(signum) for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT)}
+        signal.signal(signal.SIGHUP, lambda signum, frame: setattr(self, '_restart', True))
+        signal.signal(signal.SIGTERM, lambda signum, frame: setattr(self, '_stop', True))
+        signal.signal(signal.SIGINT, lambda signum, frame: setattr(self, '_stop', True))
+        # Objects loaded so far are never collected, so that collections in workers do not copy their memory
+        gc.freeze()
+        try:
+            for _ in range(self.num_of_workers):
+                self.spawn()
+            print(f'Serving with {self.num_of_workers} workers on {self.listener.getsockname()}, '
+                  f'supervisor pid {os.getpid()}', flush=True)
+            while not self._stop:
+                if self._restart:
+                    self._restart = False
+                    self.rolling_restart()
+                self.wait()
+        finally:
+            print('Stopping workers', flush=True)
+            for pid in list(self.workers):
+                self.stop_worker(pid)
+            while len(self.workers) != 0:
+                self.wait()
+            self.listener.close()
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+
+
+def serve(app, host, port, num_of_workers, init_worker=None, heartbeat_timeout=HEARTBEAT_TIMEOUT):
+    """Serve the application with pre-forked workers until SIGTERM or SIGINT (see Supervisor)"""
+    Supervisor(app, host, port, num_of_workers, init_worker, heartbeat_timeout).run()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+#  -*- coding: utf-8 -*-
+
+# Builtin imports
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+# Dependency imports
+import requests
+
+RECOGN_ESTIMATOR_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'RecognEstimator')
+sys.path.insert(1, RECOGN_ESTIMATOR_DIR)
+import text2image
+
+URL = 'http://127.0.0.1:5002'
+
+
+def process_tree(pid):
+    """Pid of the process and of all its descendants"""
+    pids = [pid]
+    for child in open(f'/proc/{pid}/task/{pid}/children').read().split():
+        pids += process_tree(int(child))
+    return pids
+
+
+def memory(pid):
+    """Sums of resident (RSS) and proportional (PSS, shared pages divided between processes) memory in MiB
+
+    Sum of RSS counts shared pages once per process, sum of PSS counts them once
+    """
+    rss = pss = 0
+    for process in process_tree(pid):
+        with open(f'/proc/{process}/smaps_rollup') as f:
+            for line in f:
+                if line.startswith('Rss:'):
+                    rss += int(line.split()[1])
+                elif line.startswith('Pss:'):
+                    pss += int(line.split()[1])
+    return rss / 1024, pss / 1024
+
+
+def start_server(workers, langs, timeout=120.):
+    server = subprocess.Popen([sys.executable, 'WordRecognitionServer.py', '--backend', 'numpy', '--workers', str(workers),
+                               '--langs', *langs], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f'{URL}/metrics').status_code == 200 and \
+                    (workers == 1 or len(process_tree(server.pid)) == workers + 1):
+                return server
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.5)
+    server.kill()
+    raise RuntimeError(f'Server with {workers} workers did not start in {timeout} s')
+
+
+def recognize(png, lang):
+    response = requests.post(f'{URL}/api/word', data=png, headers={'Content-Type': 'application/octet-stream'},
+                             params={'lang': lang, 'is_binarize': 0})
+    return response.status_code
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Compare memory of pre-forked workers with one server process')
+    parser.add_argument("--workers", nargs='+', default=[2, 4, 8], type=int, help="Increasing numbers of workers")
+    parser.add_argument("--langs", nargs='+', default=['en', 'ru'], help="Languages to serve")
+    parser.add_argument("--requests", default=10, type=int, help="Number of requests per worker before measuring")
+    parser.add_argument("--max-ratio", default=0.25, type=float,
+                        help="Fail if each added worker takes more than this fraction of the memory of a single server")
+    args = parser.parse_args()
+
+    png = text2image.image2png(text2image.text2image('ПРИВЕТ', fontpath=os.path.join(RECOGN_ESTIMATOR_DIR, 'Fonts', 'Consolas.ttf'),
+                                                     fontsize=40))
+    failed = False
+    single_pss = None
+    previous = None  # Workers and PSS of the previous row
+    print('Workers\tRSS, MiB\tPSS, MiB\tPSS of as many single servers, MiB\tPSS per added worker, MiB')
+    for workers in [1] + args.workers:
+        server = start_server(workers, args.langs)
+        try:
+            # Every worker must have served requests of every language
+            codes = [recognize(png, lang) for _ in range(args.requests * workers) for lang in args.langs]
+            if any(code != 200 for code in codes):
+                raise RuntimeError(f'Server with {workers} workers answered {codes}')
+            time.sleep(1)
+            rss, pss = memory(server.pid)
+        finally:
+            server.terminate()
+            server.wait()
+        if single_pss is None:
+            single_pss = pss
+        # Supervisor is paid once, so added memory is measured from the previous number of workers
+        added = (pss - previous[1]) / (workers - previous[0]) if previous is not None else single_pss
+        print(f'{workers}\t{rss:.0f}\t\t{pss:.0f}\t\t{workers * single_pss:.0f} ({pss / (workers * single_pss):.0%})'
+              f'\t\t\t{added:.0f} ({added / single_pss:.0%})')
+        if workers > 1 and added > args.max_ratio * single_pss:
+            failed = True
+        previous = workers, pss
+
+    if failed:
+        print(f'A worker adds more than {args.max_ratio:.0%} of the memory of a single server', file=sys.stderr)
+        sys.exit(1)
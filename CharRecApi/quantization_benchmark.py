@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+#  -*- coding: utf-8 -*-
+
+# Builtin imports
+import argparse
+import os
+import random
+import sys
+import time
+
+# Dependency imports
+import numpy as np
+
+# Local imports
+import image_proc
+import model
+import numpy_model
+import quantized_model
+
+sys.path.insert(1, quantized_model.RECOGN_ESTIMATOR_DIR)
+import text2image
+
+BATCH_SIZES = (1, 8, 64)
+
+
+def load_labelled_letters(num_of_words):
+    """Letters of words chosen and rendered the same way Estimator does, with the expected letter of each
+
+    Only words split into as many letters as they have are kept
+
+    :return: (numpy.ndarray, list)
+        batch of letters ready to be classified and expected letters
+    """
+    with open(os.path.join(quantized_model.RECOGN_ESTIMATOR_DIR, 'Hunspell disctionaries', 'ru_RU.dic'), 'r', encoding='utf-8') as f:
+        all_words = [i for i in f]
+    all_words = [w[0: w.find('/')] for w in all_words[1:]]
+    words = [w.upper() for w in random.Random(0).choices(population=all_words, k=num_of_words)]
+    params = {'fontpath': os.path.join(quantized_model.RECOGN_ESTIMATOR_DIR, "Fonts", "Consolas.ttf"), 'fontsize': 40}
+
+    batches = []
+    labels = []
+    for word in words:
+        segmentation = image_proc.Segmentation(image_proc.preprocess(text2image.text2image(word, **params), False))
+        if len(segmentation.contours) == len(word):
+            batches.append(segmentation.letters_batch(model.SIZE))
+            labels += list(word)
+    return np.concatenate(batches), labels
+
+
+def weights_memory(weights):
+    """Memory of weights in float32 and quantized to int8 (kernels in int8, biases in int32, a float32 scale per channel)
+
+    :return: (int, int)
+        bytes in float32, bytes in int8
+    """
+    float32_bytes = sum(w.nbytes for layer in weights for w in layer)
+    int8_bytes = sum(kernel.size + bias.size * 4 + kernel.shape[-1] * 4 for kernel, bias in weights)
+    return float32_bytes, int8_bytes
+
+
+def time_per_batch(function, batch, repeat):
+    """Best time over repeats of classifying the batch"""
+    function(batch)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(batch)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Compare int8 quantized model with float32 one: speed, memory, accuracy')
+    parser.add_argument("--weights", default="weights/comnist_keras_ru.hdf5", help="Weights of the russian model")
+    parser.add_argument("--words", default=300, type=int, help="Number of words to classify the letters of")
+    parser.add_argument("--repeat", default=10, type=int, help="Number of repeats, best one is kept")
+    args = parser.parse_args()
+
+    letters_of_model = model.language_letters('ru')
+    nb_classes = len(letters_of_model)
+    if not os.path.exists(quantized_model.quantized_filename(args.weights)):
+        quantized_model.quantize(args.weights, 'ru')
+
+    keras_model = model.load_model(args.weights, nb_classes)
+    engines = {
+        'keras float32': lambda batch: keras_model(batch, training=False).numpy(),
+        'numpy float32': numpy_model.load_model(args.weights, nb_classes),
+        # Same runtime as int8 model, to tell the gain of quantization from the gain of the runtime
+        'tflite float32': quantized_model.TFLiteModel(model_content=quantized_model.convert(keras_model)),
+        'tflite int8': quantized_model.load_model(args.weights, nb_classes),
+    }
+
+    letters, labels = load_labelled_letters(args.words)
+    expected = np.array([letters_of_model.index(label) for label in labels])
+
+    float32_bytes, int8_bytes = weights_memory(numpy_model.read_weights(args.weights))
+    print(f'Weights: float32 {float32_bytes / 2 ** 20:.2f} MB, int8 {int8_bytes / 2 ** 20:.2f} MB '
+          f'({1 - int8_bytes / float32_bytes:.0%} saved)')
+
+    print(f'{len(letters)} letters of {args.words} words')
+    print('Engine\t\t' + '\t'.join(f'batch {batch_size}, ms' for batch_size in BATCH_SIZES) + '\ttop-1 accuracy\tsame top-1 as keras')
+    reference = engines['keras float32'](letters).argmax(axis=1)
+    reference_accuracy = np.mean(reference == expected)
+    for name, engine in engines.items():
+        times = [time_per_batch(engine, letters[:batch_size], args.repeat) for batch_size in BATCH_SIZES]
+        predicted = engine(letters).argmax(axis=1)
+        accuracy = np.mean(predicted == expected)
+        print(f'{name:<16}' + '\t'.join(f'{t * 1e3:.2f}\t' for t in times) +
+              f'\t{accuracy:.2%} ({accuracy - reference_accuracy:+.2%})\t{np.mean(predicted == reference):.2%}')
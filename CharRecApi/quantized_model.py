@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+#  -*- coding: utf-8 -*-
+
+# Builtin imports
+import os
+import random
+import sys
+import threading
+
+# Dependency imports
+import numpy as np
+
+# Local imports
+import image_proc
+import model
+
+# Quantized model is stored next to the weights it was created from
+QUANTIZED_EXTENSION = '.int8.tflite'
+
+RECOGN_ESTIMATOR_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'RecognEstimator')
+CALIBRATION_FONTS = ("Consolas.ttf", "CourierNew.ttf", "TimesNewRomanPsmt.ttf")
+CALIBRATION_FONTSIZES = (20, 40)
+
+
+def quantized_filename(weights_filename):
+    return os.path.splitext(weights_filename)[0] + QUANTIZED_EXTENSION
+
+
+def render_letters(lang_in, num_of_words=50, seed=0, fonts=CALIBRATION_FONTS, fontsizes=CALIBRATION_FONTSIZES):
+    """Letters of random words of the language rendered with bundled fonts, as a batch ready to be classified
+
+    :return: numpy.ndarray
+        array of shape (number of letters, SIZE, SIZE, 1)
+    """
+    if RECOGN_ESTIMATOR_DIR not in sys.path:
+        sys.path.insert(1, RECOGN_ESTIMATOR_DIR)
+    import text2image
+
+    # Letters are drawn uniformly, 'I' of russian model is a misrecognition of 'Ы', not a letter
+    letters = model.language_letters(lang_in).replace('I', '') if lang_in == 'ru' else model.language_letters(lang_in)
+    rng = random.Random(seed)
+    words = [''.join(rng.choices(letters, k=rng.randint(3, 10))) for _ in range(num_of_words)]
+    batches = []
+    for fontname in fonts:
+        for fontsize in fontsizes:
+            params = {'fontpath': os.path.join(RECOGN_ESTIMATOR_DIR, "Fonts", fontname), 'fontsize': fontsize}
+            for word in words:
+                img = image_proc.preprocess(text2image.text2image(word, **params), False)
+                batches.append(image_proc.Segmentation(img).letters_batch(model.SIZE))
+    return np.concatenate(batches)
+
+
+def convert(keras_model, calibration_letters=None):
+    """Convert keras model to tensorflow lite
+
+    :param keras_model: keras.model
+        model as returned by model.load_model
+    :param calibration_letters: numpy.ndarray
+        letters to calibrate ranges of activations on, if supplied weights and activations are quantized to int8
+        (with a scale per output channel for weights), otherwise model is kept in float32
+    :return: bytes
+        tensorflow lite model, taking uint8 letters and returning float32 scores
+    """
+    import tensorflow as tf
+    from tensorflow.python.framework.convert_to_constants import convert_variables_to_constants_v2
+
+    function = tf.function(lambda x: keras_model(x, training=False),
+                           input_signature=[tf.TensorSpec([None, model.SIZE, model.SIZE, 1], tf.float32)])
+    converter = tf.lite.TFLiteConverter.from_concrete_functions([convert_variables_to_constants_v2(function.get_concrete_function())])
+    if calibration_letters is not None:
+        def representative_dataset():
+            for i in range(len(calibration_letters)):
+                yield [calibration_letters[i:i + 1].astype(np.float32)]
+
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        # Pixels are integers from 0 to 255, so uint8 input with scale 1 is exact
+        converter.inference_input_type = tf.uint8
+        converter.inference_output_type = tf.float32
+    return converter.convert()
+
+
+def quantize(weights_filename, lang_in, output_filename=None, num_of_words=50):
+    """Create int8 model from weights, calibrated on letters rendered with bundled fonts
+
+    :param weights_filename: string
+        path to the training weigths
+    :param lang_in: string
+        language in which the letters are written
+    :param output_filename: string
+        path to save the quantized model to (next to the weights if not supplied)
+    :return: string
+        path of the quantized model
+    """
+    if output_filename is None:
+        output_filename = quantized_filename(weights_filename)
+    keras_model = model.load_model(weights_filename, len(model.language_letters(lang_in)))
+    calibration_letters = render_letters(lang_in, num_of_words)
+    with open(output_filename, 'wb') as f:
+        f.write(convert(keras_model, calibration_letters))
+    print(f"Quantized '{weights_filename}' calibrated on {len(calibration_letters)} letters to '{output_filename}'")
+    return output_filename
+
+
+def _interpreter_class():
+    """Tensorflow lite interpreter, from the standalone runtime if it is installed"""
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+
+class TFLiteModel:
+    """Tensorflow lite model of the letter classification
+
+    Calling it on a batch of letters of shape (N, SIZE, SIZE, 1) returns scores of classes of shape (N, number of classes)
+    """
+
+    def __init__(self, model_path=None, model_content=None, num_threads=1):
+        self._interpreter = _interpreter_class()(model_path=model_path, model_content=model_content,
+                                                 num_threads=num_threads)
+        self._input = self._interpreter.get_input_details()[0]
+        self._output = self._interpreter.get_output_details()[0]
+        self.nb_classes = self._output['shape'][-1]
+        self._batch_size = None
+        # Interpreter holds tensors of a single invocation at a time
+        self._lock = threading.Lock()
+
+    def __call__(self, batch):
+        batch = np.asarray(batch, dtype=self._input['dtype'])
+        with self._lock:
+            if len(batch) != self._batch_size:
+                self._interpreter.resize_tensor_input(self._input['index'], batch.shape)
+                self._interpreter.allocate_tensors()
+                self._batch_size = len(batch)
+            self._interpreter.set_tensor(self._input['index'], batch)
+            self._interpreter.invoke()
+            return self._interpreter.get_tensor(self._output['index'])
+
+
+def load_model(weights_filename, nb_classes):
+    """Get the quantized letter classification model created from the weights
+
+    :param weights_filename: string
+        path to the training weigths
+    :param nb_classes: int
+        number of expected output classes
+    :return: TFLiteModel
+    """
+    filename = quantized_filename(weights_filename)
+    if not os.path.exists(filename):
+        raise FileNotFoundError(f"Quantized model '{filename}' does not exist, create it with 'python quantized_model.py'")
+    quantized = TFLiteModel(filename)
+    if quantized.nb_classes != nb_classes:
+        raise AttributeError(f"Model '{filename}' has {quantized.nb_classes} classes, expected {nb_classes}")
+
+    print(f"Successfully loaded quantized model from file '{filename}'")
+
+    return quantized
+
+
+if __name__ == '__main__':
+    # Quantize weights used by WordRecognitionServer
+    for lang in ('en', 'ru'):
+        quantize(f"weights/comnist_keras_{lang}.hdf5", lang)
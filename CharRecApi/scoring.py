@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+
+import difflib
+
+import numpy as np
+
+# Pairs are aligned by chunks of at most this size, of words of similar lengths,
+# so that tables of common substrings of a chunk stay under TABLE_SIZE letters
+BATCH_CHUNK = 8192
+TABLE_SIZE = 2 ** 22
+# difflib.SequenceMatcher treats popular letters as junk from this length of the second word on
+AUTOJUNK_LENGTH = 200
+
+
+def encode(words):
+    """Code points of words, padded with zeros
+
+    :param words: list
+        strings
+    :return: (numpy.ndarray, numpy.ndarray)
+        array of shape (number of words, length of the longest word) and lengths of words
+    """
+    lengths = np.fromiter(map(len, words), dtype=np.int64, count=len(words))
+    width = max(int(lengths.max()) if len(words) != 0 else 0, 1)
+    codes = np.array(words, dtype=f'<U{width}').view(np.uint32).reshape(len(words), width)
+    return codes, lengths
+
+
+def matching_masks(words_in, words_out):
+    """Letters of expected and read words which belong to blocks matched by difflib.SequenceMatcher
+
+    Matching blocks are the same as ones of SequenceMatcher(None, word_in, word_out).get_matching_blocks():
+    the longest common substring (the first one in order of its end in word_in, then in word_out) is matched,
+    then the same is done on the parts to the left and to the right of it. Pairs are aligned all at once,
+    a window (part of a pair left to align) at a time: lengths of common substrings ending at each pair of letters
+    are computed once for all pairs, each step finds the longest block of every window with a few array operations.
+
+    :param words_in: list
+        the expected words
+    :param words_out: list
+        the read words
+    :return: (numpy.ndarray, numpy.ndarray)
+        boolean arrays of shape (number of words, length of the longest expected/read word),
+        True for letters which are matched, False for wrong (read) or missing (expected) letters and for padding
+    """
+    if len(words_in) != len(words_out):
+        raise AttributeError(f'Got {len(words_in)} expected words and {len(words_out)} read words')
+    lengths_in = np.fromiter(map(len, words_in), dtype=np.int64, count=len(words_in))
+    lengths_out = np.fromiter(map(len, words_out), dtype=np.int64, count=len(words_out))
+    matched_in = np.zeros((len(words_in), lengths_in.max(initial=0)), dtype=bool)
+    matched_out = np.zeros((len(words_out), lengths_out.max(initial=0)), dtype=bool)
+
+    # Read words are mostly right, such words are a single block
+    is_same = np.fromiter(map(str.__eq__, words_in, words_out), dtype=bool, count=len(words_in))
+    matched_in[is_same] = np.arange(matched_in.shape[1]) < lengths_in[is_same, None]
+    matched_out[is_same] = np.arange(matched_out.shape[1]) < lengths_out[is_same, None]
+
+    # Popular letters of long read words are junk for SequenceMatcher, such pairs are left to it
+    is_long = lengths_out >= AUTOJUNK_LENGTH
+    for i in np.flatnonzero(is_long):
+        for low_in, low_out, size in difflib.SequenceMatcher(None, words_in[i], words_out[i]).get_matching_blocks():
+            matched_in[i, low_in:low_in + size] = True
+            matched_out[i, low_out:low_out + size] = True
+
+    pairs = np.flatnonzero(~is_same & ~is_long & (lengths_in != 0) & (lengths_out != 0))
+    widths = np.maximum(lengths_in, lengths_out)[pairs]
+    order = np.argsort(widths, kind='stable')
+    pairs, widths = pairs[order], widths[order]
+    start = 0
+    while start < len(pairs):
+        width = widths[min(start + BATCH_CHUNK, len(pairs)) - 1]
+        stop = start + max(1, min(BATCH_CHUNK, TABLE_SIZE // width ** 2))
+        chunk = pairs[start:stop]
+        codes_in, chunk_lengths_in = encode([words_in[i] for i in chunk])
+        codes_out, chunk_lengths_out = encode([words_out[i] for i in chunk])
+        in_, out = _match_blocks(codes_in, chunk_lengths_in, codes_out, chunk_lengths_out)
+        matched_in[chunk, :in_.shape[1]] = in_
+        matched_out[chunk, :out.shape[1]] = out
+        start = stop
+    return matched_in, matched_out
+
+
+def _match_blocks(codes_in, lengths_in, codes_out, lengths_out):
+    """Matching blocks of a chunk of pairs of non empty words (see matching_masks)"""
+    nb_pairs, width_in = codes_in.shape
+    width_out = codes_out.shape[1]
+    positions_in = np.arange(width_in)
+    positions_out = np.arange(width_out)
+    dtype = np.int8 if max(width_in, width_out) < np.iinfo(np.int8).max else np.int32
+
+    # Length of the common substring ending at each pair of letters
+    equal = codes_in[:, :, None] == codes_out[:, None, :]
+    equal &= (positions_in < lengths_in[:, None])[:, :, None]
+    equal &= (positions_out < lengths_out[:, None])[:, None, :]
+    runs = equal.astype(dtype)
+    for i in range(1, width_in):
+        runs[:, i, 1:] += runs[:, i - 1, :-1] * equal[:, i, 1:]
+
+    matched_in = np.zeros((nb_pairs, width_in), dtype=bool)
+    matched_out = np.zeros((nb_pairs, width_out), dtype=bool)
+    # Windows left to align: pair, [low_in, high_in) of expected word, [low_out, high_out) of read word
+    pair = np.arange(nb_pairs)
+    low_in, high_in = np.zeros(nb_pairs, dtype=np.int64), lengths_in
+    low_out, high_out = np.zeros(nb_pairs, dtype=np.int64), lengths_out
+    while len(pair) != 0:
+        # Common substrings are cut at the start of the window and dropped if they end out of it
+        limit_in = np.where(positions_in < high_in[:, None], positions_in - low_in[:, None] + 1, 0).clip(0).astype(dtype)
+        limit_out = np.where(positions_out < high_out[:, None], positions_out - low_out[:, None] + 1, 0).clip(0).astype(dtype)
+        sizes = np.minimum(runs[pair], limit_in[:, :, None])
+        np.minimum(sizes, limit_out[:, None, :], out=sizes)
+        sizes = sizes.reshape(len(pair), -1)
+        # The first longest block in order of its end, as SequenceMatcher.find_longest_match
+        best = sizes.argmax(axis=1)
+        size = sizes[np.arange(len(pair)), best].astype(np.int64)
+        found = size != 0
+        pair, low_in, high_in, low_out, high_out = (a[found] for a in (pair, low_in, high_in, low_out, high_out))
+        size = size[found]
+        block_in = best[found] // width_out - size + 1
+        block_out = best[found] % width_out - size + 1
+
+        # Windows of a pair do not overlap, so its letters are set at most once per step
+        rows, columns = np.nonzero((positions_in >= block_in[:, None]) & (positions_in < (block_in + size)[:, None]))
+        matched_in[pair[rows], columns] = True
+        rows, columns = np.nonzero((positions_out >= block_out[:, None]) & (positions_out < (block_out + size)[:, None]))
+        matched_out[pair[rows], columns] = True
+
+        left = (block_in > low_in) & (block_out > low_out)
+        right = (block_in + size < high_in) & (block_out + size < high_out)
+        pair = np.concatenate((pair[left], pair[right]))
+        low_in, high_in = np.concatenate((low_in[left], (block_in + size)[right])), np.concatenate((block_in[left], high_in[right]))
+        low_out, high_out = np.concatenate((low_out[left], (block_out + size)[right])), np.concatenate((block_out[left], high_out[right]))
+    return matched_in, matched_out
+
+
+def count_errors(words_in, words_out):
+    """Number of letters of expected words which are not matched in read words, as len(word_in) minus
+    total size of matching blocks of difflib.SequenceMatcher
+
+    :param words_in: list
+        the expected words
+    :param words_out: list
+        the read words
+    :return: numpy.ndarray
+        number of errors of each pair
+    """
+    matched_in, _ = matching_masks(words_in, words_out)
+    return np.fromiter(map(len, words_in), dtype=np.int64, count=len(words_in)) - matched_in.sum(axis=1)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+#  -*- coding: utf-8 -*-
+
+# Builtin imports
+import argparse
+import csv
+import difflib
+import os
+import random
+import sys
+import time
+
+# Dependency imports
+import numpy as np
+
+# Local imports
+import scoring
+
+OUT_DIR = os.path.join('..', 'RecognEstimator', 'Out')
+CSV_FILENAMES = ('last_data_b0.csv', 'last_data_b1.csv')
+
+
+def read_estimator_csv(path):
+    """Words and total number of errors saved by Estimator
+
+    :return: (list, list, float)
+        expected words (upper case), recognized words, overall quality
+    """
+    with open(path, 'r', encoding='cp1251', newline='') as f:
+        rows = [row for row in csv.reader(f) if len(row) != 0]
+    quality = next(float(row[1]) for row in rows if row[0].startswith('q ='))
+    return [word.upper() for word in rows[0][1:]], rows[1][1:], quality
+
+
+def difflib_masks(word_in, word_out):
+    matched_in = np.zeros(len(word_in), dtype=bool)
+    matched_out = np.zeros(len(word_out), dtype=bool)
+    for low_in, low_out, size in difflib.SequenceMatcher(None, word_in, word_out).get_matching_blocks():
+        matched_in[low_in:low_in + size] = True
+        matched_out[low_out:low_out + size] = True
+    return matched_in, matched_out
+
+
+def mismatches(words_in, words_out):
+    """Indices of pairs whose masks differ from ones of difflib"""
+    matched_in, matched_out = scoring.matching_masks(words_in, words_out)
+    different = []
+    for i, (word_in, word_out) in enumerate(zip(words_in, words_out)):
+        expected_in, expected_out = difflib_masks(word_in, word_out)
+        if (matched_in[i, :len(word_in)] != expected_in).any() or matched_in[i, len(word_in):].any() or \
+                (matched_out[i, :len(word_out)] != expected_out).any() or matched_out[i, len(word_out):].any():
+            different.append(i)
+    return different
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Check that batch scoring gives the same alignment as difflib and time it')
+    parser.add_argument("--pairs", default=1000000, type=int, help="Number of pairs to time batch scoring on")
+    parser.add_argument("--random-pairs", default=20000, type=int, help="Number of random pairs checked against difflib")
+    args = parser.parse_args()
+
+    failed = False
+    pairs = []
+    for filename in CSV_FILENAMES:
+        words_in, words_out, quality = read_estimator_csv(os.path.join(OUT_DIR, filename))
+        errors = scoring.count_errors(words_in, words_out).sum()
+        different = mismatches(words_in, words_out)
+        print(f'{filename}: {errors} errors, {quality:.0f} saved by Estimator, {len(different)} pairs aligned otherwise than by difflib')
+        failed |= errors != quality or len(different) != 0
+        pairs += zip(words_in, words_out)
+
+    # Small alphabet gives many ties of longest blocks
+    rng = random.Random(0)
+    random_pairs = [tuple(''.join(rng.choices('ABC', k=rng.randint(0, 15))) for _ in range(2)) for _ in range(args.random_pairs)]
+    different = mismatches(*map(list, zip(*random_pairs)))
+    print(f'{len(random_pairs)} random pairs: {len(different)} aligned otherwise than by difflib')
+    failed |= len(different) != 0
+
+    words_in, words_out = map(list, zip(*(pairs[i % len(pairs)] for i in range(args.pairs))))
+    start = time.perf_counter()
+    scoring.count_errors(words_in, words_out)
+    batch_time = time.perf_counter() - start
+    sample = min(args.pairs, 50000)
+    start = time.perf_counter()
+    for word_in, word_out in zip(words_in[:sample], words_out[:sample]):
+        difflib.SequenceMatcher(None, word_in, word_out).get_matching_blocks()
+    difflib_time = (time.perf_counter() - start) * args.pairs / sample
+    print(f'{args.pairs} pairs of Estimator words: batch scoring {batch_time:.2f} s, difflib {difflib_time:.2f} s '
+          f'(estimated on {sample} pairs)')
+
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+#  -*- coding: utf-8 -*-
+
+# Builtin imports
+import os
+import sys
+import timeit
+
+# Dependency imports
+import numpy as np
+
+# Local imports
+import image_proc
+
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'RecognEstimator'))
+import text2image
+
+FONTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'RecognEstimator', 'Fonts')
+ALPHABET = u'АБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯ'
+
+
+def make_word_image(num_of_letters, fontpath=os.path.join(FONTS_DIR, "Consolas.ttf"), fontsize=40):
+    """Render a word of the requested length the way Estimator does
+
+    :param num_of_letters: int
+        length of the word
+    :return: PIL.Image
+        grayscale image of the word
+    """
+    word = ''.join(ALPHABET[i % len(ALPHABET)] for i in range(num_of_letters))
+    return text2image.text2image(word, fontpath=fontpath, fontsize=fontsize).convert("L")
+
+
+def benchmark(num_of_letters, repeat=5, number=20):
+    """Compare get_contours with get_contours_legacy on a single word image
+
+    :return: (float, float)
+        best time per call in seconds for the legacy loop and the vectorized engine
+    """
+    im = make_word_image(num_of_letters)
+    assert np.array_equal(image_proc.get_contours(im), image_proc.get_contours_legacy(im)), \
+        f'Segmentation engines disagree on {num_of_letters}-letter word'
+    legacy = min(timeit.repeat(lambda: image_proc.get_contours_legacy(im), repeat=repeat, number=number)) / number
+    vectorized = min(timeit.repeat(lambda: image_proc.get_contours(im), repeat=repeat, number=number)) / number
+    return legacy, vectorized
+
+
+if __name__ == '__main__':
+    print('Letters\tLegacy, ms\tVectorized, ms\tSpeedup')
+    for n in (5, 15, 40):
+        t_legacy, t_vectorized = benchmark(n)
+        print(f'{n}\t{t_legacy * 1e3:.3f}\t\t{t_vectorized * 1e3:.3f}\t\t{t_legacy / t_vectorized:.1f}x')
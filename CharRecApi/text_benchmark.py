@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+#  -*- coding: utf-8 -*-
+
+# Builtin imports
+import argparse
+import functools
+import os
+import random
+import sys
+import time
+
+# Local imports
+import dictionary
+import model
+import WordRecognitionServer
+
+RECOGN_ESTIMATOR_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'RecognEstimator')
+sys.path.insert(1, RECOGN_ESTIMATOR_DIR)
+import text2image
+
+FONTSIZE = 40
+
+
+def load_paragraphs(fontname, num_of_paragraphs, num_of_lines, words_per_line):
+    """Paragraphs of random dictionary words, rendered as a whole and line by line
+
+    :return: list
+        list of (lines of text, PNG of the paragraph, PNG of each line)
+    """
+    all_words = dictionary.read_hunspell_words(os.path.join(RECOGN_ESTIMATOR_DIR, 'Hunspell disctionaries', 'ru_RU.dic'))
+    rng = random.Random(0)
+    params = {'fontpath': os.path.join(RECOGN_ESTIMATOR_DIR, "Fonts", fontname), 'fontsize': FONTSIZE}
+    paragraphs = []
+    for _ in range(num_of_paragraphs):
+        lines = [' '.join(rng.choices([w for w in all_words if 3 <= len(w) <= 8], k=words_per_line)) for _ in range(num_of_lines)]
+        # Each line is as wide as the widest one, so that lines are not wrapped
+        width = max(text2image.text2image(line, **params).width for line in lines)
+        paragraph = text2image.text2image('\n'.join(lines), width_fit_algo=text2image.WidthFittingAlgo.Manually,
+                                          width_manual=width, **params)
+        paragraphs.append((lines, text2image.image2png(paragraph),
+                           [text2image.image2png(text2image.text2image(line, **params)) for line in lines]))
+    return paragraphs
+
+
+def recognize_text(client, png):
+    response = client.post('/api/text', data=png, content_type='application/octet-stream',
+                           query_string={'lang': 'ru', 'is_binarize': 0})
+    if response.status_code != 200:
+        raise RuntimeError(f'Got error code {response.status_code}: {response.get_data(as_text=True)}')
+    return response.get_json()
+
+
+def throughput(function, items, repeat):
+    """Best number of items per second over repeats"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            function(item)
+        times.append(time.perf_counter() - start)
+    return len(items) / min(times)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Compare recognition of paragraphs in one request with one request per line')
+    parser.add_argument("--font", default="Consolas.ttf", help="Font from RecognEstimator/Fonts")
+    parser.add_argument("--paragraphs", default=10, type=int, help="Number of paragraphs")
+    parser.add_argument("--lines", default=8, type=int, help="Number of lines per paragraph")
+    parser.add_argument("--words-per-line", default=4, type=int, help="Number of words per line")
+    parser.add_argument("--backend", default='numpy', choices=model.BACKENDS, help="Engine computing the model")
+    parser.add_argument("--repeat", default=3, type=int, help="Number of repeats, best one is kept")
+    args = parser.parse_args()
+
+    WordRecognitionServer.words_predictors = model.LazyPredictors({
+        'ru': functools.partial(model.load_words_predictor, "weights/comnist_keras_ru.hdf5", lang_in='ru', backend=args.backend)})
+    WordRecognitionServer.words_predictors.load_all()
+    client = WordRecognitionServer.app.test_client()
+
+    paragraphs = load_paragraphs(args.font, args.paragraphs, args.lines, args.words_per_line)
+
+    # Paragraph must be read as its lines one by one
+    same_text = 0
+    same_words = 0
+    for lines, paragraph_png, lines_png in paragraphs:
+        paragraph = recognize_text(client, paragraph_png)
+        by_line = [recognize_text(client, png)['text'] for png in lines_png]
+        same_text += paragraph['text'] == '\n'.join(by_line)
+        same_words += sum(len(line['text'].split(' ')) == args.words_per_line for line in paragraph['lines']) == len(lines)
+    print(f'{same_text} of {len(paragraphs)} paragraphs read as their lines one by one, '
+          f'{same_words} split into the right numbers of lines and words')
+
+    paragraph_rate = throughput(lambda item: recognize_text(client, item[1]), paragraphs, args.repeat)
+    line_rate = throughput(lambda item: [recognize_text(client, png) for png in item[2]], paragraphs, args.repeat)
+    print(f'{args.lines} lines of {args.words_per_line} words: {paragraph_rate * args.lines:.1f} lines/s with a request per paragraph, '
+          f'{line_rate * args.lines:.1f} lines/s with a request per line ({paragraph_rate / line_rate:.2f}x)')
+
+    if same_text != len(paragraphs):
+        sys.exit(1)
@@ -5,19 +5,25 @@
 import csv
 import os
 import time
-from typing import List
+from typing import List, Optional, Tuple
 import requests
 import enum
+import itertools
 import random
 import json
-import difflib
 import shutil
+import concurrent.futures
 
 # Dependency imports
 import matplotlib.pyplot as plt
+import requests.adapters
+import urllib3.util
 
 # Local imports
 import text2image
+import local_recognizer
+import run_journal
+import word_dataset
 
 # Launch server together with client (alternatevely, run 'python WordRecognitionServer.py')
 # import sys, os
@@ -29,6 +35,21 @@ class Mode(enum.Enum):
     SingleWord = 1,
     MultipleWords = 2
 
+
+class Transport(enum.Enum):
+    Http = 1,  # Words are sent to running WordRecognitionServer
+    InProcess = 2  # Words are recognized by a pool of local processes, without server
+
+
+def recognize_word(session: requests.Session, img: bytes, word: str, is_binarize: bool,
+                   size: Optional[Tuple[int, int]] = None) -> requests.Response:
+    """Send PNG image (or raw grayscale pixels if size (width, height) is supplied) to the server"""
+    params = {'word': word, 'lang': 'ru', 'num_of_letters': 1, 'is_binarize': is_binarize}
+    if size is not None:
+        params['width'], params['height'] = size
+    return session.post('http://127.0.0.1:5002/api/word', data=img,
+                        headers={'Content-Type': 'application/octet-stream'}, params=params)
+
 if __name__ == '__main__':
 
     # For debug
@@ -38,9 +59,20 @@ if __name__ == '__main__':
     is_binarize = True
     text2image_params = {'fontpath': os.path.join("Fonts", "Consolas.ttf"), 'fontsize': 40}
     num_of_words = 4000
+    seed = 0
 
     # Some other arguments
     output_folder = 'Out'
+    transport = Transport.Http
+    use_dataset = True  # Take images from pre-rendered dataset (rendered on first run) instead of rendering them
+    max_requests_in_flight = 8
+    max_retries = 100  # Of a request rejected by an overloaded server
+    num_of_workers = os.cpu_count()  # For Transport.InProcess
+    # One journal per modeling arguments, so that a run with other ones does not overwrite it
+    journal_path = os.path.join(output_folder, f"journal_{seed}_{num_of_words}_{'bin' if is_binarize else 'nobin'}_"
+                                               f"{os.path.splitext(os.path.basename(text2image_params['fontpath']))[0]}_"
+                                               f"{text2image_params['fontsize']}.csv")
+    resume = True  # Continue the unfinished run of the journal, a finished one is done again
 
     if mode is Mode.MultipleWords:
 
@@ -54,48 +86,71 @@ if __name__ == '__main__':
         for i in range(len(all_words)):
             all_words[i] = all_words[i][0 : all_words[i].find('/')]
 
-        random.seed(0)
+        random.seed(seed)
         random_words: List[str] = random.choices(population=all_words, k=num_of_words)
 
+        params = {'seed': seed, 'num_of_words': num_of_words, 'is_binarize': is_binarize, 'text2image_params': text2image_params}
+        journal = run_journal.RunJournal(journal_path, params, resume, num_of_words)
+        if journal.num_done != 0:
+            # Server, its backend and transport are not parameters of the journal, they must not have changed
+            print(f'Resuming journal {journal_path}: results of {journal.num_done} words recognized by a previous run '
+                  f'are reused')
+        words_left = ((i, random_words[i].upper()) for i in range(num_of_words) if not journal.is_done(i))
+
         print('Guessed\t\tRecognized')
 
-        quality_raw = [0] * num_of_words
-        recognized_words = ['']*num_of_words
-        current_word = 0
-        for word in random_words:
-            word = word.upper()
-            imgAsString = text2image.image2b64(text2image.text2image(word, **text2image_params))
-            response = requests.post('http://127.0.0.1:5002/api/word', json={'img': imgAsString, 'word': word, 'lang': 'ru',
-                                                                             'num_of_letters': 1, 'is_binarize': is_binarize})
+        def handle_recognized_word(current_word: int, recognized_word: str, latency: float) -> None:
+            word = random_words[current_word].upper()
+            journal.append(current_word, random_words[current_word], recognized_word, latency)
+            print(f'{current_word}. {word}\t\t{recognized_word}')
+
+        def handle_response(current_word: int, response: requests.Response) -> None:
             if response.ok:
-                data = json.loads(json.loads(response.text))
-                recognized_word: str = data['word']
-                word = word.upper()
-                diff = difflib.SequenceMatcher(None, word, recognized_word).get_matching_blocks()
-                est_of_quality = len(word) - sum([i[2] for i in diff])
-                quality_raw[current_word] = est_of_quality
-                recognized_words[current_word] = recognized_word
-                print(f'{current_word}. {word}\t\t{recognized_word}')
+                data = response.json()
+                handle_recognized_word(current_word, data['word'], response.elapsed.total_seconds())
             else:
-                print(f'Warning! Got error code {response.status_code} while recognising word {word}')
-            current_word += 1
+                journal.append(current_word, random_words[current_word], None, response.elapsed.total_seconds())
+                print(f'Warning! Got error code {response.status_code} while recognising word {random_words[current_word].upper()}')
 
+        dataset = word_dataset.load_dataset([word.upper() for word in random_words], text2image_params) if use_dataset else None
+
+        with journal:
+            if transport is Transport.InProcess:
+                with local_recognizer.LocalRecognizer(num_of_workers) as recognizer:
+                    for current_word, recognized_word, latency in recognizer.iter_recognize(
+                            words_left, is_binarize, text2image_params, dataset.path if dataset is not None else None):
+                        handle_recognized_word(current_word, recognized_word, latency)
+            else:
+                # Up to max_requests_in_flight requests are sent over kept alive connections,
+                # while next words are rendered. Results are stored by index of word, so they do not depend on order of responses
+                # Requests rejected by an overloaded server (503) are sent again after the delay it asks for
+                retries = urllib3.util.Retry(total=max_retries, connect=0, read=0, status_forcelist=[503], allowed_methods=None,
+                                             respect_retry_after_header=True, raise_on_status=False)
+                with requests.Session() as session, \
+                        concurrent.futures.ThreadPoolExecutor(max_workers=max_requests_in_flight) as executor:
+                    session.mount('http://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max_requests_in_flight,
+                                                                           max_retries=retries))
+                    in_flight = {}  # Future -> index of word
+                    for current_word, word in words_left:
+                        if dataset is not None:
+                            img = dataset.array(dataset.index(word))
+                            img_data, img_size = img.tobytes(), (img.shape[1], img.shape[0])
+                        else:
+                            img_data, img_size = text2image.image2png(text2image.text2image(word, **text2image_params)), None
+                        if len(in_flight) >= max_requests_in_flight:
+                            done, _ = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+                            for future in done:
+                                handle_response(in_flight.pop(future), future.result())
+                        in_flight[executor.submit(recognize_word, session, img_data, word, is_binarize, img_size)] = current_word
+                    for future in concurrent.futures.as_completed(in_flight):
+                        handle_response(in_flight[future], future.result())
+
+        # Time of this session only, if the run was resumed
         elapsed_time = time.time() - begin_time
         print(f'Elapsed {elapsed_time}')
 
-        overall_quality = 0
-        overall_quality_norm = 0
-        max_len_of_word = max([len(w) for w in random_words])
-        quality_array = [0] * max_len_of_word
-        quality_num = [0] * max_len_of_word
-        for i in range(len(quality_raw)):
-            overall_quality += quality_raw[i]
-            overall_quality_norm += quality_raw[i] / len(random_words[i])
-            quality_array[len(random_words[i]) - 1] += quality_raw[i]
-            quality_num[len(random_words[i]) - 1] += 1
-        for i in range(len(quality_array)):
-            if quality_num[i] != 0:
-                quality_array[i] /= quality_num[i]
+        # Aggregates and rows of words are streamed from the journal
+        quality_array, overall_quality, overall_quality_norm = run_journal.summarize(journal_path)
 
         pretty_time = time.strftime('%Y %m %d %H.%M.%S', time.localtime())
 
@@ -110,8 +165,10 @@ if __name__ == '__main__':
         csv_file_path = os.path.join(output_folder, f'{pretty_time}.csv')
         with open(csv_file_path, 'w') as f:
             writer = csv.writer(f)
-            writer.writerow([f"random_words: ", *random_words])
-            writer.writerow([f"recognized words: ", *recognized_words])
+            writer.writerow(itertools.chain([f"random_words: "],
+                                            (result.word for result in run_journal.iter_ordered_results(journal_path))))
+            writer.writerow(itertools.chain([f"recognized words: "],
+                                            (result.recognized_word for result in run_journal.iter_ordered_results(journal_path))))
             writer.writerow([f"quality_array: "])
             writer.writerows([[i + 1, quality_array[i]] for i in range(len(quality_array))])
             writer.writerow(["q = ", f"{overall_quality:2f}", "q_norm = ", f"{overall_quality_norm:2f}"])
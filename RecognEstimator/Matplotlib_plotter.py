@@ -1,5 +1,6 @@
 import csv
 import os.path
+import sys
 
 import matplotlib.pyplot as plt
 
@@ -25,6 +26,32 @@ def get_data(path: str):
     return random_words, quality
 
 
+def plot_sweep(path: str):
+    """Plot errors by number of letters of each configuration of a results table of sweep.py"""
+    # Imported here, plotting CSVs of Estimator does not need the recognizer imported by sweep
+    import sweep
+
+    configs = sweep.read_table(path)
+    plt.figure()
+    for config, rows in configs.items():
+        plt.plot([row['length'] for row in rows], [row['errors_per_word'] for row in rows],
+                 label=f"{os.path.splitext(config.font)[0]} {config.fontsize}, "
+                       f"{'с бинаризацией' if config.is_binarize else 'без бинаризации'}, {config.min_length}-{config.max_length}")
+    plt.xticks(sorted({row['length'] for rows in configs.values() for row in rows}))
+    plt.grid(visible=True)
+    plt.title('Зависимость количества ошибок в распознавании букв\nот количества букв в слове')
+    plt.xlabel('Количество букв')
+    plt.ylabel('Количество ошибок')
+    plt.legend(fontsize='x-small')
+    plt.savefig(f'{os.path.splitext(os.path.basename(path))[0]}_err.jpg', dpi=150)
+    plt.show()
+
+
+# Results table of sweep.py may be given instead of two CSVs of Estimator
+if len(sys.argv) > 1:
+    plot_sweep(sys.argv[1])
+    sys.exit()
+
 file_bin = os.path.join('Out', 'last_data_b1.csv')
 file_without_bin = os.path.join('Out', 'last_data_b0.csv')
 
@@ -0,0 +1,121 @@
+#  -*- coding: utf-8 -*-
+
+# Builtin imports
+import concurrent.futures
+import multiprocessing
+import os
+import itertools
+import sys
+import time
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+# Local imports
+import text2image
+import word_dataset
+
+CHAR_REC_API_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'CharRecApi')
+WEIGHTS_PATH = os.path.join(CHAR_REC_API_DIR, 'weights', 'comnist_keras_ru.hdf5')
+
+# Per worker process state
+_word_predictor = None
+_image_proc = None
+_datasets = {}  # Path -> word_dataset.WordDataset
+
+
+def init_worker(weights_path: str = WEIGHTS_PATH, lang: str = 'ru') -> None:
+    """Load weights once per worker process"""
+    global _word_predictor, _image_proc
+    sys.path.insert(1, CHAR_REC_API_DIR)
+    import image_proc
+    import model
+    _image_proc = image_proc
+    _word_predictor = model.load_word_predictor(weights_path, lang_in=lang)
+
+
+def recognize_words(words: List[str], is_binarize: bool, text2image_params: dict, dataset_path: Optional[str] = None,
+                    with_latency: bool = False) -> list:
+    """Render and recognize words in the current process, the same way WordRecognitionServer does for /api/word
+
+    :param words: words to render
+    :param is_binarize: if images must be binarized
+    :param text2image_params: parameters of text2image
+    :param dataset_path: if supplied, images are taken from this pre-rendered dataset instead of being rendered
+    :param with_latency: if True, each recognized word is paired with time it took in seconds
+    :return: recognized words
+    """
+    if _word_predictor is None:
+        init_worker()
+    dataset = None
+    if dataset_path is not None:
+        dataset = _datasets.get(dataset_path)
+        if dataset is None:
+            dataset = _datasets[dataset_path] = word_dataset.WordDataset(dataset_path)
+    recognized_words = []
+    for word in words:
+        start = time.perf_counter()
+        if dataset is not None:
+            img = _image_proc.preprocess_array(dataset.array(dataset.index(word)), is_binarize)
+        else:
+            img = _image_proc.preprocess(text2image.text2image(word, **text2image_params), is_binarize)
+        words_out = _word_predictor(img, 1)
+        recognized_word = ''.join(list(words_out[:, 0])) if words_out.size != 0 else ''
+        recognized_words.append((recognized_word, time.perf_counter() - start) if with_latency else recognized_word)
+    return recognized_words
+
+
+class LocalRecognizer:
+    """Pool of processes recognizing words without going through WordRecognitionServer
+
+    Each worker loads the weights once, words are sharded across workers in chunks
+    """
+
+    def __init__(self, num_of_workers: Optional[int] = None, chunk_size: int = 25,
+                 weights_path: str = WEIGHTS_PATH, lang: str = 'ru'):
+        self.chunk_size = chunk_size
+        self.num_of_workers = num_of_workers if num_of_workers is not None else os.cpu_count()
+        # Tensorflow does not survive fork, so workers are spawned
+        self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=num_of_workers,
+                                                                mp_context=multiprocessing.get_context('spawn'),
+                                                                initializer=init_worker, initargs=(weights_path, lang))
+
+    def recognize(self, words: List[str], is_binarize: bool, text2image_params: dict, dataset_path: Optional[str] = None) -> List[str]:
+        """Recognize words (taking images from pre-rendered dataset if its path is supplied), result is in the same order as words"""
+        chunks = [words[i:i + self.chunk_size] for i in range(0, len(words), self.chunk_size)]
+        futures = [self._executor.submit(recognize_words, chunk, is_binarize, text2image_params, dataset_path) for chunk in chunks]
+        return [recognized_word for future in futures for recognized_word in future.result()]
+
+    def iter_recognize(self, words: Iterable[Tuple[int, str]], is_binarize: bool, text2image_params: dict,
+                       dataset_path: Optional[str] = None) -> Iterator[Tuple[int, str, float]]:
+        """Recognize (index, word) pairs, yielding (index, recognized word, latency in seconds) as soon as a chunk is done
+
+        Only two chunks per worker are submitted at a time, so words may come from a generator of any length
+        """
+        words = iter(words)
+        in_flight = {}  # Future -> indices of words
+        while True:
+            while len(in_flight) < 2 * self.num_of_workers:
+                chunk = list(itertools.islice(words, self.chunk_size))
+                if len(chunk) == 0:
+                    break
+                future = self._executor.submit(recognize_words, [word for _, word in chunk], is_binarize, text2image_params,
+                                               dataset_path, True)
+                in_flight[future] = [index for index, _ in chunk]
+            if len(in_flight) == 0:
+                return
+            done, _ = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                for index, (recognized_word, latency) in zip(in_flight.pop(future), future.result()):
+                    yield index, recognized_word, latency
+
+    def submit(self, function, *args) -> concurrent.futures.Future:
+        """Run a function in a worker, whose weights are already loaded (e.g. recognize_words with its own parameters)"""
+        return self._executor.submit(function, *args)
+
+    def close(self) -> None:
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,207 @@
+#  -*- coding: utf-8 -*-
+
+# Builtin imports
+import csv
+import heapq
+import json
+import os
+import sys
+import tempfile
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+# Local imports
+import local_recognizer
+
+sys.path.insert(1, local_recognizer.CHAR_REC_API_DIR)
+import scoring
+
+# Results are scored and written by batches of this size, at most that many are lost on a crash
+BUFFER_SIZE = 256
+# Ordered reads sort results by chunks of this size, spilled to temporary files and merged
+CHUNK_SIZE = 16384
+PARAMS_PREFIX = '#'
+
+
+class Result(NamedTuple):
+    index: int
+    word: str
+    recognized_word: Optional[str]  # None if the word failed to be recognized
+    errors: int
+    latency: float
+
+
+class RunJournal:
+    """Results of words of an Estimator run, appended to a CSV file as they come
+
+    The first line keeps the parameters of the run (as JSON after '#'), then each line is a word:
+    index, word, recognized word, number of errors (empty if the word failed to be recognized), latency in seconds.
+    Lines are written by small batches, the errors of a batch are counted at once by scoring.count_errors
+    against upper case words, so memory does not depend on the number of words.
+    An unfinished journal of a run with the same parameters is resumed: words which were recognized are not done again,
+    failed words and the last line if it was cut by a crash are dropped. Any other journal is overwritten.
+    """
+
+    def __init__(self, path: str, params: dict, resume: bool = True, num_of_words: Optional[int] = None):
+        """
+        :param path: path to the journal
+        :param params: parameters of the run, a journal is resumed only if it was started with the same ones
+        :param resume: if False, an existing journal is overwritten
+        :param num_of_words: number of words of the run, a journal where all of them were recognized is overwritten
+            rather than resumed, so that a rerun recognizes them again
+        """
+        self.path = path
+        self.params = params
+        self._next = 0  # All words of lower indices are done
+        self._done = set()  # Done words of indices from self._next on
+        self._buffer: List[Tuple[int, str, Optional[str], float]] = []
+
+        if resume and self._is_resumable(num_of_words):
+            # Journal is rewritten in order of index without failed words, which are done again
+            rewritten_path = path + '.tmp'
+            with open(rewritten_path, 'w', encoding='utf-8', newline='') as f:
+                f.write(PARAMS_PREFIX + json.dumps(params, ensure_ascii=False) + '\n')
+                writer = csv.writer(f, lineterminator='\n')
+                for result in iter_ordered_results(path):
+                    if result.recognized_word is not None:
+                        writer.writerow(_row(result))
+                        self._mark_done(result.index)
+            os.replace(rewritten_path, path)
+            self._file = open(path, 'a', encoding='utf-8', newline='')
+        else:
+            self._file = open(path, 'w', encoding='utf-8', newline='')
+            self._file.write(PARAMS_PREFIX + json.dumps(params, ensure_ascii=False) + '\n')
+            self._file.flush()
+        self._writer = csv.writer(self._file, lineterminator='\n')
+        self.num_done = self._next + len(self._done)
+
+    def _is_resumable(self, num_of_words: Optional[int]) -> bool:
+        # A journal cut before its parameters were written is started again
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0 or read_params(self.path) != self.params:
+            return False
+        return num_of_words is None or \
+            sum(result.recognized_word is not None for result in iter_results(self.path)) < num_of_words
+
+    def _mark_done(self, index: int) -> None:
+        self._done.add(index)
+        while self._next in self._done:
+            self._done.remove(self._next)
+            self._next += 1
+
+    def is_done(self, index: int) -> bool:
+        """If the word was recognized, in this session or in a resumed one"""
+        return index < self._next or index in self._done
+
+    def append(self, index: int, word: str, recognized_word: Optional[str], latency: float) -> None:
+        """Add result of a word, None as recognized word if it failed to be recognized"""
+        self._buffer.append((index, word, recognized_word, latency))
+        if recognized_word is not None:
+            self._mark_done(index)
+            self.num_done += 1
+        if len(self._buffer) >= BUFFER_SIZE:
+            self.flush()
+
+    def flush(self) -> None:
+        """Count errors of buffered words and write them"""
+        recognized = [item for item in self._buffer if item[2] is not None]
+        errors = scoring.count_errors([word.upper() for _, word, _, _ in recognized],
+                                      [recognized_word for _, _, recognized_word, _ in recognized]).tolist()
+        errors = iter(errors)
+        for index, word, recognized_word, latency in self._buffer:
+            self._writer.writerow(_row(Result(index, word, recognized_word,
+                                              next(errors) if recognized_word is not None else 0, latency)))
+        self._file.flush()
+        self._buffer.clear()
+
+    def close(self) -> None:
+        self.flush()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def _row(result: Result) -> list:
+    if result.recognized_word is None:
+        return [result.index, result.word, '', '', f'{result.latency:.6f}']
+    return [result.index, result.word, result.recognized_word, result.errors, f'{result.latency:.6f}']
+
+
+def read_params(path: str) -> dict:
+    """Parameters of the run of the journal"""
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        return json.loads(f.readline()[len(PARAMS_PREFIX):])
+
+
+def _result(row: List[str]) -> Result:
+    index, word, recognized_word, errors, latency = row
+    if errors == '':
+        return Result(int(index), word, None, 0, float(latency))
+    return Result(int(index), word, recognized_word, int(errors), float(latency))
+
+
+def iter_results(path: str) -> Iterator[Result]:
+    """Results in order they were written, failed words have no errors counted (0)"""
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        f.readline()
+        for line in f:
+            # Line cut by a crash
+            if not line.endswith('\n'):
+                break
+            yield _result(next(csv.reader([line])))
+
+
+def _index(result: Result) -> int:
+    return result.index
+
+
+def iter_ordered_results(path: str) -> Iterator[Result]:
+    """Results in order of index of word
+
+    Results are sorted by chunks of CHUNK_SIZE, all chunks but the last one are spilled to temporary files,
+    then chunks are merged: memory does not depend on the number of words nor on how far from order they were written
+    (e.g. failed words done again at the end of a resumed journal)
+    """
+    spilled = []
+    try:
+        chunk = []
+        for result in iter_results(path):
+            chunk.append(result)
+            if len(chunk) == CHUNK_SIZE:
+                f = tempfile.TemporaryFile('w+', encoding='utf-8', newline='')
+                spilled.append(f)
+                csv.writer(f, lineterminator='\n').writerows(map(_row, sorted(chunk, key=_index)))
+                f.seek(0)
+                chunk = []
+        chunk.sort(key=_index)
+        yield from heapq.merge(*((_result(row) for row in csv.reader(f)) for f in spilled), chunk, key=_index)
+    finally:
+        for f in spilled:
+            f.close()
+
+
+def summarize(path: str) -> Tuple[List[float], int, float]:
+    """Aggregate results of the journal, streaming over it in order they were written
+
+    :return: mean number of errors by length of word (from 1 letter to the longest word),
+        overall number of errors, overall number of errors normalized by length of word
+    """
+    overall_quality = 0
+    overall_quality_norm = 0
+    quality_array = []
+    quality_num = []
+    for result in iter_results(path):
+        length = len(result.word)
+        if length > len(quality_array):
+            quality_array += [0] * (length - len(quality_array))
+            quality_num += [0] * (length - len(quality_num))
+        overall_quality += result.errors
+        overall_quality_norm += result.errors / length
+        quality_array[length - 1] += result.errors
+        quality_num[length - 1] += 1
+    for i in range(len(quality_array)):
+        if quality_num[i] != 0:
+            quality_array[i] /= quality_num[i]
+    return quality_array, overall_quality, overall_quality_norm
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+#  -*- coding: utf-8 -*-
+
+# Builtin imports
+import argparse
+import collections
+import concurrent.futures
+import csv
+import os
+import random
+import sys
+import time
+from typing import Dict, List, NamedTuple, Tuple
+
+# Local imports
+import local_recognizer
+import word_dataset
+
+sys.path.insert(1, local_recognizer.CHAR_REC_API_DIR)
+import scoring
+
+FONTS_FOLDER = 'Fonts'
+DIC_FILENAME = os.path.join('Hunspell disctionaries', 'ru_RU.dic')
+TABLE_FIELDS = ('font', 'fontsize', 'is_binarize', 'min_length', 'max_length', 'length', 'num_of_words', 'errors',
+                'errors_per_word', 'latency')
+
+
+class Config(NamedTuple):
+    """Configuration of a sweep: words with lengths in [min_length, max_length] written with the font of the size"""
+    font: str
+    fontsize: int
+    is_binarize: bool
+    min_length: int
+    max_length: int
+
+    @property
+    def text2image_params(self) -> dict:
+        # Same parameters as Estimator, so that datasets it rendered are reused
+        return {'fontpath': os.path.join(FONTS_FOLDER, self.font), 'fontsize': self.fontsize}
+
+
+def parse_lengths(text: str) -> Tuple[int, int]:
+    """Range of lengths of words, as '5' or '3-10'"""
+    low, _, high = text.partition('-')
+    return int(low), int(high or low)
+
+
+def read_dictionary(path: str = DIC_FILENAME) -> List[str]:
+    """Words of the dictionary Estimator takes words from, in the same order"""
+    with open(path, 'r', encoding='utf-8') as f:
+        all_words = [i for i in f]
+    return [w[0: w.find('/')] for w in all_words[1:]]
+
+
+def sample_words(all_words: List[str], lengths: Tuple[int, int], num_of_words: int, seed: int) -> List[str]:
+    """Random upper case words with lengths in the range, the same for all configurations with this range"""
+    population = [w for w in all_words if lengths[0] <= len(w) <= lengths[1]]
+    if len(population) == 0:
+        raise AttributeError(f'Dictionary has no word with length from {lengths[0]} to {lengths[1]}')
+    return [w.upper() for w in random.Random(seed).choices(population=population, k=num_of_words)]
+
+
+def render_dataset(words: List[str], text2image_params: dict) -> str:
+    """Make sure that the dataset of the font and size holds the words, return its path"""
+    return word_dataset.load_dataset(words, text2image_params).path
+
+
+def run_sweep(configs: List[Config], num_of_words: int, seed: int = 0, num_of_workers: int = None,
+              chunk_size: int = 25) -> List[dict]:
+    """Recognize words of all configurations with one pool of processes
+
+    Each worker loads the weights once and recognizes chunks of words of any configuration. Each dataset of a font
+    and size is rendered once (by a worker, or reused from a previous run) for all binarization settings and ranges
+    of lengths, and chunks of its configurations are scheduled as soon as it is ready.
+
+    :return: rows of the results table (see TABLE_FIELDS), by configuration and length of word
+    """
+    all_words = read_dictionary()
+    words = {lengths: sample_words(all_words, lengths, num_of_words, seed)
+             for lengths in dict.fromkeys((config.min_length, config.max_length) for config in configs)}
+    fonts = collections.defaultdict(list)  # (font, fontsize) -> configurations
+    for config in configs:
+        fonts[config.font, config.fontsize].append(config)
+
+    recognized: Dict[Config, list] = {config: [None] * num_of_words for config in configs}
+    latencies: Dict[Config, list] = {config: [0.0] * num_of_words for config in configs}
+    with local_recognizer.LocalRecognizer(num_of_workers, chunk_size) as recognizer:
+        in_flight = {}  # Future -> (font, fontsize) of a dataset, or (configuration, index of the first word) of a chunk
+        for key, font_configs in fonts.items():
+            font_words = [word for config in font_configs for word in words[config.min_length, config.max_length]]
+            in_flight[recognizer.submit(render_dataset, font_words, font_configs[0].text2image_params)] = key
+        while len(in_flight) != 0:
+            done, _ = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                key = in_flight.pop(future)
+                if isinstance(key[0], Config):
+                    config, start = key
+                    for i, (recognized_word, latency) in enumerate(future.result(), start):
+                        recognized[config][i] = recognized_word
+                        latencies[config][i] = latency
+                    continue
+                path = future.result()
+                print(f'Dataset {path} is ready')
+                for config in fonts[key]:
+                    config_words = words[config.min_length, config.max_length]
+                    for start in range(0, num_of_words, chunk_size):
+                        chunk = config_words[start:start + chunk_size]
+                        in_flight[recognizer.submit(local_recognizer.recognize_words, chunk, config.is_binarize,
+                                                    config.text2image_params, path, True)] = (config, start)
+
+    rows = []
+    for config in configs:
+        config_words = words[config.min_length, config.max_length]
+        errors = scoring.count_errors(config_words, recognized[config]).tolist()
+        by_length = collections.defaultdict(lambda: [0, 0, 0.0])  # Length -> number of words, errors, latency
+        for word, word_errors, latency in zip(config_words, errors, latencies[config]):
+            by_length[len(word)][0] += 1
+            by_length[len(word)][1] += word_errors
+            by_length[len(word)][2] += latency
+        for length, (count, length_errors, latency) in sorted(by_length.items()):
+            rows.append({**config._asdict(), 'length': length, 'num_of_words': count, 'errors': length_errors,
+                         'errors_per_word': length_errors / count, 'latency': latency / count})
+        print(f'{config.font} {config.fontsize}, binarization {config.is_binarize}, lengths {config.min_length}-{config.max_length}: '
+              f'q = {sum(errors)}')
+    return rows
+
+
+def write_table(path: str, rows: List[dict]) -> None:
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=TABLE_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def read_table(path: str) -> Dict[Config, List[dict]]:
+    """Rows of a results table grouped by configuration, values converted back from text"""
+    configs = collections.defaultdict(list)
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f):
+            config = Config(row['font'], int(row['fontsize']), row['is_binarize'] == 'True',
+                            int(row['min_length']), int(row['max_length']))
+            configs[config].append({'length': int(row['length']), 'num_of_words': int(row['num_of_words']),
+                                    'errors': int(row['errors']), 'errors_per_word': float(row['errors_per_word']),
+                                    'latency': float(row['latency'])})
+    return configs
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Recognize words over a grid of fonts, sizes, binarization and lengths of words')
+    parser.add_argument("--fonts", nargs='+', default=sorted(os.listdir(FONTS_FOLDER)), help="Font files from Fonts folder")
+    parser.add_argument("--fontsizes", nargs='+', default=[40], type=int, help="Sizes of fonts")
+    parser.add_argument("--binarize", nargs='+', default=['0', '1'], choices=['0', '1'], help="Binarization settings")
+    parser.add_argument("--lengths", nargs='+', default=['1-24'], help="Ranges of lengths of words, as 3-10")
+    parser.add_argument("--words", default=4000, type=int, help="Number of words of each configuration")
+    parser.add_argument("--seed", default=0, type=int, help="Seed of random choice of words")
+    parser.add_argument("--workers", default=os.cpu_count(), type=int, help="Number of worker processes")
+    parser.add_argument("--output", default=os.path.join('Out', 'sweep.csv'), help="Results table")
+    args = parser.parse_args()
+
+    sweep_configs = [Config(font, fontsize, is_binarize == '1', *parse_lengths(lengths))
+                     for font in args.fonts for fontsize in args.fontsizes
+                     for is_binarize in args.binarize for lengths in args.lengths]
+    print(f'Sweeping {len(sweep_configs)} configurations of {args.words} words with {args.workers} workers')
+    begin_time = time.time()
+    write_table(args.output, run_sweep(sweep_configs, args.words, args.seed, args.workers))
+    print(f'Elapsed {time.time() - begin_time:.1f} s, results are in {args.output}')
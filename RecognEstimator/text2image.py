@@ -2,26 +2,118 @@
 
 # Builtins
 import enum
+import functools
 import os
 import sys
 from io import BytesIO
 import base64
-from typing import Optional
+from typing import Dict, Optional, Tuple
 
 # Dependencies
+import numpy as np
 import PIL
-import PIL.Image, PIL.ImageDraw, PIL.ImageFont
+import PIL.Image, PIL.ImageColor, PIL.ImageDraw, PIL.ImageFont
+
+# Maximal number of (font, size) pairs kept loaded
+FONT_CACHE_SIZE = 32
 
 class WidthFittingAlgo(enum.Enum):
     Text_as_is = 0,
     At_least_one_word = 1,
     Manually = 2
 
+class GlyphCache:
+    """Font together with cached metrics and bitmaps of its glyphs
+
+    Lines made of glyphs with integer advances and without kerning between them are composed from cached glyph bitmaps,
+    blending overlapping glyphs the same way FreeType rendering of PIL does, so that result is pixel-identical to
+    PIL.ImageDraw.text. Other lines are drawn by PIL.
+    """
+
+    def __init__(self, font):
+        self.font = font
+        self._is_composable_font = isinstance(font, PIL.ImageFont.FreeTypeFont) and font.layout_engine == PIL.ImageFont.Layout.BASIC
+        self._glyphs: Dict[str, Tuple[np.ndarray, Tuple[int, int], float]] = {}  # char -> (bitmap, offset, advance)
+        self._is_unkerned: Dict[str, bool] = {}  # pair of chars -> if there is no kerning between them
+
+    def glyph(self, char: str) -> Tuple[np.ndarray, Tuple[int, int], float]:
+        glyph = self._glyphs.get(char)
+        if glyph is None:
+            mask, offset = self.font.getmask2(char, 'L')
+            bitmap = np.frombuffer(bytes(mask), dtype=np.uint8).reshape((mask.size[1], mask.size[0]))
+            glyph = self._glyphs[char] = (bitmap, offset, self.font.getlength(char))
+        return glyph
+
+    def is_composable(self, text: str) -> bool:
+        """If text could be composed from cached glyphs"""
+        if not self._is_composable_font:
+            return False
+        for char in text:
+            if not self.glyph(char)[2].is_integer():
+                return False
+        for pair in zip(text, text[1:]):
+            pair = ''.join(pair)
+            is_unkerned = self._is_unkerned.get(pair)
+            if is_unkerned is None:
+                is_unkerned = self._is_unkerned[pair] = self.font.getlength(pair) == self.glyph(pair[0])[2] + self.glyph(pair[1])[2]
+            if not is_unkerned:
+                return False
+        return True
+
+    def getlength(self, text: str) -> float:
+        """Same as getlength of the font, computed from cached glyph advances when possible"""
+        if self.is_composable(text):
+            return float(sum(self.glyph(char)[2] for char in text))
+        return self.font.getlength(text)
+
+    def draw(self, img: PIL.Image, xy: Tuple[int, int], text: str, color) -> None:
+        """Draw text on image the same way PIL.ImageDraw.text does"""
+        if not self.is_composable(text) or not all(isinstance(i, int) for i in xy):
+            PIL.ImageDraw.Draw(img).text(xy, text, color, font=self.font)
+            return
+
+        positions = []
+        pen = 0
+        for char in text:
+            bitmap, offset, advance = self.glyph(char)
+            if bitmap.size != 0:
+                positions.append((bitmap, xy[0] + pen + offset[0], xy[1] + offset[1]))
+            pen += int(advance)
+        if len(positions) == 0:
+            return
+
+        left = min(x for _, x, _ in positions)
+        top = min(y for _, _, y in positions)
+        right = max(x + bitmap.shape[1] for bitmap, x, _ in positions)
+        bottom = max(y + bitmap.shape[0] for bitmap, _, y in positions)
+        mask = np.zeros((bottom - top, right - left), dtype=np.int32)
+        for bitmap, x, y in positions:
+            target = mask[y - top:y - top + bitmap.shape[0], x - left:x - left + bitmap.shape[1]]
+            # Overlapping glyphs are blended as source over target with rounding of MULDIV255
+            blended = target * (255 - bitmap.astype(np.int32)) + 128
+            target[:] = bitmap + (((blended >> 8) + blended) >> 8)
+
+        if isinstance(color, str):
+            color = PIL.ImageColor.getcolor(color, img.mode)
+        img.paste(color, (left, top), PIL.Image.fromarray(mask.astype(np.uint8)))
+
+
+@functools.lru_cache(maxsize=FONT_CACHE_SIZE)
+def load_font(fontpath: Optional[str], fontsize: int) -> GlyphCache:
+    """Load font (default font if path is None) once per (path, size)"""
+    font = PIL.ImageFont.load_default() if fontpath is None else PIL.ImageFont.truetype(fontpath, fontsize)
+    return GlyphCache(font)
+
+
 def text2image(text, color="#000", bgcolor="#FFF", fontpath=os.path.join("Fonts", "OcrABeckerRus_Lat.otf"), fontsize=20, left_padding=3, right_padding=3,
-               top_padding=2, bottom_padding=2, width_fit_algo: WidthFittingAlgo = WidthFittingAlgo.Text_as_is, width_manual: Optional[int] = None
-               ) -> PIL.Image:
+               top_padding=2, bottom_padding=2, width_fit_algo: WidthFittingAlgo = WidthFittingAlgo.Text_as_is, width_manual: Optional[int] = None,
+               use_cache: bool = True) -> PIL.Image:
 
-    font = PIL.ImageFont.load_default() if fontpath is None else PIL.ImageFont.truetype(fontpath, fontsize)
+    if use_cache:
+        glyphs = load_font(fontpath, fontsize)
+    else:
+        glyphs = load_font.__wrapped__(fontpath, fontsize)
+    font = glyphs.font
 
     if width_fit_algo == WidthFittingAlgo.Text_as_is:
         lines = text.splitlines()
@@ -57,7 +149,7 @@ def text2image(text, color="#000", bgcolor="#FFF", fontpath=os.path.join("Fonts"
             line = u""
             i += 1
         # Try to append current word in line
-        elif font.getlength(line + (' ' if line != u'' else '') + words[i]) <= (width - right_padding - left_padding):
+        elif glyphs.getlength(line + (' ' if line != u'' else '') + words[i]) <= (width - right_padding - left_padding):
             if line == u"":
                 line = words[i]
             else:
@@ -85,7 +177,10 @@ def text2image(text, color="#000", bgcolor="#FFF", fontpath=os.path.join("Fonts"
 
     y = top_padding - font_top_padding
     for line in lines:
-        draw.text((left_padding, y), line, color, font=font)
+        if use_cache:
+            glyphs.draw(img, (left_padding, y), line, color)
+        else:
+            draw.text((left_padding, y), line, color, font=font)
         y += line_height
 
     return img
@@ -98,11 +193,15 @@ def text2png(text: str, path_to_save: str, **args) -> None:
     img.save(path_to_save, format='png')
     return
 
-def image2b64(img: PIL.Image) -> str:
+def image2png(img: PIL.Image) -> bytes:
 
     buffered = BytesIO()
     img.save(buffered, format='png')  # Or jpeg
-    img_bytes = base64.b64encode(buffered.getvalue())
+    return buffered.getvalue()
+
+def image2b64(img: PIL.Image) -> str:
+
+    img_bytes = base64.b64encode(image2png(img))
     img_str = img_bytes.decode('ascii')
     return img_str
 
@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+#  -*- coding: utf-8 -*-
+
+# Builtin imports
+import os
+import random
+import time
+from typing import List
+
+# Local imports
+import text2image
+
+
+def load_words(num_of_words: int) -> List[str]:
+    """Words chosen the same way Estimator chooses them"""
+    with open('Hunspell disctionaries/ru_RU.dic', 'r', encoding='utf-8') as f:
+        all_words = [i for i in f]
+    all_words = [w[0: w.find('/')] for w in all_words[1:]]
+    random.seed(0)
+    return [w.upper() for w in random.choices(population=all_words, k=num_of_words)]
+
+
+def images_per_second(words: List[str], use_cache: bool, **text2image_params) -> float:
+    begin_time = time.time()
+    for word in words:
+        text2image.text2image(word, use_cache=use_cache, **text2image_params)
+    return len(words) / (time.time() - begin_time)
+
+
+if __name__ == '__main__':
+    num_of_words = 1000
+    words = load_words(num_of_words)
+    print('Font\t\t\tUncached, img/s\tCached, img/s')
+    for fontname in ("Consolas.ttf", "TimesNewRomanPsmt.ttf", "OcrABeckerRus_Lat.otf"):
+        params = {'fontpath': os.path.join("Fonts", fontname), 'fontsize': 40}
+        uncached = images_per_second(words, use_cache=False, **params)
+        cached = images_per_second(words, use_cache=True, **params)
+        print(f'{fontname:<24}{uncached:.0f}\t\t{cached:.0f}')
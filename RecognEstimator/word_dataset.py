@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+#  -*- coding: utf-8 -*-
+
+# Builtin imports
+import json
+import os
+from typing import Dict, Iterable, List, Optional
+
+# Dependency imports
+import numpy as np
+import PIL.Image
+
+# Local imports
+import text2image
+
+DATASETS_FOLDER = 'Datasets'
+IMAGES_FILE = 'images.npy'
+LABELS_FILE = 'labels.json'
+
+
+class WordDataset:
+    """Pre-rendered images of words, stored once per word
+
+    Images are kept in a memory-mapped uint8 array of shape (number of words, max height, max width),
+    padded with white, together with width and height of each image
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, LABELS_FILE), 'r', encoding='utf-8') as f:
+            labels = json.load(f)
+        self.words: List[str] = labels['words']
+        self.widths: List[int] = labels['widths']
+        self.heights: List[int] = labels['heights']
+        self.text2image_params: dict = labels['text2image_params']
+        self.images: np.ndarray = np.load(os.path.join(path, IMAGES_FILE), mmap_mode='r')
+        self._index: Dict[str, int] = {word: i for i, word in enumerate(self.words)}
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def __contains__(self, word: str) -> bool:
+        return word in self._index
+
+    def index(self, word: str) -> int:
+        return self._index[word]
+
+    def array(self, i: int) -> np.ndarray:
+        """Grayscale image of i-th word as a view on the memory-mapped store (no copy)"""
+        return self.images[i, :self.heights[i], :self.widths[i]]
+
+    def image(self, i: int) -> PIL.Image:
+        """Grayscale image of i-th word"""
+        return PIL.Image.fromarray(np.ascontiguousarray(self.array(i)))
+
+
+def dataset_path(text2image_params: dict, folder: str = DATASETS_FOLDER) -> str:
+    """Folder of the dataset rendered with given text2image parameters (one per font and size)"""
+    fontpath = text2image_params.get('fontpath')
+    fontname = 'default' if fontpath is None else os.path.splitext(os.path.basename(fontpath))[0]
+    return os.path.join(folder, f"{fontname}_{text2image_params.get('fontsize', 20)}")
+
+
+def build_dataset(words: Iterable[str], text2image_params: dict, path: Optional[str] = None) -> WordDataset:
+    """Render words (each distinct word once) and store them
+
+    :param words: words to render, repeated words are stored once
+    :param text2image_params: parameters of text2image
+    :param path: folder of the dataset, derived from font and size if not supplied
+    :return: the stored dataset
+    """
+    if path is None:
+        path = dataset_path(text2image_params)
+    unique_words = list(dict.fromkeys(words))
+    arrays = [np.asarray(text2image.text2image(word, **text2image_params).convert('L')) for word in unique_words]
+    max_height = max((a.shape[0] for a in arrays), default=0)
+    max_width = max((a.shape[1] for a in arrays), default=0)
+
+    os.makedirs(path, exist_ok=True)
+    images = np.lib.format.open_memmap(os.path.join(path, IMAGES_FILE), mode='w+', dtype=np.uint8,
+                                       shape=(len(arrays), max_height, max_width))
+    images[:] = 255
+    for i, a in enumerate(arrays):
+        images[i, :a.shape[0], :a.shape[1]] = a
+    images.flush()
+    del images
+
+    with open(os.path.join(path, LABELS_FILE), 'w', encoding='utf-8') as f:
+        json.dump({'words': unique_words,
+                   'widths': [a.shape[1] for a in arrays],
+                   'heights': [a.shape[0] for a in arrays],
+                   'text2image_params': text2image_params}, f, ensure_ascii=False)
+    return WordDataset(path)
+
+
+def load_dataset(words: Iterable[str], text2image_params: dict, path: Optional[str] = None) -> WordDataset:
+    """Open stored dataset, (re)building it if it misses some of the words or was rendered with other parameters"""
+    if path is None:
+        path = dataset_path(text2image_params)
+    words = list(words)
+    if os.path.exists(os.path.join(path, LABELS_FILE)):
+        dataset = WordDataset(path)
+        if dataset.text2image_params == text2image_params:
+            if all(word in dataset for word in words):
+                return dataset
+            words = dataset.words + words
+        del dataset
+    print(f'Rendering dataset {path}')
+    return build_dataset(words, text2image_params, path)
+
+
+if __name__ == '__main__':
+    # Render words used by Estimator
+    import random
+
+    num_of_words = 4000
+    text2image_params = {'fontpath': os.path.join("Fonts", "Consolas.ttf"), 'fontsize': 40}
+
+    with open('Hunspell disctionaries/ru_RU.dic', 'r', encoding='utf-8') as f:
+        all_words = [i for i in f]
+    all_words = [w[0: w.find('/')] for w in all_words[1:]]
+    random.seed(0)
+    random_words = [w.upper() for w in random.choices(population=all_words, k=num_of_words)]
+
+    dataset = build_dataset(random_words, text2image_params)
+    print(f'Stored {len(dataset)} images of shape {dataset.images.shape[1:]} in {dataset.path}')